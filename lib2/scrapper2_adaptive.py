@@ -0,0 +1,151 @@
+#----------Import-Modules-START-----------------------------
+import threading
+import time
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+# Responses telling that the server is overloaded or throttling
+_http_too_many_requests = 429
+_http_server_error = 500
+#----------Global-Variables-END-----------------------------
+
+
+#----------ConcurrencyController-Class-Definition-START-----
+class ConcurrencyController:
+    '''
+    AIMD controller of the number of active workers, between min_workers and
+    max_workers. Workers report each job with record(), and adjust() is
+    called periodically to set the limit from the jobs of the last period:
+
+    - more than max_error_rate of the jobs failed with 429, 5xx or an
+      exception, or their mean latency exceeds latency_factor times the
+      lowest one seen: the limit is halved;
+    - the last increase did not raise throughput: it is undone;
+    - otherwise, if jobs are pending, the limit grows by one, or doubles
+      until the first decrease (slow start).
+
+    Worker i may take jobs while i < limit().
+
+    >>> controller = ConcurrencyController(2, 16)
+    >>> for _ in range(10): controller.record(200, 0.1)
+    >>> controller.adjust(pending=100, now=controller.started() + 1)
+    (4, 'slow start at 10.0 jobs/s')
+    >>> for _ in range(10): controller.record(503, 0.1)
+    >>> controller.adjust(pending=100, now=controller.started() + 2)
+    (2, 'error rate 100%')
+    >>> controller.is_active(1), controller.is_active(2)
+    (True, False)
+    '''
+
+    def __init__(self, min_workers, max_workers, max_error_rate=0.05, latency_factor=3.0):
+        if not isinstance(min_workers, int) or min_workers < 1 or not isinstance(max_workers, int) or \
+           max_workers < min_workers:
+            raise ValueError("need 1 <= min_workers <= max_workers")
+
+        self.__min = min_workers
+        self.__max = max_workers
+        self.__max_error_rate = max_error_rate
+        self.__latency_factor = latency_factor
+
+        self.__limit = min_workers
+        self.__prev_limit = min_workers
+        self.__slow_start = True
+        self.__throughput = None
+        self.__base_latency = None
+
+        # Jobs, failed jobs and total latency since the last adjust()
+        self.__jobs = 0
+        self.__errors = 0
+        self.__latency = 0.0
+        self.__started = self.__last = time.perf_counter()
+
+        self.__cv = threading.Condition()
+
+    def started(self):
+        return self.__started
+
+    def record(self, status, latency):
+        '''
+        Account for a job that got a response with status, or None if it raised.
+        '''
+        with self.__cv:
+            self.__jobs += 1
+            self.__latency += latency
+            if status is None or status == _http_too_many_requests or status >= _http_server_error:
+                self.__errors += 1
+
+    def __decide(self, pending, throughput, error_rate, latency):
+        if error_rate > self.__max_error_rate:
+            self.__slow_start = False
+            return max(self.__min, self.__limit // 2), "error rate " + format(error_rate * 100, ".0f") + "%"
+        if latency > self.__latency_factor * self.__base_latency:
+            self.__slow_start = False
+            return max(self.__min, self.__limit // 2), "latency " + format(latency * 1000, ".0f") + " ms, was " + \
+                   format(self.__base_latency * 1000, ".0f") + " ms"
+        if self.__limit > self.__prev_limit and self.__throughput is not None and throughput <= self.__throughput:
+            self.__slow_start = False
+            return self.__prev_limit, "no gain from " + str(self.__limit) + " workers at " + format(throughput, ".1f") + " jobs/s"
+        if pending == 0:
+            return self.__limit, "no pending jobs"
+        if self.__slow_start:
+            return min(self.__max, self.__limit * 2), "slow start at " + format(throughput, ".1f") + " jobs/s"
+        return min(self.__max, self.__limit + 1), "probing at " + format(throughput, ".1f") + " jobs/s"
+
+    def adjust(self, pending, now=None):
+        '''
+        Set the limit from the jobs recorded since the last call, pending
+        being the number of jobs waiting. Returns (limit, reason), or None
+        if no job finished meanwhile.
+        '''
+        now = time.perf_counter() if now is None else now
+        with self.__cv:
+            if self.__jobs == 0 or now <= self.__last:
+                return None
+
+            throughput = self.__jobs / (now - self.__last)
+            error_rate = self.__errors / self.__jobs
+            latency = self.__latency / self.__jobs
+            self.__jobs, self.__errors, self.__latency = 0, 0, 0.0
+            self.__last = now
+
+            # The baseline slowly follows latency up, so that a lucky period does not pin it
+            if self.__base_latency is None:
+                self.__base_latency = latency
+            self.__base_latency = min(latency, self.__base_latency * 1.05)
+
+            limit, reason = self.__decide(pending, throughput, error_rate, latency)
+            if limit != self.__limit:
+                self.__prev_limit = self.__limit
+            self.__throughput = throughput
+            self.__limit = limit
+            self.__cv.notify_all()
+            return limit, reason
+
+    def limit(self):
+        with self.__cv:
+            return self.__limit
+
+    def is_active(self, i):
+        with self.__cv:
+            return i < self.__limit
+
+    def wait_active(self, i, timeout=None):
+        '''
+        Wait until worker i may take jobs, returns False on timeout.
+        '''
+        with self.__cv:
+            return self.__cv.wait_for(lambda: i < self.__limit, timeout)
+#----------ConcurrencyController-Class-Definition-END-------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
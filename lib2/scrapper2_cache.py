@@ -0,0 +1,151 @@
+#----------Import-Modules-START-----------------------------
+import hashlib
+import os
+import sqlite3
+import threading
+import urllib.parse
+#----------Import-Modules-END-------------------------------
+
+
+#----------Utility-functions-START--------------------------
+def cache_key(url):
+    '''
+    >>> cache_key("HTTP://Rand.com/Random?a=1#top")
+    'http://rand.com/Random?a=1'
+    '''
+    info = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit((info.scheme.lower(), info.netloc.lower(), info.path, info.query, ''))
+#----------Utility-functions-END----------------------------
+
+
+#----------CachedResponse-Class-Definition-START------------
+class CachedResponse:
+    '''
+    Replay of a cached page, exposing the parts of requests.Response that
+    the callbacks rely on.
+    '''
+
+    def __init__(self, url, headers, encoding, content):
+        self.status_code = 200
+        self.url = url
+        self.headers = headers
+        self.encoding = encoding
+        self.content = content
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+#----------CachedResponse-Class-Definition-END--------------
+
+
+#----------ValidatorCache-Class-Definition-START------------
+class ValidatorCache:
+    '''
+    On-disk cache of HTTP validators (ETag, Last-Modified) and page bodies,
+    keyed by cache_key(url). Thread-safe.
+
+    >>> import tempfile
+    >>> cache = ValidatorCache(tempfile.mkdtemp())
+    >>> cache.store("http://rand.com/a.html", "http://rand.com/a.html", '"v1"', None, "utf-8", b"<html></html>")
+    >>> cache.conditional_headers("http://rand.com/a.html#top")
+    {'If-None-Match': '"v1"'}
+    >>> cache.replay("http://rand.com/a.html").text
+    '<html></html>'
+    >>> cache.conditional_headers("http://rand.com/b.html")
+    {}
+    '''
+
+    def __init__(self, dirname):
+        self.__dirname = dirname
+        self.__bodies = os.path.join(dirname, "bodies")
+        os.makedirs(self.__bodies, exist_ok=True)
+
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(os.path.join(dirname, "validators.db"), check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS validators (url TEXT PRIMARY KEY, final_url TEXT, etag TEXT, "
+                          "last_modified TEXT, encoding TEXT)")
+        self.__db.commit()
+
+    def __body_filename(self, key):
+        return os.path.join(self.__bodies, hashlib.sha1(key.encode("utf-8", "surrogatepass")).hexdigest())
+
+    def __lookup(self, key):
+        with self.__lock:
+            return self.__db.execute("SELECT final_url, etag, last_modified, encoding FROM validators WHERE url = ?",
+                                     (key,)).fetchone()
+
+    def conditional_headers(self, url):
+        '''
+        Headers making a request for url conditional, empty if url is not cached.
+        '''
+        row = self.__lookup(cache_key(url))
+        headers = {}
+        if row is not None:
+            if row[1] is not None:
+                headers["If-None-Match"] = row[1]
+            if row[2] is not None:
+                headers["If-Modified-Since"] = row[2]
+        return headers
+
+    def replay(self, url):
+        '''
+        The cached page of url as a CachedResponse, None if it is gone.
+        '''
+        key = cache_key(url)
+        row = self.__lookup(key)
+        if row is None:
+            return None
+        try:
+            with open(self.__body_filename(key), "rb") as hfile:
+                content = hfile.read()
+        except OSError:
+            return None
+        # The encoding found when the page was stored is replayed as its declared charset
+        headers = {"Content-Type": "text/html; charset=" + row[3]} if row[3] is not None else {}
+        return CachedResponse(row[0], headers, row[3], content)
+
+    def store(self, url, final_url, etag, last_modified, encoding, content):
+        '''
+        Remember a page, pages without validators are not worth caching.
+        '''
+        if etag is None and last_modified is None:
+            return
+
+        key = cache_key(url)
+        body_filename = self.__body_filename(key)
+        tmp_filename = body_filename + "." + str(threading.get_ident()) + ".tmp"
+        with open(tmp_filename, "wb") as hfile:
+            hfile.write(content)
+        os.replace(tmp_filename, body_filename)
+
+        with self.__lock:
+            self.__db.execute("INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?)",
+                              (key, final_url, etag, last_modified, encoding))
+            self.__db.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+#----------ValidatorCache-Class-Definition-END--------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
@@ -0,0 +1,185 @@
+#----------Import-Modules-START-----------------------------
+import functools
+import urllib.parse
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_default_ports = {"http": ":80", "https": ":443"}
+_crawlable_schemes = ("http", "https")
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def remove_dot_segments(path):
+    '''
+    >>> remove_dot_segments("/a/b/../c/./d")
+    '/a/c/d'
+    >>> remove_dot_segments("/a/b/..")
+    '/a/'
+    >>> remove_dot_segments("/../a//b/")
+    '/a//b/'
+    '''
+    if "/." not in path:
+        return path
+
+    segments = []
+    parts = path.split('/')
+    for part in parts[1:-1]:
+        if part == "..":
+            if len(segments) > 0:
+                segments.pop()
+        elif part != ".":
+            segments.append(part)
+
+    last = parts[-1]
+    if last == "..":
+        if len(segments) > 0:
+            segments.pop()
+        last = ''
+    elif last == ".":
+        last = ''
+    segments.append(last)
+    return '/' + '/'.join(segments)
+#----------Utility-functions-END----------------------------
+
+
+#----------UrlCanonicalizer-Class-Definition-START----------
+class UrlCanonicalizer:
+    '''
+    Resolves links against the URL of their page and normalizes them, so
+    that spellings of the same URL are visited once: scheme and host are
+    lower cased, default ports, dot segments and fragments are removed and
+    query parameters are sorted. Each rule can be turned off. Links to
+    other schemes than http and https, and links to the page itself, give
+    None.
+
+    resolver(base_url) parses the page URL once, and resolved links are
+    kept in an LRU cache of cache_size entries, so that links repeated on
+    every page, eg: navigation, are only resolved once. Thread-safe.
+
+    >>> resolve = UrlCanonicalizer().resolver("HTTP://Rand.com:80/a/b.html")
+    >>> resolve("../c/./d.html?y=2&x=1#top")
+    'http://rand.com/c/d.html?x=1&y=2'
+    >>> resolve("//Rand.com:443/e.html"), resolve("HTTPS://rand.com:443/e.html")
+    ('http://rand.com:443/e.html', 'https://rand.com/e.html')
+    >>> resolve("#top") is None, resolve("mailto:me@rand.com") is None
+    (True, True)
+    >>> UrlCanonicalizer(sort_query=False, drop_fragment=False).canonicalize("http://rand.com?b=1&a=2#x")
+    'http://rand.com/?b=1&a=2#x'
+    >>> import pickle; pickle.loads(pickle.dumps(UrlCanonicalizer(sort_query=False))).canonicalize("http://rand.com?b=1&a=2")
+    'http://rand.com/?b=1&a=2'
+    '''
+
+    def __init__(self, lower_host=True, drop_default_port=True, drop_fragment=True, sort_query=True,
+                 cache_size=4096):
+        self.__lower_host = lower_host
+        self.__drop_default_port = drop_default_port
+        self.__drop_fragment = drop_fragment
+        self.__sort_query = sort_query
+        self.__cache_size = cache_size
+        self.__cached_resolve = functools.lru_cache(maxsize=cache_size)(self.__resolve)
+
+    def __getstate__(self):
+        # Pickled for the parse worker processes, which start with an empty cache
+        state = self.__dict__.copy()
+        del state["_UrlCanonicalizer__cached_resolve"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__cached_resolve = functools.lru_cache(maxsize=self.__cache_size)(self.__resolve)
+
+    def __netloc(self, scheme, netloc):
+        if self.__lower_host:
+            # User info is case sensitive
+            user, at, host = netloc.rpartition('@')
+            netloc = user + at + host.lower()
+        if self.__drop_default_port:
+            port = _default_ports.get(scheme)
+            if port is not None and netloc.endswith(port):
+                netloc = netloc[:-len(port)]
+        return netloc
+
+    def __resolve(self, scheme, netloc, directory, href):
+        '''
+        Resolve href, neither empty nor a bare fragment, against a page of
+        scheme://netloc in directory. Callers pass only what href depends
+        on, so that pages share cache entries.
+        '''
+        info = urllib.parse.urlsplit(href)
+        if info.scheme != '':
+            scheme = info.scheme.lower()
+            if scheme not in _crawlable_schemes:
+                return None
+            netloc = self.__netloc(scheme, info.netloc)
+            path = info.path
+        elif info.netloc != '':
+            netloc = self.__netloc(scheme, info.netloc)
+            path = info.path
+        elif info.path.startswith('/'):
+            path = info.path
+        else:
+            path = directory + info.path
+
+        path = remove_dot_segments(path) if path != '' else '/'
+        query = info.query
+        if self.__sort_query and '&' in query:
+            query = '&'.join(sorted(query.split('&')))
+
+        url = scheme + "://" + netloc + path
+        if query != '':
+            url += '?' + query
+        if info.fragment != '' and not self.__drop_fragment:
+            url += '#' + info.fragment
+        return url
+
+    def resolver(self, base_url):
+        '''
+        Function resolving the links of the page at base_url.
+        '''
+        base = urllib.parse.urlsplit(base_url)
+        scheme = base.scheme.lower()
+        netloc = self.__netloc(scheme, base.netloc)
+        base_path = remove_dot_segments(base.path) if base.path != '' else '/'
+        directory = base_path[:base_path.rfind('/') + 1]
+        cached_resolve = self.__cached_resolve
+
+        def resolve(href):
+            href = href.strip()
+            if href == '' or href[0] == '#':
+                return None
+            if href[0] == '?':
+                # Only the query differs from the page
+                return cached_resolve(scheme, netloc, '/', base_path + href)
+            if href[0] == '/':
+                return cached_resolve(scheme, netloc, '/', href)
+            return cached_resolve(scheme, netloc, directory, href)
+
+        return resolve
+
+    def canonicalize(self, url):
+        '''
+        Normal form of an absolute URL, None if it is not http or https.
+        '''
+        url = url.strip()
+        scheme = urllib.parse.urlsplit(url).scheme.lower()
+        if scheme not in _crawlable_schemes:
+            return None
+        return self.__cached_resolve(scheme, '', '/', url)
+
+    def cache_info(self):
+        return self.__cached_resolve.cache_info()
+#----------UrlCanonicalizer-Class-Definition-END------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
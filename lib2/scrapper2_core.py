@@ -1,27 +1,99 @@
 #----------Import-Modules-START-----------------------------
 from lib2.scrapper2_utils import *
+from lib2.scrapper2_visited import VisitedStore, BloomVisitedStore, load_visited_store
+from lib2.scrapper2_frontier import DequeFrontier, HeapFrontier, SQLiteFrontier
+from lib2.scrapper2_hosts import HostScheduler, job_host
+from lib2.scrapper2_cache import ValidatorCache
+from lib2.scrapper2_store import ContentStore
+from lib2.scrapper2_metrics import ScrapperMetrics, TimedResponse, run_timed
+from lib2.scrapper2_log import ScrapperLogger
+from lib2.scrapper2_distributed import Coordinator, ShardRouter, parse_address
+from lib2.scrapper2_adaptive import ConcurrencyController
+from lib2.scrapper2_canon import UrlCanonicalizer
+from lib2.scrapper2_scope import ScopeRules, load_scope_rules
+from lib2.scrapper2_ranges import RangedDownload
+from lib2.scrapper2_memory import MemoryGovernor, BodyTooLarge
+from lib2.scrapper2_retry import DelayedJobs, HostBreakers, backoff_delay, retry_after
+import lib2.scrapper2_metrics as metrics
 import lib2.scrapper2_templates as templates
 
 import requests
 from requests.packages.urllib3.util.retry import Retry as request_retry
 from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.poolmanager import PoolManager
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from requests.packages.urllib3.connection import HTTPConnection, HTTPSConnection
 
 import threading
 import collections
 import time
+import os
 import signal
 import inspect
 import sys
+import asyncio
+import concurrent.futures
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 #----------Import-Modules-END-------------------------------
 
 
 #----------Global-Variables-START---------------------------
-_valid_traversal_modes = ("DFS", "BFS")
+_valid_traversal_modes = ("DFS", "BFS", "PRIORITY")
 _valid_tasks = ("visit", "download", "both")
+_valid_engines = ("thread", "async")
+_valid_metrics_formats = ("jsonl", "prometheus")
+_msg_types = {post_info: "info", post_success: "success", post_failure: "failure", post_warning: "warning",
+              post_error: "error"}
 _http_OK = 200
+_http_not_modified = 304
+_checkpoint_interval = 60
+_pool_hosts = 100
+# Seconds between checks of an async worker left out by the ConcurrencyController
+_inactive_poll_interval = 0.1
+# Seconds between checks of an async worker waiting for a checkpoint to be written
+_checkpoint_poll_interval = 0.05
+# Seed jobs read from a source at a time
+_seed_batch_size = 1000
+# Longest backoff slept in a worker between the retries of a request, longer waits go to the delayed queue
+_max_session_backoff = 1
+# Bytes of a streamed async body read at a time when it is read whole
+_stream_chunk_size = 64 * 1024
 #----------Global-Variables-END-----------------------------
 
 
+#----------Utility-functions-START--------------------------
+def _valid_job(entry):
+    '''
+    >>> _valid_job(("http://rand.com/a.html", "visit", 0)), _valid_job(("rand.com/a.html", "visit", 0))
+    (True, False)
+    >>> _valid_job(("http://rand.com/a.html", "random", 0)), _valid_job("http://rand.com/a.html")
+    (False, False)
+    '''
+    return isinstance(entry, tuple) and len(entry) == 3 and entry[1] in _valid_tasks and valid_root_urls([entry])
+
+def _session_retries(total, backoff_factor):
+    '''
+    Retry policy of the sessions for connection errors. 429 and 503 answers
+    are not retried there, they reach the circuit breakers and the delayed
+    queue of ScrapperJobs with their Retry-After.
+
+    >>> retries = _session_retries(2, 10)
+    >>> retries.total, retries.respect_retry_after_header
+    (2, False)
+    '''
+    try:
+        return request_retry(total=total, backoff_factor=backoff_factor, respect_retry_after_header=False,
+                             backoff_max=_max_session_backoff)
+    except TypeError:
+        # urllib3 1.x has no backoff_max
+        return request_retry(total=total, backoff_factor=backoff_factor, respect_retry_after_header=False)
+#----------Utility-functions-END----------------------------
+
+
 #----------Exception-Definitions-START----------------------
 class ScrapperException(Exception):
     pass
@@ -34,18 +106,14 @@ class Scrapper:
     #--------Scrapper-Class-Utilities-START-----------
     def post(self, msg_func, *args):
         '''
-        Synchronized wrapper for the message printing functions.
+        Queue a message for the message printing function msg_func, it is
+        written to the console and the log file by the logger's thread.
 
         Do not use error_out with this function!
         '''
         assert msg_func != error_out
 
-        self.__post_lock.acquire()
-        if not self.__silent:
-            msg_func(*args, en_colour=self.__colour)
-        if self.__log:
-            msg_func(*args, file=self.__log_file, en_colour=False)
-        self.__post_lock.release()
+        self.__logger.log(_msg_types[msg_func], *args)
 
     def sigint_handler(self, signal, frame):
         self.post(post_warning, "SIGINT received")
@@ -53,7 +121,21 @@ class Scrapper:
     #--------Scrapper-Class-Utilities-END-------------
 
     def __init__(self, root_jobs, preprocess_func=templates.std_preprocess, traversal="DFS", num_threads=1,
-                 silent=False, log=True, colour=True, tenacious=True, additional_header=None, iptc_tags=dict()):
+                 silent=False, log=True, colour=True, tenacious=True, additional_header=None, iptc_tags=dict(),
+                 engine="thread", parse_processes=0, frontier_dir=None, resume=False,
+                 host_concurrency=None, host_rate=None, priority_func=templates.std_priority, max_depth=None,
+                 max_pages_per_host=None, http_cache_dir=None, metrics_file=None, metrics_format="jsonl",
+                 metrics_interval=10, progress=False, log_level="info", log_format="text", log_queue_size=10000,
+                 log_overflow="block", router=None, min_threads=None, adapt_interval=2, keep_alive=False,
+                 seed_buffer=10000, memory_budget=None, max_page_size=None, max_download_size=None,
+                 spill_size=8 * 1024 * 1024, retry_backoff=1, retry_max_delay=60, max_retries=None,
+                 breaker_threshold=5, breaker_cooldown=10):
+
+        seed_source = None
+        if not isinstance(root_jobs, (list, tuple, str)) and hasattr(root_jobs, "__iter__"):
+            # eg: a generator reading a file, fed to the frontier once the crawl starts
+            seed_source = root_jobs
+            root_jobs = []
 
         if not isinstance(root_jobs, list) or \
            any(not (isinstance(entry, tuple) and len(entry) == 3) for entry in root_jobs) or \
@@ -63,64 +145,255 @@ class Scrapper:
         if isinstance(traversal, str):
             if traversal not in _valid_traversal_modes:
                 error_out("Invalid traversal mode")
-            self.__scrapper_jobs = ScrapperJobs(root_jobs, traversal)
-            post_info("Job list created")
         else:
             error_out("Traversal mode must be a string")
 
+        frontier = None
+        if traversal == "PRIORITY":
+            if frontier_dir is not None:
+                error_out("PRIORITY traversal keeps its frontier in memory and cannot use a frontier directory")
+            frontier = HeapFrontier(priority_func)
+        elif frontier_dir is not None:
+            try:
+                os.makedirs(frontier_dir, exist_ok=True)
+                visited_filename = os.path.join(frontier_dir, "visited.bin")
+                if resume and os.path.isfile(visited_filename):
+                    templates.set_visited_store(load_visited_store(visited_filename))
+                frontier = SQLiteFrontier(os.path.join(frontier_dir, "frontier.db"), traversal, resume=resume)
+            except Exception as e:
+                error_out(str(e) + " while opening frontier " + frontier_dir)
+
+            if resume:
+                # Seeds that were already reached by the interrupted crawl are not started over
+                root_jobs = [job for job in root_jobs if job[0] not in templates.get_visited_store()]
+                post_info("Resuming crawl with " + str(len(frontier)) + " pending jobs")
+        if resume and frontier_dir is None:
+            error_out("Resuming requires a frontier directory")
+        if router is not None and (len(root_jobs) > 0 or seed_source is not None or resume):
+            error_out("A distributed crawl gets its root jobs from the coordinator and cannot be resumed")
+
+        if host_concurrency is not None and (not isinstance(host_concurrency, int) or host_concurrency < 1):
+            raise ScrapperException("host_concurrency must be a positive integer")
+        if host_rate is not None and host_rate <= 0:
+            raise ScrapperException("host_rate must be positive")
+
+        self.__frontier_dir = frontier_dir
+        if max_depth is not None and (not isinstance(max_depth, int) or max_depth < 0):
+            raise ScrapperException("max_depth must be a non-negative integer")
+        if max_pages_per_host is not None and (not isinstance(max_pages_per_host, int) or max_pages_per_host < 1):
+            raise ScrapperException("max_pages_per_host must be a positive integer")
+        if retry_backoff <= 0 or retry_max_delay < retry_backoff:
+            raise ScrapperException("retry_backoff must be positive and no greater than retry_max_delay")
+        if max_retries is not None and (not isinstance(max_retries, int) or max_retries < 0):
+            raise ScrapperException("max_retries must be a non-negative integer")
+        if breaker_threshold is not None and (not isinstance(breaker_threshold, int) or breaker_threshold < 1):
+            raise ScrapperException("breaker_threshold must be a positive integer")
+        if breaker_cooldown <= 0:
+            raise ScrapperException("breaker_cooldown must be positive")
+
+        self.__scrapper_jobs = ScrapperJobs(root_jobs, traversal, frontier, host_concurrency, host_rate,
+                                            max_depth, max_pages_per_host, router, keep_alive,
+                                            sources=1 if seed_source is not None else 0,
+                                            retry_backoff=retry_backoff, retry_max_delay=retry_max_delay,
+                                            max_retries=max_retries, breaker_threshold=breaker_threshold,
+                                            breaker_cooldown=breaker_cooldown)
+
+        self.__http_cache = None
+        if http_cache_dir is not None:
+            try:
+                self.__http_cache = ValidatorCache(http_cache_dir)
+            except Exception as e:
+                error_out(str(e) + " while opening HTTP cache " + http_cache_dir)
+        post_info("Job list created")
+
         preprocess_func(root_jobs)
+        self.__preprocess_func = preprocess_func
+        self.__router = router
+
+        if not isinstance(seed_buffer, int) or seed_buffer < 1:
+            raise ScrapperException("seed_buffer must be a positive integer")
+        self.__seed_source = seed_source
+        self.__seed_buffer = seed_buffer
 
         if num_threads < 1 or not isinstance(num_threads, int):
             raise ScrapperException("num_threads must be a positive integer")
+        if min_threads is not None and (not isinstance(min_threads, int) or not 1 <= min_threads <= num_threads):
+            raise ScrapperException("min_threads must be a positive integer no greater than num_threads")
+        if adapt_interval <= 0:
+            raise ScrapperException("adapt_interval must be positive")
+
+        if metrics_format not in _valid_metrics_formats:
+            error_out("Invalid metrics format")
+        if metrics_interval <= 0:
+            raise ScrapperException("metrics_interval must be positive")
+
+        if engine not in _valid_engines:
+            error_out("Invalid engine")
+        if engine == "async" and aiohttp is None:
+            error_out("The async engine requires aiohttp")
+
+        if parse_processes < 0 or not isinstance(parse_processes, int):
+            raise ScrapperException("parse_processes must be a non-negative integer")
+
+        if not isinstance(spill_size, int) or spill_size < 1:
+            raise ScrapperException("spill_size must be a positive integer")
+        if memory_budget is not None and (not isinstance(memory_budget, int) or memory_budget < 1):
+            raise ScrapperException("memory_budget must be a positive integer")
+        self.__governor = None
+        if memory_budget is not None or max_page_size is not None or max_download_size is not None:
+            try:
+                self.__governor = MemoryGovernor(memory_budget, max_page_size, max_download_size, spill_size)
+            except ValueError as e:
+                raise ScrapperException(str(e))
 
         self.__num_threads = num_threads
+        self.__engine = engine
+        self.__additional_header = additional_header
+        self.__parse_processes = parse_processes
+        self.__parse_pool = None
         self.__silent = silent
         self.__log = log
         self.__colour = colour
         self.__tenacious = tenacious
 
         self.__visit_func = templates.std_visit
+        self.__parse_func = templates.std_parse
         self.__download_func = templates.std_download
         self.__modify_header_func = templates.std_modify_header
+        self.__skip_func = templates.std_skip
         self.__report_header_func = templates.std_report_header
         self.__nok_func = templates.std_nok
         self.__iptc_tags = iptc_tags
-        self.__retries = request_retry(total=2, backoff_factor=0.1)
+        self.__retries = _session_retries(2, 0.1)
         self.__timeout = 7
+        self.__connection_pool = None
+        self.__metrics = ScrapperMetrics(gauges=self.__metrics_gauges)
+        self.__metrics_file = metrics_file
+        self.__metrics_format = metrics_format
+        self.__metrics_interval = metrics_interval
+        self.__progress = progress
+        # With min_threads, num_threads workers are spawned but only the first controller.limit() take jobs
+        self.__controller = ConcurrencyController(min_threads, num_threads) if min_threads is not None else None
+        self.__adapt_interval = adapt_interval
 
         self.__gen_lock = threading.Lock()
-        self.__post_lock = threading.Lock()
+        self.__log_file = None
         if self.__log:
             try:
-                self.__log_file = open("scrapper2_" + time.strftime("%Y%m%d_%H%M%S") + ".log", "w")
+                self.__log_file = open("scrapper2_" + time.strftime("%Y%m%d_%H%M%S") +
+                                       (".jsonl" if log_format == "jsonl" else ".log"), "w")
             except Exception as e:
                 error_out(str(e))
+        try:
+            self.__logger = ScrapperLogger(console=not self.__silent, colour=self.__colour, log_file=self.__log_file,
+                                           level=log_level, format=log_format, queue_size=log_queue_size,
+                                           overflow=log_overflow)
+        except ValueError as e:
+            error_out(str(e))
 
         self.__threads_started = False
+        self.__finished = False
+        self.__state_cv = threading.Condition()
+        self.__supervisor = None
         self.__signal_exit = False
         self.__thread_pool = []
+        if self.__engine == "async":
+            # Workers are coroutines on a single event loop, spawned in start()
+            post_info("Using async engine with " + str(self.__num_threads) + " concurrent workers")
+            if self.__controller is not None:
+                post_info("Adapting the number of active workers from " + str(min_threads))
+            return
+
         try:
             for i in range(self.__num_threads):
                 self.__thread_pool.append(threading.Thread(target=self.scrape, args=(i, additional_header)))
                 post_info("Spawning thread " + str(i))
         except Exception as e:
             error_out(str(e))
+        if self.__controller is not None:
+            post_info("Adapting the number of active threads from " + str(min_threads))
 
     def start(self):
-        for t in self.__thread_pool:
-            t.start()
-
-        self.__threads_started = True
-
-        signal.signal(signal.SIGINT, self.sigint_handler)
-        while not self.exit_posted() and not self.__scrapper_jobs.is_done:
-            try:
-                time.sleep(1)
-            except InterruptedError:
-                pass
-
-        for t in self.__thread_pool:
-            t.join()
+        '''
+        Start the workers and return. The crawl ends once no job is left,
+        or with keep_alive once drain() or stop() is called, and then the
+        Scrapper shuts down. See wait().
+        '''
+        with self.__state_cv:
+            if self.__threads_started:
+                raise ScrapperException("A Scrapper can only be started once")
+            self.__threads_started = True
+
+        if self.__parse_processes > 0:
+            # Workers started with spawn or forkserver do not inherit the settings of std_parse
+            self.__parse_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.__parse_processes,
+                                                                       initializer=templates.set_std_parse_settings,
+                                                                       initargs=(templates.get_std_parse_settings(),))
+            post_info("Parsing pages in " + str(self.__parse_processes) + " worker processes")
+
+        # Built here so that set_retries_and_timeout applies, kept open across sessions
+        self.__connection_pool = ScrapperConnectionPool(self.__num_threads, self.__retries)
+
+        # Signal handlers can only be set from the main thread, eg: not when embedded in a service
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.sigint_handler)
+
+        if self.__seed_source is not None:
+            # Held open since the constructor
+            self.__start_feeder(self.__seed_source)
+            self.__seed_source = None
+
+        if self.__engine == "thread":
+            for t in self.__thread_pool:
+                t.start()
+        self.__supervisor = threading.Thread(target=self.__supervise, name="scrapper2-supervisor")
+        self.__supervisor.start()
+
+    def __supervise(self):
+        try:
+            if self.__engine == "async":
+                asyncio.run(self.scrape_async_main())
+            else:
+                last_checkpoint = last_report = last_adapt = time.time()
+                while not self.exit_posted() and not self.__scrapper_jobs.is_done():
+                    next_task = min(last_checkpoint + _checkpoint_interval, last_report + self.__metrics_interval)
+                    if self.__controller is not None:
+                        next_task = min(next_task, last_adapt + self.__adapt_interval)
+                    self.__scrapper_jobs.wait(timeout=max(0, next_task - time.time()))
+
+                    if time.time() - last_checkpoint >= _checkpoint_interval:
+                        self.checkpoint()
+                        last_checkpoint = time.time()
+                    if time.time() - last_report >= self.__metrics_interval:
+                        self.__report_metrics()
+                        last_report = time.time()
+                    if self.__controller is not None and time.time() - last_adapt >= self.__adapt_interval:
+                        self.__adapt()
+                        last_adapt = time.time()
+
+                for t in self.__thread_pool:
+                    t.join()
+
+            self.__shut_down()
+        finally:
+            with self.__state_cv:
+                self.__finished = True
+                self.__state_cv.notify_all()
+
+    def __shut_down(self):
+        if self.__parse_pool is not None:
+            self.__parse_pool.shutdown()
+            self.__parse_pool = None
+
+        # Downloads are only complete once their metadata is written
+        for filename, err_msg in templates.flush_std_iptc():
+            self.post(post_warning, "failed to write IPTC metadata to " + filename + ": " + err_msg)
+
+        self.checkpoint()
+        self.__report_metrics()
+
+        # Keep the summary below the crawl's messages
+        self.__logger.flush()
 
         remaining_jobs = self.__scrapper_jobs.curr_jobs()
         if len(remaining_jobs) > 0:
@@ -128,38 +401,297 @@ class Scrapper:
             for job in remaining_jobs:
                 post_warning("      " + str(job[0]) + " - " + str(job[1]))
 
+        self.__scrapper_jobs.close()
+        if self.__http_cache is not None:
+            self.__http_cache.close()
+
+        stats = self.__connection_pool.stats()
+        post_info("Connection pool: " + str(stats["hits"]) + " hits, " + str(stats["misses"]) + " misses")
+        self.__connection_pool.close()
+
+        self.__logger.close()
+        if self.__log_file is not None:
+            self.__log_file.close()
+            self.__log_file = None
+
+    def wait(self, timeout=None):
+        '''
+        Wait until the crawl is over and the Scrapper has shut down, or with
+        keep_alive until no job is pending or in flight. Returns False on
+        timeout.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self.__scrapper_jobs.wait(timeout, idle=True):
+            return False
+        if not self.__scrapper_jobs.is_done() and not self.exit_posted():
+            return True
+
+        with self.__state_cv:
+            return self.__state_cv.wait_for(lambda: self.__finished or not self.__threads_started,
+                                            None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def pause(self):
+        '''
+        Stop starting jobs, the ones in flight are completed.
+        '''
+        self.__scrapper_jobs.pause()
+        self.post(post_info, "Crawl paused")
+
+    def resume(self):
+        self.__scrapper_jobs.resume()
+        self.post(post_info, "Crawl resumed")
+
+    def drain(self, timeout=None):
+        '''
+        Complete the pending jobs, then shut down. Job sources are not read
+        any further. Returns False on timeout.
+        '''
+        self.__scrapper_jobs.drain()
+        return self.wait(timeout)
+
+    def stop(self, timeout=None):
+        '''
+        Complete the jobs in flight, then shut down. Pending jobs are only
+        kept in the frontier directory, if any. Returns False on timeout.
+        '''
+        self.signal_exit()
+        return self.wait(timeout)
+
+    def add_jobs(self, jobs):
+        '''
+        Add root jobs, before or during the crawl. Jobs whose link was already
+        visited are left out. Returns the number of jobs added.
+        '''
+        if not isinstance(jobs, list) or any(not _valid_job(entry) for entry in jobs):
+            raise ScrapperException("Invalid jobs")
+
+        visited_store = templates.get_visited_store()
+        jobs = [job for job in jobs if job[0] not in visited_store]
+        self.__scrapper_jobs.hold_checkpoint()
+        try:
+            self.__preprocess_func(jobs)
+            added = self.__scrapper_jobs.add_job(jobs)
+        finally:
+            self.__scrapper_jobs.release_checkpoint()
+        if not added:
+            raise ScrapperException("The crawl is over")
+        self.post(post_info, "Added " + str(len(jobs)) + " jobs")
+        return len(jobs)
+
+    def add_job_source(self, source):
+        '''
+        Add the root jobs of source, any iterable of (url, task, id) tuples,
+        eg: a generator reading a file. It is read on a background thread
+        while fewer than seed_buffer jobs are pending, so that memory stays
+        flat however many jobs it yields. Invalid jobs are skipped with a
+        warning, and the crawl does not end before source is exhausted.
+        '''
+        if self.__router is not None:
+            raise ScrapperException("A distributed crawl gets its root jobs from the coordinator")
+        if not self.__scrapper_jobs.hold():
+            raise ScrapperException("The crawl is over")
+        self.__start_feeder(iter(source))
+
+    def __start_feeder(self, source):
+        threading.Thread(target=self.__feed, args=(source,), name="scrapper2-seeds", daemon=True).start()
+
+    def __feed(self, source):
+        visited_store = templates.get_visited_store()
+        added, batch = 0, []
+        try:
+            for job in source:
+                if not _valid_job(job):
+                    self.post(post_warning, "Invalid root job skipped: " + str(job))
+                elif job[0] not in visited_store:
+                    batch.append(job)
+
+                if len(batch) >= min(_seed_batch_size, max(1, self.__seed_buffer // 2)):
+                    if not self.__feed_batch(batch):
+                        break
+                    added += len(batch)
+                    batch = []
+            else:
+                if len(batch) > 0 and self.__feed_batch(batch):
+                    added += len(batch)
+        except Exception as e:
+            self.post(post_error, "Reading root jobs failed: " + str(e))
+        finally:
+            self.__scrapper_jobs.release()
+        self.post(post_info, "Added " + str(added) + " root jobs from a job source")
+
+    def __feed_batch(self, batch):
+        # Backpressure: blocks while seed_buffer jobs are pending
+        if not self.__scrapper_jobs.wait_room(self.__seed_buffer):
+            return False
+        self.__scrapper_jobs.hold_checkpoint()
+        try:
+            self.__preprocess_func(batch)
+            return self.__scrapper_jobs.add_job(batch)
+        finally:
+            self.__scrapper_jobs.release_checkpoint()
+
+    def metrics(self):
+        '''
+        Snapshot of the crawl metrics, see ScrapperMetrics.snapshot.
+        '''
+        return self.__metrics.snapshot()
+
+    def __metrics_gauges(self):
+        gauges = {"frontier": self.__scrapper_jobs.pending(), "in_flight": len(self.__scrapper_jobs.curr_jobs()),
+                  "visited": len(templates.get_visited_store()), "delayed": self.__scrapper_jobs.delayed(),
+                  "open_hosts": self.__scrapper_jobs.open_hosts()}
+        if self.__governor is not None:
+            gauges["body_bytes"] = self.__governor.in_use()
+        if self.__controller is not None:
+            gauges["workers"] = self.__controller.limit()
+        return gauges
+
+    def __retry(self, worker, job, retry_after_value=None):
+        '''
+        Put job back in the delayed queue, or skip it once out of retries.
+        '''
+        url, task, id = job
+        delay = self.__scrapper_jobs.retry_job(job, retry_after_value)
+        if delay is None:
+            self.post(post_warning, "job skipped " + str(id) + " - " + task + " on " + url + " after too many retries")
+            self.__scrapper_jobs.done_job(job)
+        else:
+            self.post(post_info, worker + " will redo " + str(id) + " - " + task + " on " + url + " in " +
+                      format(delay, ".1f") + " s")
+
+    def __release_body(self, r):
+        if self.__governor is not None and r is not None:
+            self.__governor.release(r)
+
+    def __finish_job(self, timer, job, status, success):
+        self.__metrics.finish_job(timer, job_host(job), status, success)
+        if self.__controller is not None:
+            self.__controller.record(status, sum(timer.times().values()) - timer.get("queue_wait"))
+
+    def __adapt(self):
+        old_limit = self.__controller.limit()
+        decision = self.__controller.adjust(self.__scrapper_jobs.pending())
+        if decision is not None and decision[0] != old_limit:
+            self.post(post_info, "Active workers " + str(old_limit) + " -> " + str(decision[0]) + ": " + decision[1])
+
+    def __report_metrics(self):
+        if self.__metrics_file is not None:
+            try:
+                self.__metrics.dump(self.__metrics_file, self.__metrics_format)
+            except Exception as e:
+                self.post(post_error, "Metrics dump failed: " + str(e))
+        if self.__progress:
+            # Shown even when silent, which is when it is most useful
+            self.__logger.log("info", self.__metrics.progress_line(), force_console=True)
+
+    def connection_stats(self):
+        '''
+        Hits and misses of the shared connection pool, None before start().
+        '''
+        if self.__connection_pool is None:
+            return None
+        return self.__connection_pool.stats()
+
+    def checkpoint(self):
+        '''
+        Persist the pending and in-flight jobs and the visited links to the frontier directory.
+
+        Pages being parsed are let finish pushing their links first, so that
+        every link saved as visited is also saved as pending or done.
+        '''
+        if self.__frontier_dir is None:
+            return
+
+        try:
+            filename = os.path.join(self.__frontier_dir, "visited.bin")
+            self.__scrapper_jobs.checkpoint(lambda: templates.get_visited_store().save(filename))
+            self.post(post_info, "Checkpoint written to " + self.__frontier_dir)
+        except Exception as e:
+            self.post(post_error, "Checkpoint failed: " + str(e))
+
     def scrape(self, i, additional_header):
         self.post(post_info, "thread " + str(i) + " starting")
 
-        curr_session = ScrapperSession(additional_header, self.__retries)
+        curr_session = ScrapperSession(additional_header, self.__connection_pool, self.__governor)
         url, task, id = None, None, None
         curr_header = None
+        timer = None
+        r = None
 
         while not self.exit_posted():
             try:
                 if (url, task, id) == (None, None, None):
+                    if self.__controller is not None and not self.__controller.wait_active(i, timeout=1):
+                        if self.__scrapper_jobs.is_done():
+                            break
+                        continue
+
+                    wait_start = time.perf_counter()
                     job = self.__scrapper_jobs.get_job()
                     if job is None:
                         break
 
                     url, task, id = job
+                    timer = self.__metrics.start_job()
+                    timer.add("queue_wait", time.perf_counter() - wait_start)
+
+                if self.__skip_func(url, task, id):
+                    self.post(post_info, "thread " + str(i) + " skipping " + str(id) + " - " + task + " " + url)
+                    self.__scrapper_jobs.done_job((url, task, id))
+                    self.__metrics.skip_job()
+                    url, task, id = None, None, None
+                    timer = None
+                    continue
 
                 self.post(post_info, "thread " + str(i) + " performing " + str(id) + " - " + task + " " + url)
+                if timer is None:
+                    timer = self.__metrics.start_job()
+                metrics.set_current_timer(timer)
 
                 curr_header = curr_session.get_header()
                 self.__modify_header_func(curr_header, url, task, id)
 
-                r = curr_session.get(url, self.__timeout)
+                # Bodies of downloads are streamed by the download callback instead of buffered here,
+                # the memory governor buffers the pages of "both" jobs within its budget
+                streamed = task == "download" if self.__governor is not None else task != "visit"
+                fetch_start = time.perf_counter()
+                with metrics.phase("ttfb"):
+                    r = curr_session.get(url, self.__timeout, stream=streamed,
+                                         cache=self.__http_cache if task != "download" else None)
+                self.__scrapper_jobs.record_status((url, task, id), r.status_code, r.headers.get("Retry-After"))
+                elapsed = getattr(r, "elapsed", None)
+                if not streamed and elapsed is not None:
+                    # requests times the response up to its headers, get() then read the body
+                    timer.move("ttfb", "transfer", time.perf_counter() - fetch_start - elapsed.total_seconds())
+                    if self.__governor is None or r.status_code == _http_OK:
+                        timer.nbytes += len(r.content)
+                    else:
+                        # The governor left the error page unread, it is not downloaded just to be counted
+                        content_length = r.headers.get("Content-Length", "")
+                        timer.nbytes += int(content_length) if content_length.isdigit() else 0
 
                 success = r.status_code == _http_OK
                 if success:
                     if task == "visit" or task == "both":
                         jobs = []
-                        success = success and self.__visit_func(r, url, id, jobs)
-                        if jobs != []:
-                            self.__scrapper_jobs.add_job(jobs)
+                        # The links are marked as visited by the visit callback, a checkpoint waits until they are pushed
+                        self.__scrapper_jobs.hold_checkpoint()
+                        try:
+                            with metrics.phase("parse"):
+                                success = success and self.__visit(r, url, id, jobs)
+                            if jobs != []:
+                                self.__scrapper_jobs.add_job(jobs, parent=(url, task, id))
+                        finally:
+                            self.__scrapper_jobs.release_checkpoint()
                     if task == "download" or task == "both":
-                        success = success and self.__download_func(r, url, id, self.__iptc_tags)
+                        with metrics.phase("write"):
+                            success = success and self.__download_func(TimedResponse(r, timer), url, id, self.__iptc_tags)
+                r.close()
+                self.__release_body(r)
+
+                metrics.set_current_timer(None)
+                self.__finish_job(timer, (url, task, id), r.status_code, success)
+                timer = None
 
                 curr_header = curr_session.get_header()
                 self.__report_header_func(curr_header, success, url, task, id)
@@ -173,9 +705,21 @@ class Scrapper:
                     if not success:
                         self.post(post_warning, "job skipped " + str(id) + " - " + task + " on " + url)
                     self.__scrapper_jobs.done_job((url, task, id))
-                    url, task, id = None, None, None
                 else:
-                    self.post(post_info, "thread " + str(i) + " will redo " + str(id) + " - " + task + " on " + url)
+                    # The thread moves on to other jobs meanwhile
+                    self.__retry("thread " + str(i), (url, task, id), r.headers.get("Retry-After"))
+                url, task, id = None, None, None
+
+            except BodyTooLarge as e:
+                metrics.set_current_timer(None)
+                self.__release_body(r)
+                self.post(post_warning, "job skipped " + str(id) + " - " + task + " on " + url + ": " + str(e))
+                # The host did answer
+                self.__scrapper_jobs.record_status((url, task, id), _http_OK)
+                self.__finish_job(timer, (url, task, id), _http_OK, False)
+                timer = None
+                self.__scrapper_jobs.done_job((url, task, id))
+                url, task, id = None, None, None
 
             except Exception as e:
                 if isinstance(e, AssertionError):
@@ -187,16 +731,256 @@ class Scrapper:
                 job_info = ''
                 if (url, task, id) != (None, None, None):
                     job_info = ' (' + str(id) + " - " + task + " on " + url + ')'
+                    if timer is not None:
+                        metrics.set_current_timer(None)
+                        self.__finish_job(timer, (url, task, id), None, False)
+                        timer = None
+                    if isinstance(e, requests.exceptions.RequestException):
+                        self.__scrapper_jobs.record_status((url, task, id), None)
+                self.__release_body(r)
 
                 self.post(post_error, "thread " + str(i) + " encountered error " + err_msg + job_info)
                 if self.__tenacious:
-                    curr_session = ScrapperSession(curr_header, self.__retries)
+                    curr_session = ScrapperSession(curr_header, self.__connection_pool, self.__governor)
                     self.post(post_warning, "thread " + str(i) + " is creating a new Session")
+                    if (url, task, id) != (None, None, None):
+                        self.__retry("thread " + str(i), (url, task, id))
+                        url, task, id = None, None, None
                 else:
                     self.signal_exit()
 
         self.post(post_info, "thread " + str(i) + " exiting")
 
+    def __visit(self, r, url, id, jobs):
+        '''
+        With a parse pool, the page is handed to the parse callback in a worker
+        process and only the de-duplication happens on the calling thread.
+        '''
+        if self.__parse_pool is None:
+            return self.__visit_func(r, url, id, jobs)
+
+        parsed_jobs = self.__parse_pool.submit(self.__parse_func, bytes(r.content), templates.std_encoding(r), r.url, id).result()
+        jobs.extend(templates.std_unvisited(parsed_jobs))
+        return True
+
+    async def scrape_async_main(self):
+        '''
+        Run the crawl on the current event loop with num_threads worker coroutines.
+
+        All workers share one connection pool. Callbacks keep their blocking
+        contracts and are run on the loop's default executor.
+        '''
+        self.__jobs_cv = asyncio.Condition()
+        connector = aiohttp.TCPConnector(limit=self.__num_threads)
+        checkpoints = asyncio.ensure_future(self.__checkpoint_async())
+        reports = asyncio.ensure_future(self.__report_metrics_async())
+        adapts = asyncio.ensure_future(self.__adapt_async()) if self.__controller is not None else None
+
+        loop = asyncio.get_running_loop()
+        def wake_workers():
+            # Called from the thread of a ShardRouter
+            try:
+                loop.call_soon_threadsafe(asyncio.ensure_future, self.__notify_jobs_async())
+            except RuntimeError:
+                # The loop is closed, the crawl is over
+                pass
+        self.__scrapper_jobs.set_listener(wake_workers)
+
+        try:
+            await asyncio.gather(*(self.scrape_async(i, connector) for i in range(self.__num_threads)))
+        finally:
+            self.__scrapper_jobs.set_listener(None)
+            checkpoints.cancel()
+            reports.cancel()
+            if adapts is not None:
+                adapts.cancel()
+            await connector.close()
+
+    async def __checkpoint_async(self):
+        while True:
+            await asyncio.sleep(_checkpoint_interval)
+            # Off the event loop, which runs the workers the checkpoint waits for
+            await asyncio.get_running_loop().run_in_executor(None, self.checkpoint)
+
+    async def __report_metrics_async(self):
+        while True:
+            await asyncio.sleep(self.__metrics_interval)
+            self.__report_metrics()
+
+    async def __adapt_async(self):
+        while True:
+            await asyncio.sleep(self.__adapt_interval)
+            self.__adapt()
+
+    async def scrape_async(self, i, connector):
+        self.post(post_info, "worker " + str(i) + " starting")
+
+        loop = asyncio.get_running_loop()
+        trace_configs = [self.__connection_pool.trace_config()]
+        curr_session = AsyncScrapperSession(self.__additional_header, self.__retries, connector, trace_configs, self.__governor)
+        url, task, id = None, None, None
+        curr_header = None
+        timer = None
+        r = None
+
+        while not self.exit_posted():
+            try:
+                if (url, task, id) == (None, None, None):
+                    if self.__controller is not None and not self.__controller.is_active(i):
+                        if self.__scrapper_jobs.is_done():
+                            break
+                        await asyncio.sleep(_inactive_poll_interval)
+                        continue
+
+                    wait_start = time.perf_counter()
+                    job = await self.__get_job_async()
+                    if job is None:
+                        break
+
+                    url, task, id = job
+                    timer = self.__metrics.start_job()
+                    timer.add("queue_wait", time.perf_counter() - wait_start)
+
+                if self.__skip_func(url, task, id):
+                    self.post(post_info, "worker " + str(i) + " skipping " + str(id) + " - " + task + " " + url)
+                    self.__scrapper_jobs.done_job((url, task, id))
+                    self.__metrics.skip_job()
+                    url, task, id = None, None, None
+                    timer = None
+                    await self.__notify_jobs_async()
+                    continue
+
+                self.post(post_info, "worker " + str(i) + " performing " + str(id) + " - " + task + " " + url)
+                if timer is None:
+                    timer = self.__metrics.start_job()
+
+                curr_header = curr_session.get_header()
+                self.__modify_header_func(curr_header, url, task, id)
+
+                r = await curr_session.get(url, self.__timeout, cache=self.__http_cache if task != "download" else None,
+                                           timer=timer, stream=task == "download")
+                self.__scrapper_jobs.record_status((url, task, id), r.status_code, r.headers.get("Retry-After"))
+
+                # Callbacks run on executor threads, which get the job's timer attached
+                success = r.status_code == _http_OK
+                if success:
+                    if task == "visit" or task == "both":
+                        jobs = []
+                        # Waiting for a checkpoint must not block the event loop
+                        while not self.__scrapper_jobs.hold_checkpoint(block=False):
+                            await asyncio.sleep(_checkpoint_poll_interval)
+                        try:
+                            timer.enter("parse")
+                            try:
+                                if self.__parse_pool is None:
+                                    success = success and await loop.run_in_executor(None, run_timed, timer, self.__visit_func, r, url, id, jobs)
+                                else:
+                                    parsed_jobs = await loop.run_in_executor(self.__parse_pool, self.__parse_func, bytes(r.content), templates.std_encoding(r), r.url, id)
+                                    jobs.extend(templates.std_unvisited(parsed_jobs))
+                            finally:
+                                timer.exit()
+                            if jobs != []:
+                                self.__scrapper_jobs.add_job(jobs, parent=(url, task, id))
+                        finally:
+                            self.__scrapper_jobs.release_checkpoint()
+                        if jobs != []:
+                            await self.__notify_jobs_async()
+                    if task == "download" or task == "both":
+                        timer.enter("write")
+                        try:
+                            success = success and await loop.run_in_executor(None, run_timed, timer, self.__download_func, TimedResponse(r, timer), url, id, self.__iptc_tags)
+                        finally:
+                            timer.exit()
+
+                r.close()
+                self.__release_body(r)
+                self.__finish_job(timer, (url, task, id), r.status_code, success)
+                timer = None
+
+                curr_header = curr_session.get_header()
+                self.__report_header_func(curr_header, success, url, task, id)
+
+                redo = False
+                if not success:
+                    self.post(post_failure, "worker " + str(i) + " failed to perform " + str(id) + " - " + task + " on " + url + ' (' + str(r.status_code) + ')')
+                    redo = self.__nok_func(r.status_code, url, task, id)
+
+                if not redo:
+                    if not success:
+                        self.post(post_warning, "job skipped " + str(id) + " - " + task + " on " + url)
+                    self.__scrapper_jobs.done_job((url, task, id))
+                else:
+                    self.__retry("worker " + str(i), (url, task, id), r.headers.get("Retry-After"))
+                url, task, id = None, None, None
+                await self.__notify_jobs_async()
+
+            except BodyTooLarge as e:
+                if r is not None:
+                    r.close()
+                self.__release_body(r)
+                self.post(post_warning, "job skipped " + str(id) + " - " + task + " on " + url + ": " + str(e))
+                # The host did answer
+                self.__scrapper_jobs.record_status((url, task, id), _http_OK)
+                self.__finish_job(timer, (url, task, id), _http_OK, False)
+                timer = None
+                self.__scrapper_jobs.done_job((url, task, id))
+                url, task, id = None, None, None
+                await self.__notify_jobs_async()
+
+            except Exception as e:
+                if isinstance(e, AssertionError):
+                    _, _, exc_tb = sys.exc_info()
+                    err_msg = "AssertionError at line " + str(exc_tb.tb_lineno)
+                else:
+                    err_msg = str(e) or type(e).__name__
+
+                job_info = ''
+                if (url, task, id) != (None, None, None):
+                    job_info = ' (' + str(id) + " - " + task + " on " + url + ')'
+                    if timer is not None:
+                        self.__finish_job(timer, (url, task, id), None, False)
+                        timer = None
+                    if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                        self.__scrapper_jobs.record_status((url, task, id), None)
+                if r is not None:
+                    r.close()
+                self.__release_body(r)
+
+                self.post(post_error, "worker " + str(i) + " encountered error " + err_msg + job_info)
+                if self.__tenacious:
+                    await curr_session.close()
+                    curr_session = AsyncScrapperSession(curr_header, self.__retries, connector, trace_configs, self.__governor)
+                    self.post(post_warning, "worker " + str(i) + " is creating a new Session")
+                    if (url, task, id) != (None, None, None):
+                        self.__retry("worker " + str(i), (url, task, id))
+                        url, task, id = None, None, None
+                        await self.__notify_jobs_async()
+                else:
+                    self.signal_exit()
+
+        await curr_session.close()
+        await self.__notify_jobs_async()
+        self.post(post_info, "worker " + str(i) + " exiting")
+
+    async def __get_job_async(self):
+        async with self.__jobs_cv:
+            while not self.exit_posted():
+                job = self.__scrapper_jobs.get_job(block=False)
+                if job is not None or self.__scrapper_jobs.is_done():
+                    return job
+                timeout = self.__scrapper_jobs.ready_in()
+                timeout = 1 if timeout is None else min(1, timeout)
+                try:
+                    # Time out so that exit requests from the signal handler are noticed
+                    await asyncio.wait_for(self.__jobs_cv.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return None
+
+    async def __notify_jobs_async(self):
+        async with self.__jobs_cv:
+            self.__jobs_cv.notify_all()
+
     def signal_exit(self):
         self.__gen_lock.acquire()
         self.__signal_exit = True
@@ -211,32 +995,71 @@ class Scrapper:
         return ret
 
     def set_visit_func(self, func):
+        '''
+        With parse_processes > 0 pages are parsed by the parse callback
+        instead, see set_parse_func.
+        '''
         assert not self.__threads_started
-        if len(inspect.getargspec(func)[0]) != 4:
+        if len(inspect.getfullargspec(func)[0]) != 4:
             error_out("Visit callback function is not well formed")
+        if self.__parse_processes > 0:
+            raise ScrapperException("A visit callback is not called with parse_processes > 0, set a parse callback instead")
         self.__visit_func = func
 
+    def set_parse_func(self, func):
+        '''
+        The parse callback replaces the visit callback when parse_processes > 0.
+        It receives (content, encoding, base_url, id) and returns the list of jobs
+        found on the page. It must be picklable, ie: defined at module level.
+        The workers are given the settings of std_parse when the Scrapper starts,
+        other module globals it reads are only inherited with the fork start method.
+        '''
+        assert not self.__threads_started
+        if len(inspect.getfullargspec(func)[0]) != 4:
+            error_out("Parse callback function is not well formed")
+        self.__parse_func = func
+
+    def set_skip_func(self, func):
+        '''
+        The skip callback receives (url, task, id) before any request is made
+        and returns True if the job is already done.
+        '''
+        assert not self.__threads_started
+        if len(inspect.getfullargspec(func)[0]) != 3:
+            error_out("Skip callback function is not well formed")
+        self.__skip_func = func
+
     def set_download_func(self, func):
+        '''
+        Unless a skip callback was set, downloads are only skipped for existing
+        files with std_download, see std_skip.
+        '''
         assert not self.__threads_started
-        if len(inspect.getargspec(func)[0]) != 4:
+        if len(inspect.getfullargspec(func)[0]) != 4:
             error_out("Download callback function is not well formed")
         self.__download_func = func
+        if self.__skip_func in (templates.std_skip, templates.std_no_skip):
+            self.__skip_func = templates.std_skip if func is templates.std_download else templates.std_no_skip
 
     def set_modify_header_func(self, func):
         assert not self.__threads_started
-        if len(inspect.getargspec(func)[0]) != 4:
+        if len(inspect.getfullargspec(func)[0]) != 4:
             error_out("Modify header callback function is not well formed")
         self.__modify_header_func = func
 
     def set_report_header_func(self, func):
         assert not self.__threads_started
-        if len(inspect.getargspec(func)[0]) != 5:
+        if len(inspect.getfullargspec(func)[0]) != 5:
             error_out("Report header callback function is not well formed")
         self.__report_header_func = func
 
     def set_nok_func(self, func):
+        '''
+        The not OK callback receives (status_code, url, task, id) of a failed
+        job and returns True to retry it after a backoff, see retry_backoff.
+        '''
         assert not self.__threads_started
-        if len(inspect.getargspec(func)[0]) != 4:
+        if len(inspect.getfullargspec(func)[0]) != 4:
             error_out("not OK callback function is not well formed")
         self.__nok_func = func
 
@@ -247,22 +1070,162 @@ class Scrapper:
         if not isinstance(timeout, tuple) or len(timeout) != 2:
             error_out("Timeout is not well formed")
 
-        self.__retries = request_retry(total=retry_num, backoff_factor=backoff_factor)
+        self.__retries = _session_retries(retry_num, backoff_factor)
         self.__timeout = timeout
 #----------Scrapper-Class-Definition-END--------------------
 
 
+#----------ScrapperConnectionPool-Class-Definition-START----
+class _TimedHTTPConnection(HTTPConnection):
+
+    def connect(self):
+        with metrics.phase("connect"):
+            super().connect()
+
+class _TimedHTTPSConnection(HTTPSConnection):
+
+    def connect(self):
+        with metrics.phase("connect"):
+            super().connect()
+
+class _CountingPoolMixin:
+    counter = None
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        # Pooled connections that are still open have a socket, fresh or dropped ones do not
+        if self.counter is not None:
+            self.counter.record(conn.sock is not None)
+        return conn
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class _CountingPoolManager(PoolManager):
+
+    def __init__(self, counter, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {"http": _CountingHTTPConnectionPool, "https": _CountingHTTPSConnectionPool}
+        self.__counter = counter
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context)
+        pool.counter = self.__counter
+        return pool
+
+class ScrapperConnectionPool(HTTPAdapter):
+    '''
+    Connection pools shared by every session of a Scrapper, mounted on both
+    http:// and https://. Each of the max_hosts most recently used hosts keeps
+    up to num_threads idle connections alive, so that recreated sessions and
+    later jobs reuse them instead of reconnecting.
+
+    A hit is a request served on a pooled open connection, a miss one that
+    had to connect (TCP and, for https, TLS).
+
+    >>> pool = ScrapperConnectionPool(4, request_retry(total=0))
+    >>> pool.record(True); pool.record(False); pool.record(True)
+    >>> pool.stats()
+    {'hits': 2, 'misses': 1}
+    '''
+
+    def __init__(self, num_threads, retries, max_hosts=_pool_hosts):
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        super().__init__(pool_connections=max_hosts, pool_maxsize=num_threads, max_retries=retries)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _CountingPoolManager(self, num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs)
+
+    def record(self, reused):
+        with self.__lock:
+            if reused:
+                self.__hits += 1
+            else:
+                self.__misses += 1
+
+    def stats(self):
+        with self.__lock:
+            return {"hits": self.__hits, "misses": self.__misses}
+
+    def trace_config(self):
+        '''
+        aiohttp trace hooks feeding the same counters from the async engine.
+        '''
+        async def on_reuse(session, context, params):
+            self.record(True)
+
+        async def on_create_start(session, context, params):
+            context.connect_start = time.perf_counter()
+
+        async def on_create_end(session, context, params):
+            self.record(False)
+            # The request's JobTimer, if any, is passed as trace_request_ctx
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx.add("connect", time.perf_counter() - context.connect_start)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_connection_create_start.append(on_create_start)
+        trace_config.on_connection_create_end.append(on_create_end)
+        return trace_config
+#----------ScrapperConnectionPool-Class-Definition-END------
+
+
 #----------ScrapperSession-Class-Definition-START-----------
 class ScrapperSession:
 
-    def __init__(self, additional_header, retries):
+    def __init__(self, additional_header, connection_pool, governor=None):
+        '''
+        connection_pool is a ScrapperConnectionPool, which outlives the session.
+        With a MemoryGovernor, bodies are read within its limits.
+        '''
+        self.__governor = governor
         self.__session = requests.Session()
-        self.__session.mount("http://", HTTPAdapter(max_retries=retries))
+        self.__session.mount("http://", connection_pool)
+        self.__session.mount("https://", connection_pool)
         if additional_header is not None:
             self.__session.headers.update(additional_header)
 
-    def get(self, url, timeout):
-        return self.__session.get(url, timeout=timeout)
+    def get(self, url, timeout, stream=False, cache=None):
+        '''
+        With a ValidatorCache the request is made conditional, and a 304 Not
+        Modified is answered with the cached page.
+        '''
+        if cache is None:
+            return self.__get(url, timeout, stream)
+
+        r = self.__get(url, timeout, stream, cache.conditional_headers(url))
+        if r.status_code == _http_not_modified:
+            r.close()
+            cached = cache.replay(url)
+            if cached is not None:
+                return cached
+            r = self.__get(url, timeout, stream)
+
+        if r.status_code == _http_OK:
+            cache.store(url, r.url, r.headers.get("ETag"), r.headers.get("Last-Modified"), templates.std_encoding(r), r.content)
+
+        return r
+
+    def __get(self, url, timeout, stream, headers=None):
+        if self.__governor is None:
+            return self.__session.get(url, timeout=timeout, stream=stream, headers=headers)
+
+        # The body is read here, after its size is known
+        r = self.__session.get(url, timeout=timeout, stream=True, headers=headers)
+        if r.status_code == _http_OK:
+            if stream:
+                return self.__governor.limit_download(r)
+            self.__governor.buffer(r)
+        return r
 
     def get_header(self):
         return self.__session.headers
@@ -278,64 +1241,600 @@ class ScrapperSession:
 #----------ScrapperSession-Class-Definition-END-------------
 
 
+#----------AsyncScrapperSession-Class-Definition-START------
+class AsyncScrapperResponse:
+    '''
+    aiohttp response exposing the parts of requests.Response that the
+    callbacks rely on. Its body is either fully read, or streamed if a loop
+    is given: iter_content then reads it chunk by chunk on that loop, from
+    the thread of the download callback, and close() releases it. It has no
+    connection to make Range requests on, see supports_ranges.
+    '''
+
+    def __init__(self, response, content, body=None, loop=None):
+        self.status_code = response.status
+        self.url = str(response.url)
+        self.headers = response.headers
+        self.encoding = response.charset
+        self._content = content
+        # Released by the MemoryGovernor
+        self._scrapper_body = body
+        self.__response = response if loop is not None else None
+        self.__loop = loop
+
+    @property
+    def content(self):
+        if self._content is None and self.__response is not None:
+            self._content = b"".join(self.iter_content(_stream_chunk_size))
+        return self._content
+
+    @property
+    def text(self):
+        return str(self.content, self.encoding or "utf-8", errors="replace")
+
+    def iter_content(self, chunk_size=1):
+        if self._content is not None or self.__response is None:
+            for i in range(0, len(self.content), chunk_size):
+                yield self.content[i:i + chunk_size]
+            return
+
+        response = self.__response
+        while True:
+            chunk = asyncio.run_coroutine_threadsafe(response.content.read(chunk_size), self.__loop).result()
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if self.__response is None:
+            return
+        response, self.__response = self.__response, None
+        try:
+            on_loop = asyncio.get_running_loop() is self.__loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            response.close()
+        else:
+            self.__loop.call_soon_threadsafe(response.close)
+
+class AsyncScrapperSession:
+
+    def __init__(self, additional_header, retries, connector, trace_configs=None, governor=None):
+        self.__session = aiohttp.ClientSession(connector=connector, connector_owner=False, trace_configs=trace_configs)
+        self.__retries = retries
+        self.__governor = governor
+        if additional_header is not None:
+            self.__session.headers.update(additional_header)
+
+    async def get(self, url, timeout, cache=None, timer=None, stream=False):
+        '''
+        With a ValidatorCache the request is made conditional, and a 304 Not
+        Modified is answered with the cached page.
+
+        With a JobTimer the connect, ttfb and transfer phases are recorded.
+
+        With a MemoryGovernor, the body is read within its limits for a page,
+        or for a download if stream.
+        '''
+        if isinstance(timeout, tuple):
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+
+        if cache is None:
+            return await self.__fetch(url, client_timeout, None, timer, stream)
+
+        r = await self.__fetch(url, client_timeout, cache.conditional_headers(url), timer, stream)
+        if r.status_code == _http_not_modified:
+            cached = cache.replay(url)
+            if cached is not None:
+                return cached
+            r = await self.__fetch(url, client_timeout, None, timer, stream)
+
+        if r.status_code == _http_OK:
+            cache.store(url, r.url, r.headers.get("ETag"), r.headers.get("Last-Modified"), templates.std_encoding(r), r.content)
+
+        return r
+
+    async def __fetch(self, url, client_timeout, headers, timer, stream=False):
+        # Mirror the urllib3 Retry policy of ScrapperSession without blocking the loop
+        attempt = 0
+        while True:
+            try:
+                start = time.perf_counter()
+                connect = timer.get("connect") if timer is not None else 0
+                response = await self.__session.get(url, timeout=client_timeout, headers=headers, trace_request_ctx=timer)
+                try:
+                    headers_received = time.perf_counter()
+                    if timer is not None:
+                        connect = timer.get("connect") - connect
+                        timer.add("ttfb", headers_received - start - connect)
+                    if stream and response.status == _http_OK:
+                        # The download callback reads the body, its transfer is timed by TimedResponse
+                        r = AsyncScrapperResponse(response, None, loop=asyncio.get_running_loop())
+                        if self.__governor is not None:
+                            r = self.__governor.limit_download(r)
+                        response = None
+                        return r
+
+                    body = None
+                    if self.__governor is not None and response.status == _http_OK:
+                        body = await self.__governor.read_async(response)
+                        content = body.content
+                    else:
+                        content = await response.read()
+                    if timer is not None:
+                        timer.add("transfer", time.perf_counter() - headers_received)
+                        timer.nbytes += len(content)
+                    return AsyncScrapperResponse(response, content, body)
+                finally:
+                    if response is not None:
+                        response.release()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                attempt += 1
+                if self.__retries.total is None or attempt > self.__retries.total:
+                    raise
+                await asyncio.sleep(min(_max_session_backoff, self.__retries.backoff_factor * (2 ** (attempt - 1))))
+
+    def get_header(self):
+        return self.__session.headers
+
+    def get_cookies(self):
+        return self.__session.cookie_jar
+
+    def clear_headers(self):
+        self.__session.headers.clear()
+
+    def clear_cookies(self):
+        self.__session.cookie_jar.clear()
+
+    async def close(self):
+        await self.__session.close()
+#----------AsyncScrapperSession-Class-Definition-END--------
+
+
 #----------ScrapperJobs-Class-Definition-START--------------
 class ScrapperJobs:
 
-    def __init__(self, root_jobs, traversal):
+    def __init__(self, root_jobs, traversal, frontier=None, host_concurrency=None, host_rate=None,
+                 max_depth=None, max_pages_per_host=None, router=None, keep_alive=False, sources=0,
+                 retry_backoff=1, retry_max_delay=60, max_retries=None, breaker_threshold=5, breaker_cooldown=10):
+        '''
+        frontier holds the pending jobs, an in-memory DequeFrontier by default.
+
+        host_concurrency caps the jobs running per host and host_rate the jobs
+        started per second per host. Either one enables the HostScheduler.
+
+        Root jobs have depth 0 and jobs found by a job are one deeper. Jobs
+        deeper than max_depth, or beyond the first max_pages_per_host jobs of
+        their host, are dropped when added.
+
+        router, eg: a ShardRouter, makes this the frontier of one shard of a
+        distributed crawl. Jobs of other shards are handed to the router,
+        running out of jobs is reported to it, and the crawl is only done
+        when finish() is called.
+
+        With keep_alive, running out of jobs does not end the crawl either,
+        more jobs may be added until drain() is called.
+
+        sources is the number of job sources holding the crawl open from the
+        start, see hold().
+
+        Jobs given to retry_job() wait in a DelayedJobs queue for a backoff
+        of retry_backoff seconds, doubled on every retry of the job up to
+        retry_max_delay, or for Retry-After, and are skipped after
+        max_retries retries. With breaker_threshold, the statuses given to
+        record_status() drive a CircuitBreaker per host, see HostBreakers,
+        and the jobs of a paused host are parked until it may be tried.
+        '''
         self.__traversal = traversal
-        self.__container = collections.deque(root_jobs)
-        self.__current_jobs = set()
+        self.__container = frontier if frontier is not None else DequeFrontier(traversal)
+        self.__hosts = None
+        if host_concurrency is not None or host_rate is not None:
+            self.__hosts = self.__container = HostScheduler(self.__container, host_concurrency, host_rate)
+        self.__max_depth = max_depth
+        self.__max_pages_per_host = max_pages_per_host
+        self.__host_pages = collections.Counter()
+        # In-flight job -> depth
+        self.__current_jobs = dict()
         self.__job_lock = threading.Lock()
         self.__cv = threading.Condition(self.__job_lock)
-        self.__signal_done = False
-
-    def add_job(self, jobs):
+        self.__router = router
+        # Job batches received through the router
+        self.__remote_batches = 0
+        self.__listener = None
+        self.__keep_alive = keep_alive
+        self.__paused = False
+        self.__draining = False
+        self.__signal_exit = False
+        self.__holds = sources
+        # Pending jobs at which the waiters of wait_room() are woken, if any
+        self.__low_water = None
+        # Workers between marking links as visited and pushing them, see hold_checkpoint()
+        self.__checkpoint_holds = 0
+        self.__checkpointing = False
+        self.__delayed = DelayedJobs()
+        # Job -> retries so far, for the jobs that were retried
+        self.__retries = dict()
+        self.__retry_backoff = retry_backoff
+        self.__retry_max_delay = retry_max_delay
+        self.__max_retries = max_retries
+        # A host is paused at most as long as a job may be delayed
+        self.__breakers = HostBreakers(breaker_threshold, breaker_cooldown, max(breaker_cooldown, retry_max_delay)) \
+                          if breaker_threshold is not None else None
+        self.__container.push(self.__admit(root_jobs, 0))
+        self.__signal_done = self.__finished_locked()
+        if router is not None:
+            router.attach(self)
+
+    def __finished_locked(self):
+        return self.__router is None and not self.__keep_alive and (self.__holds == 0 or self.__draining) and \
+               self.__idle_locked()
+
+    def __idle_locked(self):
+        return len(self.__current_jobs) == 0 and len(self.__container) == 0 and len(self.__delayed) == 0
+
+    def __stopping_locked(self):
+        return self.__signal_done or self.__signal_exit or self.__draining
+
+    def __admit(self, jobs, depth):
+        if self.__max_depth is not None and depth > self.__max_depth:
+            return []
+
+        entries = []
+        for url, task, id in jobs:
+            if self.__max_pages_per_host is not None:
+                host = job_host((url, task, id))
+                if self.__host_pages[host] >= self.__max_pages_per_host:
+                    continue
+                self.__host_pages[host] += 1
+            entries.append((url, task, id, depth))
+
+        return entries
+
+    def add_job(self, jobs, parent=None):
+        '''
+        parent is the in-flight job that found jobs, if any. Returns False,
+        dropping jobs, if the crawl is already done.
+        '''
         assert all((isinstance(job, tuple) and \
                     len(job) == 3 and \
                     job[1] in _valid_tasks) for job in jobs)
+        remote = []
+        with self.__cv:
+            if self.__signal_done:
+                return False
+            depth = self.__current_jobs[parent] + 1 if parent in self.__current_jobs else 0
+            if self.__router is not None:
+                remote = [(url, task, id, depth) for url, task, id in jobs if not self.__router.owns(url)]
+                jobs = [job for job in jobs if self.__router.owns(job[0])]
+            self.__container.push(self.__admit(jobs, depth))
+            self.__cv.notify_all()
+            # Workers wake themselves for the jobs they find
+            listener = self.__listener if parent is None else None
+
+        # Sent before the parent is done, so before this shard can report being idle
+        if len(remote) > 0:
+            self.__router.send(remote)
+        if listener is not None:
+            listener()
+        return True
+
+    def add_remote(self, entries):
+        '''
+        Queue a batch of (url, task, id, depth) entries received through the router.
+        '''
         with self.__cv:
-            self.__container.extend(jobs)
+            self.__remote_batches += 1
+            for url, task, id, depth in entries:
+                self.__container.push(self.__admit([(url, task, id)], depth))
             self.__cv.notify_all()
+            idle = self.__idle_locked()
+            batches = self.__remote_batches
+            listener = self.__listener
+
+        if listener is not None:
+            listener()
+        if idle:
+            self.__router.idle(batches)
+
+    def set_listener(self, func):
+        '''
+        func is called without arguments when jobs are added or the crawl is
+        finished from another thread than the workers', eg: to wake an event loop.
+        '''
+        with self.__job_lock:
+            self.__listener = func
+
+    def depth(self, job):
+        '''
+        Crawl depth of an in-flight job.
+        '''
+        with self.__job_lock:
+            return self.__current_jobs[job]
 
     def empty(self):
         with self.__job_lock:
-            return len(self.__container) == 0
+            return len(self.__container) == 0 and len(self.__delayed) == 0
 
-    def get_job(self):
+    def get_job(self, block=True):
+        '''
+        With block=False, returns None immediately if no job is available.
+        '''
         with self.__cv:
-            while len(self.__container) == 0 and not self.__signal_done:
-                self.__cv.wait()
-
-            if not self.__signal_done:
-                if self.__traversal == "DFS":
-                    job = self.__container.pop()
-                else:
-                    job = self.__container.popleft()
-                self.__current_jobs.add(job)
-            else:
+            while True:
                 job = None
+                stopped = self.__signal_done or self.__signal_exit
+                if not stopped and not self.__paused:
+                    job = self.__pop_locked()
+                if job is not None or not block or stopped:
+                    break
+                self.__cv.wait(self.__ready_in_locked())
+
+            if job is not None:
+                url, task, id, depth = job
+                job = (url, task, id)
+                self.__current_jobs[job] = depth
+                if self.__low_water is not None and len(self.__container) <= self.__low_water:
+                    self.__low_water = None
+                    self.__cv.notify_all()
 
             return job
 
+    def __pop_locked(self):
+        '''
+        Next job of a host that may be tried, parking the jobs of paused hosts.
+        '''
+        ready = self.__delayed.pop_ready()
+        if len(ready) > 0:
+            self.__container.requeue(ready)
+
+        now = time.monotonic()
+        while len(self.__container) > 0:
+            # The HostScheduler returns None while every host with jobs is busy
+            job = self.__container.pop()
+            if job is None or self.__breakers is None:
+                return job
+            host = job_host(job)
+            wait = self.__breakers.check(host, now)
+            if wait == 0:
+                return job
+            if self.__hosts is not None:
+                self.__hosts.done(job)
+            self.__delayed.push(job, wait, host, now)
+        return None
+
+    def __ready_in_locked(self):
+        waits = [wait for wait in (self.__hosts.ready_in() if self.__hosts is not None else None,
+                                   self.__delayed.ready_in()) if wait is not None]
+        return min(waits) if len(waits) > 0 else None
+
+    def ready_in(self):
+        '''
+        Seconds until a rate limited host or a delayed job may have a job
+        ready, None if unknown.
+        '''
+        with self.__job_lock:
+            return self.__ready_in_locked()
+
+    def record_status(self, job, status, retry_after_value=None):
+        '''
+        Account the status of the response of an in-flight job, None if its
+        request raised, and its Retry-After header for the circuit breaker
+        of its host.
+        '''
+        if self.__breakers is None:
+            return
+        with self.__cv:
+            host = job_host(job)
+            if self.__breakers.record(host, status, retry_after_value, time.monotonic()):
+                # The jobs parked while the host was paused go again, or are parked until its new deadline
+                self.__delayed.release_host(host)
+                self.__cv.notify_all()
+
+    def retry_job(self, job, retry_after_value=None):
+        '''
+        Put an in-flight job back after a delay instead of marking it done.
+        Returns the delay in seconds, None if the job is out of retries and
+        done_job must be called instead.
+        '''
+        with self.__cv:
+            attempt = self.__retries.get(job, 0) + 1
+            if self.__max_retries is not None and attempt > self.__max_retries:
+                return None
+            self.__retries[job] = attempt
+
+            delay = backoff_delay(attempt, self.__retry_backoff, self.__retry_max_delay)
+            wait = retry_after(retry_after_value)
+            if wait is not None:
+                delay = max(delay, min(wait, self.__retry_max_delay))
+
+            depth = self.__current_jobs.pop(job)
+            if self.__hosts is not None:
+                self.__hosts.done(job)
+            self.__delayed.push(job + (depth,), delay)
+            # Waiters recompute their timeout
+            self.__cv.notify_all()
+            return delay
+
     def done_job(self, job):
         '''
         Make sure new job is added before calling done_job.
         '''
         with self.__cv:
-            self.__current_jobs.remove(job)
-            if len(self.__current_jobs) == 0 and len(self.__container) == 0:
-                self.__signal_done = True
+            del self.__current_jobs[job]
+            self.__retries.pop(job, None)
+            if self.__hosts is not None:
+                self.__hosts.done(job)
+                # The host of job may have a free slot now. The condition is shared with wait() and wait_room(),
+                # so notify() could wake a waiter that cannot take the slot
+                self.__cv.notify_all()
+            idle = self.__idle_locked()
+            if idle:
+                self.__signal_done = self.__finished_locked()
+                # Also wakes wait(idle=True)
                 self.__cv.notify_all()
+            batches = self.__remote_batches
+
+        if idle and self.__router is not None:
+            self.__router.idle(batches)
+
+    def finish(self):
+        '''
+        End a distributed crawl, called by the router once every shard is idle.
+        '''
+        with self.__cv:
+            self.__signal_done = True
+            self.__cv.notify_all()
+            listener = self.__listener
+
+        if listener is not None:
+            listener()
+
+    def pause(self):
+        '''
+        Stop handing out jobs, the in-flight ones are completed.
+        '''
+        with self.__cv:
+            self.__paused = True
+
+    def resume(self):
+        with self.__cv:
+            self.__paused = False
+            self.__cv.notify_all()
+            listener = self.__listener
+
+        if listener is not None:
+            listener()
+
+    def drain(self):
+        '''
+        Let the crawl end once the pending jobs are done, even with keep_alive.
+        '''
+        with self.__cv:
+            self.__keep_alive = False
+            self.__paused = False
+            self.__draining = True
+            self.__signal_done = self.__signal_done or self.__finished_locked()
+            self.__cv.notify_all()
+            listener = self.__listener
+
+        if listener is not None:
+            listener()
+
+    def hold(self):
+        '''
+        Keep the crawl from ending until release() is called, eg: while a
+        job source is read. Returns False if the crawl is already ending.
+        '''
+        with self.__cv:
+            if self.__stopping_locked():
+                return False
+            self.__holds += 1
+            return True
+
+    def release(self):
+        with self.__cv:
+            self.__holds -= 1
+            self.__signal_done = self.__signal_done or self.__finished_locked()
+            self.__cv.notify_all()
+            listener = self.__listener
+
+        if listener is not None:
+            listener()
+
+    def wait_room(self, size):
+        '''
+        Wait while size jobs or more are pending, until half of them are
+        left. Returns False if the crawl is ending and takes no more jobs.
+        '''
+        with self.__cv:
+            if len(self.__container) >= size:
+                self.__low_water = size // 2 if self.__low_water is None else max(self.__low_water, size // 2)
+                self.__cv.wait_for(lambda: len(self.__container) <= size // 2 or self.__stopping_locked())
+            return not self.__stopping_locked()
+
+    def wait(self, timeout=None, idle=False):
+        '''
+        Wait until the crawl is done or told to exit, with idle=True and
+        keep_alive also until no job is pending or in flight. Returns False
+        on timeout.
+        '''
+        with self.__cv:
+            return self.__cv.wait_for(lambda: self.__signal_done or self.__signal_exit or
+                                      (idle and self.__keep_alive and self.__holds == 0 and self.__idle_locked()),
+                                      timeout)
 
     def is_done(self):
         with self.__job_lock:
             return self.__signal_done
 
     def signal_exit(self):
+        '''
+        Make get_job return None, the pending jobs are left in the frontier.
+        '''
         with self.__cv:
+            self.__signal_exit = True
             self.__cv.notify_all()
 
     def curr_jobs(self):
         with self.__job_lock:
             return self.__current_jobs
+
+    def pending(self):
+        with self.__job_lock:
+            return len(self.__container) + len(self.__delayed)
+
+    def delayed(self):
+        with self.__job_lock:
+            return len(self.__delayed)
+
+    def open_hosts(self):
+        with self.__job_lock:
+            return self.__breakers.open_hosts() if self.__breakers is not None else 0
+
+    def hold_checkpoint(self, block=True):
+        '''
+        Keep checkpoints from being written until release_checkpoint() is
+        called, while links marked as visited are not pushed yet. Waits for
+        a checkpoint being written, or returns False if not block.
+        '''
+        with self.__cv:
+            while self.__checkpointing:
+                if not block:
+                    return False
+                self.__cv.wait()
+            self.__checkpoint_holds += 1
+            return True
+
+    def release_checkpoint(self):
+        with self.__cv:
+            self.__checkpoint_holds -= 1
+            if self.__checkpoint_holds == 0:
+                self.__cv.notify_all()
+
+    def checkpoint(self, save_visited=None):
+        '''
+        Persist the pending and in-flight jobs, once every link marked as
+        visited is pushed, after save_visited() saves the visited links.
+        '''
+        with self.__cv:
+            self.__checkpointing = True
+            try:
+                while self.__checkpoint_holds > 0:
+                    self.__cv.wait()
+                # Visited links go first: a link saved as pending but not as visited is merely fetched twice
+                if save_visited is not None:
+                    save_visited()
+                # Delayed jobs are saved as in flight, a resumed crawl tries them first
+                self.__container.checkpoint([job + (depth,) for job, depth in self.__current_jobs.items()] +
+                                            self.__delayed.entries())
+            finally:
+                self.__checkpointing = False
+                self.__cv.notify_all()
+
+    def close(self):
+        with self.__job_lock:
+            self.__container.close()
 #----------ScrapperJobs-Class-Definition-END----------------
\ No newline at end of file
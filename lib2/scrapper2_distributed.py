@@ -0,0 +1,250 @@
+#----------Import-Modules-START-----------------------------
+import json
+import queue
+import socket
+import struct
+import threading
+import zlib
+
+from lib2.scrapper2_utils import *
+from lib2.scrapper2_hosts import job_host
+import lib2.scrapper2_templates as templates
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_header = struct.Struct("!I")
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def shard_of(url, num_shards):
+    '''
+    Shard owning the host of url.
+
+    >>> shard_of("http://Rand.com/a", 4) == shard_of("http://rand.com/b", 4)
+    True
+    >>> 0 <= shard_of("http://rand.com/a", 4) < 4
+    True
+    '''
+    return zlib.crc32(job_host((url,)).encode("utf-8", "surrogatepass")) % num_shards
+
+def parse_address(address):
+    '''
+    >>> parse_address("127.0.0.1:8000")
+    ('127.0.0.1', 8000)
+    '''
+    host, _, port = address.rpartition(':')
+    return (host, int(port))
+
+def send_message(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(_header.pack(len(data)) + data)
+
+def recv_message(sock):
+    '''
+    Next message from sock, None once the peer has closed the connection.
+    '''
+    header = _recv_exactly(sock, _header.size)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, _header.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if chunk == b'':
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+#----------Utility-functions-END----------------------------
+
+
+#----------Coordinator-Class-Definition-START---------------
+class Coordinator:
+    '''
+    Owner of a distributed crawl. Waits for num_shards ShardRouter workers,
+    gives each a shard, sends every root job to the shard owning its host
+    and then routes the jobs the workers find the same way.
+
+    Termination: a worker reports idle(count) whenever it has no pending
+    and no in-flight job after applying count job batches. Messages of a
+    connection arrive in order, so a worker's jobs are routed before its
+    idle report. The crawl is over once every worker's latest report
+    covers all the batches routed to it, ie: nothing is in transit and
+    nobody is working.
+    '''
+
+    def __init__(self, root_jobs, num_shards, address=("127.0.0.1", 0)):
+        if not isinstance(num_shards, int) or num_shards < 1:
+            raise ValueError("num_shards must be a positive integer")
+
+        self.__root_jobs = root_jobs
+        self.__num_shards = num_shards
+        self.__listener = socket.create_server(address)
+        self.address = self.__listener.getsockname()[:2]
+
+        self.__connections = []
+        self.__inbox = queue.Queue()
+        self.__routed = [0] * num_shards
+        self.__applied = [-1] * num_shards
+        self.jobs_routed = 0
+
+    def __read(self, shard, conn):
+        try:
+            while True:
+                message = recv_message(conn)
+                self.__inbox.put((shard, message))
+                if message is None:
+                    return
+        except OSError:
+            self.__inbox.put((shard, None))
+
+    def __route(self, entries):
+        batches = {}
+        for entry in entries:
+            batches.setdefault(shard_of(entry[0], self.__num_shards), []).append(entry)
+        for shard, batch in batches.items():
+            try:
+                send_message(self.__connections[shard], {"type": "jobs", "jobs": batch})
+            except OSError:
+                # The reader of the connection reports the lost worker
+                continue
+            self.__routed[shard] += 1
+            self.jobs_routed += len(batch)
+
+    def __finished(self):
+        return all(applied == routed for applied, routed in zip(self.__applied, self.__routed))
+
+    def serve(self):
+        '''
+        Run the crawl to completion, returns False if a worker was lost.
+        '''
+        post_info("Coordinator listening on " + self.address[0] + ":" + str(self.address[1]) +
+                  " for " + str(self.__num_shards) + " workers")
+        for shard in range(self.__num_shards):
+            conn, peer = self.__listener.accept()
+            message = recv_message(conn)
+            if message is None or message.get("type") != "hello":
+                conn.close()
+                raise ConnectionError("Unexpected greeting from " + str(peer))
+            send_message(conn, {"type": "welcome", "shard": shard, "num_shards": self.__num_shards})
+            self.__connections.append(conn)
+            post_info("Worker " + str(peer[0]) + ":" + str(peer[1]) + " owns shard " + str(shard))
+
+        readers = [threading.Thread(target=self.__read, args=(shard, conn), daemon=True)
+                   for shard, conn in enumerate(self.__connections)]
+        for reader in readers:
+            reader.start()
+
+        self.__route([(url, task, id, 0) for url, task, id in self.__root_jobs])
+
+        complete = True
+        while True:
+            shard, message = self.__inbox.get()
+            if message is None:
+                post_error("Lost the worker of shard " + str(shard))
+                complete = False
+                break
+            if message["type"] == "jobs":
+                self.__route(message["jobs"])
+            elif message["type"] == "idle":
+                self.__applied[shard] = max(self.__applied[shard], message["count"])
+                if self.__finished():
+                    break
+
+        for conn in self.__connections:
+            try:
+                send_message(conn, {"type": "stop"})
+            except OSError:
+                pass
+        for reader in readers:
+            reader.join()
+        for conn in self.__connections:
+            conn.close()
+        self.__listener.close()
+
+        post_info("Coordinator routed " + str(self.jobs_routed) + " jobs")
+        return complete
+#----------Coordinator-Class-Definition-END-----------------
+
+
+#----------ShardRouter-Class-Definition-START---------------
+class ShardRouter:
+    '''
+    Worker side of a distributed crawl, passed to Scrapper as router.
+    ScrapperJobs keeps the jobs of this shard and sends the others to the
+    coordinator. Jobs received from the coordinator are checked against
+    this shard's visited links before they are queued.
+    '''
+
+    def __init__(self, address):
+        self.__sock = socket.create_connection(address)
+        self.__send_lock = threading.Lock()
+        send_message(self.__sock, {"type": "hello"})
+        message = recv_message(self.__sock)
+        if message is None or message.get("type") != "welcome":
+            raise ConnectionError("The coordinator refused the connection")
+
+        self.shard = message["shard"]
+        self.num_shards = message["num_shards"]
+        self.__scrapper_jobs = None
+        self.__receiver = None
+
+    def owns(self, url):
+        return shard_of(url, self.num_shards) == self.shard
+
+    def attach(self, scrapper_jobs):
+        '''
+        Called by ScrapperJobs once it can take jobs.
+        '''
+        self.__scrapper_jobs = scrapper_jobs
+        self.__receiver = threading.Thread(target=self.__receive, daemon=True)
+        self.__receiver.start()
+        # Nothing has been received yet and nothing is queued
+        self.idle(0)
+
+    def __send(self, message):
+        with self.__send_lock:
+            send_message(self.__sock, message)
+
+    def send(self, entries):
+        self.__send({"type": "jobs", "jobs": entries})
+
+    def idle(self, count):
+        self.__send({"type": "idle", "count": count})
+
+    def __receive(self):
+        store = templates.get_visited_store()
+        try:
+            while True:
+                message = recv_message(self.__sock)
+                if message is None or message["type"] == "stop":
+                    break
+                if message["type"] == "jobs":
+                    entries = [tuple(entry) for entry in message["jobs"]]
+                    self.__scrapper_jobs.add_remote([entry for entry in entries if store.add(entry[0])])
+        except OSError as e:
+            post_error("Connection to the coordinator failed: " + str(e))
+        finally:
+            self.__scrapper_jobs.finish()
+
+    def close(self):
+        self.__sock.close()
+#----------ShardRouter-Class-Definition-END-----------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
@@ -0,0 +1,277 @@
+#----------Import-Modules-START-----------------------------
+import collections
+import heapq
+import sqlite3
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_default_window = 10000
+_default_batch = 1000
+#----------Global-Variables-END-----------------------------
+
+
+#----------DequeFrontier-Class-Definition-START-------------
+class DequeFrontier:
+    '''
+    In-memory frontier. Not synchronized, ScrapperJobs serializes access.
+
+    Frontiers hold entries of (url, task, id, depth).
+
+    >>> frontier = DequeFrontier("DFS")
+    >>> frontier.push([("a", "visit", 0, 0), ("b", "visit", 0, 0)])
+    >>> frontier.pop(), len(frontier)
+    (('b', 'visit', 0, 0), 1)
+    '''
+
+    def __init__(self, traversal):
+        self.__traversal = traversal
+        self.__container = collections.deque()
+
+    def push(self, jobs):
+        self.__container.extend(jobs)
+
+    def requeue(self, jobs):
+        '''
+        Put jobs back so that they are the next ones popped, in order.
+        '''
+        if self.__traversal == "DFS":
+            self.__container.extend(reversed(jobs))
+        else:
+            self.__container.extendleft(reversed(jobs))
+
+    def pop(self):
+        if self.__traversal == "DFS":
+            return self.__container.pop()
+        else:
+            return self.__container.popleft()
+
+    def __len__(self):
+        return len(self.__container)
+
+    def checkpoint(self, in_flight):
+        pass
+
+    def close(self):
+        pass
+#----------DequeFrontier-Class-Definition-END---------------
+
+
+#----------HeapFrontier-Class-Definition-START--------------
+class HeapFrontier:
+    '''
+    In-memory frontier for PRIORITY traversal. priority_func(url, task, id, depth)
+    returns a sort key and the entry with the smallest key is popped first,
+    in push order among equal keys. Not synchronized, ScrapperJobs
+    serializes access.
+
+    >>> frontier = HeapFrontier(lambda url, task, id, depth: (task == "visit", depth))
+    >>> frontier.push([("a", "visit", 0, 1), ("b", "download", 0, 2), ("c", "visit", 0, 0), ("d", "visit", 0, 0)])
+    >>> [frontier.pop()[0] for _ in range(len(frontier))]
+    ['b', 'c', 'd', 'a']
+    '''
+
+    def __init__(self, priority_func):
+        self.__priority_func = priority_func
+        self.__heap = []
+        self.__seq = 0
+
+    def push(self, jobs):
+        for entry in jobs:
+            heapq.heappush(self.__heap, (self.__priority_func(*entry), self.__seq, entry))
+            self.__seq += 1
+
+    def requeue(self, jobs):
+        '''
+        Requeued entries go back to their place in the priority order.
+        '''
+        self.push(jobs)
+
+    def pop(self):
+        return heapq.heappop(self.__heap)[2]
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def checkpoint(self, in_flight):
+        pass
+
+    def close(self):
+        pass
+#----------HeapFrontier-Class-Definition-END----------------
+
+
+#----------SQLiteFrontier-Class-Definition-START------------
+class SQLiteFrontier:
+    '''
+    Frontier persisted in an SQLite database. Only the jobs nearest to the
+    popping end are kept in memory, at most window newly pushed jobs and one
+    batch loaded from the database. Not synchronized, ScrapperJobs
+    serializes access.
+
+    checkpoint() writes all pending jobs and the given in-flight jobs to the
+    database. Opening it again with resume=True requeues the in-flight jobs
+    first, then continues in the original order. Jobs loaded from the
+    database stay there, marked as loaded, until a checkpoint: after a crash
+    they are pending again, and may run twice rather than never.
+
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), "frontier.db")
+    >>> frontier = SQLiteFrontier(filename, "BFS", window=2, batch=2)
+    >>> frontier.push([(str(i), "visit", 0, 1) for i in range(5)])
+    >>> frontier.pop(), len(frontier)
+    (('0', 'visit', 0, 1), 4)
+    >>> frontier.checkpoint([("0", "visit", 0, 1)]); frontier.close()
+    >>> frontier = SQLiteFrontier(filename, "BFS", window=2, batch=2, resume=True)
+    >>> [frontier.pop()[0] for _ in range(len(frontier))]
+    ['0', '1', '2', '3', '4']
+    >>> frontier.close()
+    >>> frontier = SQLiteFrontier(filename, "BFS", window=2, batch=2, resume=True)
+    >>> [frontier.pop()[0] for _ in range(len(frontier))]
+    ['0', '1', '2', '3', '4']
+    >>> frontier = SQLiteFrontier(filename, "DFS", window=2, batch=2)
+    >>> frontier.push([(str(i), "visit", 0, 1) for i in range(5)])
+    >>> frontier.pop()[0], frontier.pop()[0]
+    ('4', '3')
+    >>> frontier.push([("5", "visit", 0, 2)])
+    >>> [frontier.pop()[0] for _ in range(len(frontier))]
+    ['5', '2', '1', '0']
+    '''
+
+    def __init__(self, filename, traversal, window=_default_window, batch=_default_batch, resume=False):
+        self.__traversal = traversal
+        self.__window = window
+        self.__batch = batch
+
+        # Jobs loaded from the database as (seq, job), older than every stored job
+        self.__head = collections.deque()
+        # Jobs pushed since the last spill, newer than every stored job
+        self.__tail = collections.deque()
+
+        self.__db = sqlite3.connect(filename, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        if not resume:
+            self.__db.execute("DROP TABLE IF EXISTS jobs")
+            self.__db.execute("DROP TABLE IF EXISTS in_flight")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS jobs (seq INTEGER PRIMARY KEY, url TEXT, task TEXT, id INTEGER, "
+                          "depth INTEGER, loaded INTEGER NOT NULL DEFAULT 0)")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS in_flight (url TEXT, task TEXT, id INTEGER, depth INTEGER)")
+        if "loaded" not in [row[1] for row in self.__db.execute("PRAGMA table_info(jobs)")]:
+            # Frontier saved before loaded rows were kept
+            self.__db.execute("ALTER TABLE jobs ADD COLUMN loaded INTEGER NOT NULL DEFAULT 0")
+        # Jobs loaded by a crawl that crashed before its next checkpoint
+        self.__db.execute("UPDATE jobs SET loaded = 0 WHERE loaded = 1")
+        self.__db.commit()
+
+        self.__db_count = self.__db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        self.__next_seq = (self.__db.execute("SELECT MAX(seq) FROM jobs").fetchone()[0] or 0) + 1
+
+        # Kept in the database until the next checkpoint replaces them
+        in_flight = [tuple(row) for row in self.__db.execute("SELECT url, task, id, depth FROM in_flight ORDER BY rowid")]
+        self.requeue(in_flight)
+
+    def push(self, jobs):
+        self.__tail.extend(jobs)
+        if len(self.__tail) > self.__window:
+            self.__spill(len(self.__tail) - self.__window // 2)
+
+    def requeue(self, jobs):
+        '''
+        Put jobs back so that they are the next ones popped, in order.
+        '''
+        if self.__traversal == "DFS":
+            self.__tail.extend(reversed(jobs))
+        else:
+            for job in reversed(jobs):
+                self.__head.appendleft((None, job))
+
+    def pop(self):
+        if self.__traversal == "DFS":
+            if len(self.__tail) == 0 and self.__db_count > 0:
+                self.__load(newest=True)
+            if len(self.__tail) > 0:
+                return self.__tail.pop()
+            return self.__head.pop()[1]
+        else:
+            if len(self.__head) == 0 and self.__db_count > 0:
+                self.__load(newest=False)
+            if len(self.__head) > 0:
+                return self.__head.popleft()[1]
+            return self.__tail.popleft()
+
+    def __len__(self):
+        return len(self.__head) + len(self.__tail) + self.__db_count
+
+    def __spill(self, count):
+        '''
+        Move the oldest count jobs of the tail to the database.
+        '''
+        rows = []
+        for _ in range(count):
+            url, task, id, depth = self.__tail.popleft()
+            rows.append((self.__next_seq, url, task, id, depth))
+            self.__next_seq += 1
+        self.__db.executemany("INSERT INTO jobs (seq, url, task, id, depth) VALUES (?, ?, ?, ?, ?)", rows)
+        self.__db.commit()
+        self.__db_count += count
+
+    def __load(self, newest):
+        order = "DESC" if newest else "ASC"
+        rows = self.__db.execute("SELECT seq, url, task, id, depth FROM jobs WHERE loaded = 0 ORDER BY seq " + order +
+                                 " LIMIT ?", (self.__batch,)).fetchall()
+        # Deleted by the next checkpoint, visited links are only saved then
+        self.__db.executemany("UPDATE jobs SET loaded = 1 WHERE seq = ?", [(row[0],) for row in rows])
+        self.__db.commit()
+        self.__db_count -= len(rows)
+
+        if newest:
+            self.__tail.extend(tuple(row[1:]) for row in reversed(rows))
+        else:
+            self.__head.extend((row[0], tuple(row[1:])) for row in rows)
+
+    def checkpoint(self, in_flight):
+        '''
+        Persist every pending job and the given in-flight jobs.
+        '''
+        # Loaded jobs that are still pending are written back from memory
+        self.__db.execute("DELETE FROM jobs WHERE loaded = 1")
+
+        # Head jobs keep their original sequence numbers, requeued ones go before them
+        min_seq = self.__db.execute("SELECT MIN(seq) FROM jobs").fetchone()[0]
+        if min_seq is None:
+            min_seq = self.__next_seq
+        min_seq = min([min_seq] + [seq for seq, _ in self.__head if seq is not None])
+
+        rows = []
+        for seq, (url, task, id, depth) in reversed(self.__head):
+            if seq is None:
+                min_seq -= 1
+                seq = min_seq
+            rows.append((seq, url, task, id, depth))
+        self.__db.executemany("INSERT INTO jobs (seq, url, task, id, depth) VALUES (?, ?, ?, ?, ?)", rows)
+        self.__db_count += len(rows)
+        self.__head.clear()
+
+        if len(self.__tail) > 0:
+            self.__spill(len(self.__tail))
+
+        self.__db.execute("DELETE FROM in_flight")
+        self.__db.executemany("INSERT INTO in_flight VALUES (?, ?, ?, ?)", list(in_flight))
+        self.__db.commit()
+
+    def close(self):
+        self.__db.close()
+#----------SQLiteFrontier-Class-Definition-END--------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
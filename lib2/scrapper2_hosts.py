@@ -0,0 +1,231 @@
+#----------Import-Modules-START-----------------------------
+import collections
+import time
+import urllib.parse
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_default_lookahead = 1000
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def job_host(job):
+    '''
+    >>> job_host(("http://Rand.com:8080/random", "visit", 0))
+    'rand.com:8080'
+    '''
+    return urllib.parse.urlsplit(job[0]).netloc.lower()
+#----------Utility-functions-END----------------------------
+
+
+#----------TokenBucket-Class-Definition-START---------------
+class TokenBucket:
+    '''
+    Allows rate events per second on average and bursts of up to burst events.
+
+    >>> bucket = TokenBucket(2, 1, now=0)
+    >>> bucket.take(0), bucket.take(0), bucket.ready_in(0)
+    (True, False, 0.5)
+    >>> bucket.take(0.5)
+    True
+    '''
+
+    def __init__(self, rate, burst=1, now=None):
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = burst
+        self.__stamp = time.monotonic() if now is None else now
+
+    def __refill(self, now):
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__stamp) * self.__rate)
+        self.__stamp = now
+
+    def take(self, now):
+        self.__refill(now)
+        if self.__tokens >= 1:
+            self.__tokens -= 1
+            return True
+        return False
+
+    def ready_in(self, now):
+        self.__refill(now)
+        return max(0, (1 - self.__tokens) / self.__rate)
+
+    def full(self, now):
+        self.__refill(now)
+        return self.__tokens >= self.__burst
+#----------TokenBucket-Class-Definition-END-----------------
+
+
+#----------HostScheduler-Class-Definition-START-------------
+class HostScheduler:
+    '''
+    Politeness layer over a frontier. Up to lookahead jobs are pulled from the
+    frontier into per-host queues, which are served round-robin, and up to
+    lookahead more while every buffered host is busy. A host is skipped
+    while it has max_in_flight jobs running or while its token bucket of
+    rate requests per second is empty. Jobs of one host keep the frontier's
+    order. Not synchronized, ScrapperJobs serializes access.
+
+    >>> from lib2.scrapper2_frontier import DequeFrontier
+    >>> hosts = HostScheduler(DequeFrontier("BFS"), max_in_flight=1)
+    >>> hosts.push([("http://a.com/1", "visit", 0, 0), ("http://a.com/2", "visit", 0, 0), ("http://b.com/1", "visit", 0, 0)])
+    >>> hosts.pop(), hosts.pop(), hosts.pop()
+    (('http://a.com/1', 'visit', 0, 0), ('http://b.com/1', 'visit', 0, 0), None)
+    >>> hosts.done(("http://a.com/1", "visit", 0))
+    >>> hosts.pop(), len(hosts)
+    (('http://a.com/2', 'visit', 0, 0), 0)
+
+    A host with more pending jobs than the lookahead does not hide the others
+    within the next lookahead jobs, and the frontier is not drained into memory:
+
+    >>> frontier = DequeFrontier("BFS")
+    >>> hosts = HostScheduler(frontier, max_in_flight=2, lookahead=10)
+    >>> hosts.push([("http://a.com/" + str(i), "visit", 0, 0) for i in range(15)] + [("http://b.com/1", "visit", 0, 0)])
+    >>> hosts.push([("http://a.com/" + str(i), "visit", 0, 0) for i in range(15, 100)])
+    >>> [job[0] if job is not None else None for job in (hosts.pop() for _ in range(4))]
+    ['http://a.com/0', 'http://a.com/1', 'http://b.com/1', None]
+    >>> len(frontier), len(hosts)
+    (78, 98)
+    >>> hosts.done(("http://a.com/0", "visit", 0)); hosts.pop()[0]
+    'http://a.com/2'
+    '''
+
+    def __init__(self, frontier, max_in_flight=None, rate=None, burst=1, lookahead=_default_lookahead):
+        self.__frontier = frontier
+        self.__max_in_flight = max_in_flight
+        self.__rate = rate
+        self.__burst = burst
+        self.__lookahead = lookahead
+
+        self.__queues = {}
+        self.__ring = collections.deque()
+        self.__in_flight = collections.Counter()
+        self.__buckets = {}
+        self.__buffered = 0
+        self.__seq = 0
+
+    def __pull(self):
+        '''
+        Move the next job of the frontier to the queue of its host, returns the host.
+        '''
+        job = self.__frontier.pop()
+        host = job_host(job)
+        queue = self.__queues.get(host)
+        if queue is None:
+            queue = self.__queues[host] = collections.deque()
+            self.__ring.append(host)
+        queue.append((self.__seq, job))
+        self.__seq += 1
+        self.__buffered += 1
+        return host
+
+    def __fill(self):
+        while self.__buffered < self.__lookahead and len(self.__frontier) > 0:
+            self.__pull()
+
+    def __bucket(self, host, now):
+        bucket = self.__buckets.get(host)
+        if bucket is None:
+            bucket = self.__buckets[host] = TokenBucket(self.__rate, self.__burst, now)
+        return bucket
+
+    def __available(self, host):
+        return self.__max_in_flight is None or self.__in_flight[host] < self.__max_in_flight
+
+    def __ready(self, host, now):
+        return self.__available(host) and (self.__rate is None or self.__bucket(host, now).take(now))
+
+    def __take(self, host):
+        '''
+        First buffered job of host, which is at the end of the ring.
+        '''
+        queue = self.__queues[host]
+        _, job = queue.popleft()
+        if len(queue) == 0:
+            del self.__queues[host]
+            self.__ring.pop()
+        self.__buffered -= 1
+        self.__in_flight[host] += 1
+        return job
+
+    def push(self, jobs):
+        self.__frontier.push(jobs)
+
+    def requeue(self, jobs):
+        self.__frontier.requeue(jobs)
+
+    def pop(self):
+        '''
+        Returns the next job of the next ready host, None if every host is busy.
+        '''
+        self.__fill()
+        now = time.monotonic()
+        for _ in range(len(self.__ring)):
+            host = self.__ring[0]
+            # host goes to the end of the ring
+            self.__ring.rotate(-1)
+            if self.__ready(host, now):
+                return self.__take(host)
+
+        # Every buffered host is busy, eg: one host fills the lookahead. Read up to one more lookahead
+        # past it for a job of another host, jobs of the busy hosts stay buffered in order. Bounded so
+        # that a crawl of one host does not drain the frontier into memory, the caller waits instead.
+        while len(self.__frontier) > 0 and self.__buffered < 2 * self.__lookahead:
+            host = self.__pull()
+            if len(self.__queues[host]) == 1 and self.__ready(host, now):
+                return self.__take(host)
+
+        return None
+
+    def ready_in(self):
+        '''
+        Seconds until a rate limited host may be ready, None if only a done job can free one.
+        '''
+        if self.__rate is None:
+            return None
+
+        now = time.monotonic()
+        waits = [self.__bucket(host, now).ready_in(now) for host in self.__ring if self.__available(host)]
+        return min(waits) if len(waits) > 0 else None
+
+    def done(self, job):
+        host = job_host(job)
+        self.__in_flight[host] -= 1
+        if self.__in_flight[host] <= 0:
+            del self.__in_flight[host]
+            # Forget idle hosts whose bucket has refilled
+            bucket = self.__buckets.get(host)
+            if host not in self.__queues and bucket is not None and bucket.full(time.monotonic()):
+                del self.__buckets[host]
+
+    def __len__(self):
+        return self.__buffered + len(self.__frontier)
+
+    def checkpoint(self, in_flight):
+        # Return the buffered jobs to the frontier in the order they were pulled
+        buffered = sorted((entry for queue in self.__queues.values() for entry in queue), key=lambda entry: entry[0])
+        self.__frontier.requeue([job for _, job in buffered])
+        self.__queues.clear()
+        self.__ring.clear()
+        self.__buffered = 0
+
+        self.__frontier.checkpoint(in_flight)
+
+    def close(self):
+        self.__frontier.close()
+#----------HostScheduler-Class-Definition-END---------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
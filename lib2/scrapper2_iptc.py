@@ -0,0 +1,127 @@
+#----------Import-Modules-START-----------------------------
+import os
+import queue
+import threading
+import zlib
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+# Formats whose IPTC block exiv2 can write
+_iptc_extensions = (".jpg", ".jpeg", ".jpe", ".tif", ".tiff", ".png", ".psd")
+_stop = None
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def supports_iptc(filename):
+    '''
+    >>> supports_iptc("a/b.JPG"), supports_iptc("a/b.mp4")
+    (True, False)
+    '''
+    return os.path.splitext(filename)[1].lower() in _iptc_extensions
+#----------Utility-functions-END----------------------------
+
+
+#----------IptcWriter-Class-Definition-START----------------
+class IptcWriter:
+    '''
+    Background stage tagging downloaded files. write_func(filename, iptc_tags)
+    runs on num_workers threads, and a given file always goes to the same
+    worker, so writes to one file never overlap. Tags submitted for a file
+    that is still waiting are merged into a single write. Files without
+    IPTC support and empty tag sets are skipped.
+
+    Each worker queues at most queue_size files, then submit() blocks.
+
+    >>> written = []
+    >>> writer = IptcWriter(lambda filename, iptc_tags: written.append((filename, iptc_tags)), num_workers=2)
+    >>> writer.submit("a.mp4", {"Iptc.Application2.Keywords": ["a"]}); writer.submit("b.jpg", {})
+    >>> writer.submit("c.jpg", {"Iptc.Application2.Keywords": ["c"]}); writer.submit("d1f0", {"Iptc.Application2.City": "d"}, "d.png")
+    >>> writer.flush()
+    []
+    >>> sorted(written)
+    [('c.jpg', {'Iptc.Application2.Keywords': ['c']}), ('d1f0', {'Iptc.Application2.City': 'd'})]
+    >>> writer.close()
+    '''
+
+    def __init__(self, write_func, num_workers=1, queue_size=1000):
+        if not isinstance(num_workers, int) or num_workers < 1:
+            raise ValueError("num_workers must be a positive integer")
+
+        self.__write_func = write_func
+        self.__lock = threading.Lock()
+        self.__pending = {}
+        self.__failures = []
+
+        self.__queues = [queue.Queue(maxsize=queue_size) for _ in range(num_workers)]
+        self.__workers = [threading.Thread(target=self.__work, args=(q,), name="scrapper2-iptc-" + str(i), daemon=True)
+                          for i, q in enumerate(self.__queues)]
+        for worker in self.__workers:
+            worker.start()
+
+    def submit(self, filename, iptc_tags, format_filename=None):
+        '''
+        Tag filename, whose format is given by the extension of format_filename
+        if it has none, eg: a content store blob named by its digest.
+        '''
+        if len(iptc_tags) == 0 or not supports_iptc(format_filename if format_filename is not None else filename):
+            return
+
+        with self.__lock:
+            tags = self.__pending.get(filename)
+            if tags is not None:
+                tags.update(iptc_tags)
+                return
+            self.__pending[filename] = dict(iptc_tags)
+
+        # Outside the lock: a full queue waits for its worker, which takes the lock
+        self.__queues[zlib.crc32(filename.encode("utf-8", "surrogatepass")) % len(self.__queues)].put(filename)
+
+    def __work(self, files):
+        while True:
+            filename = files.get()
+            try:
+                if filename is _stop:
+                    return
+
+                with self.__lock:
+                    iptc_tags = self.__pending.pop(filename)
+                try:
+                    self.__write_func(filename, iptc_tags)
+                except Exception as e:
+                    with self.__lock:
+                        self.__failures.append((filename, str(e)))
+            finally:
+                files.task_done()
+
+    def flush(self):
+        '''
+        Wait until every submitted file is tagged, returns the (filename, error)
+        of the writes that failed since the last flush.
+        '''
+        for files in self.__queues:
+            files.join()
+
+        with self.__lock:
+            failures, self.__failures = self.__failures, []
+        return failures
+
+    def close(self):
+        for files in self.__queues:
+            files.put(_stop)
+        for worker in self.__workers:
+            worker.join()
+#----------IptcWriter-Class-Definition-END------------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
@@ -0,0 +1,235 @@
+#----------Import-Modules-START-----------------------------
+import codecs
+import functools
+import html
+import html.parser
+import re
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_boms = ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be"))
+# Browsers look for <meta charset> in the first 1024 bytes
+_meta_prescan_size = 1024
+_meta_charset = re.compile(rb"""<meta\s[^>]*?charset\s*=\s*["']?\s*([a-zA-Z0-9_:.+-]+)""", re.I)
+_header_charset = re.compile(r"""charset\s*=\s*["']?\s*([a-zA-Z0-9_:.+-]+)""", re.I)
+# As in html.parser, quotes only delimit a value right after "=", a bare value may contain them
+_bytes_attr = re.compile(rb"""([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|((?!["'])[^\s>]*)))?""")
+#----------Global-Variables-END-----------------------------
+
+
+#----------Encoding-functions-START-------------------------
+def _known_encoding(name):
+    try:
+        return codecs.lookup(name.decode("ascii") if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+def html_encoding(content, content_type=None, default="utf-8"):
+    '''
+    Encoding of the HTML bytes content, from its byte order mark, the
+    charset of its Content-Type header, its <meta> tags or else default.
+    Nothing is guessed from the statistics of the bytes.
+
+    >>> html_encoding(b"<html>", "text/html; charset=ISO-8859-1")
+    'iso8859-1'
+    >>> html_encoding(b'<head><meta http-equiv="Content-Type" content="text/html; charset=windows-1252">', "text/html")
+    'cp1252'
+    >>> html_encoding(b"<meta charset='bogus'><p>", None, "latin-1"), html_encoding(codecs.BOM_UTF8 + b"<p>", "text/html; charset=latin-1")
+    ('iso8859-1', 'utf-8')
+    '''
+    for bom, encoding in _boms:
+        # content may be any bytes-like object, eg: a memory map
+        if content[:len(bom)] == bom:
+            return encoding
+
+    if content_type is not None:
+        match = _header_charset.search(content_type)
+        encoding = _known_encoding(match.group(1)) if match is not None else None
+        if encoding is not None:
+            return encoding
+
+    match = _meta_charset.search(content, 0, _meta_prescan_size)
+    encoding = _known_encoding(match.group(1)) if match is not None else None
+    if encoding is not None:
+        return encoding
+
+    return _known_encoding(default) or "utf-8"
+
+@functools.lru_cache(maxsize=64)
+def _ascii_compatible(encoding):
+    try:
+        return "<a href='/'>".encode(encoding) == b"<a href='/'>"
+    except (LookupError, UnicodeError):
+        return False
+
+def _decode(content, encoding):
+    if isinstance(content, str):
+        return content
+    return str(content, encoding or "utf-8", errors="replace")
+#----------Encoding-functions-END---------------------------
+
+
+#----------Link-Extractor-Backends-START--------------------
+class StreamLinkExtractor(html.parser.HTMLParser):
+    '''
+    Collects the link attributes of the given tags in one forward pass over
+    the start tags. No tree is built.
+    '''
+
+    def __init__(self, link_tags):
+        super().__init__(convert_charrefs=True)
+        self.__tag_attrs = {}
+        for i, (tag, attr) in enumerate(link_tags):
+            self.__tag_attrs.setdefault(tag, []).append((attr, i))
+        self.links = [[] for _ in link_tags]
+
+    def handle_starttag(self, tag, attrs):
+        tag_attrs = self.__tag_attrs.get(tag)
+        if tag_attrs is None:
+            return
+
+        for attr, i in tag_attrs:
+            # The last duplicate attribute wins, as with BeautifulSoup
+            value = None
+            for name, attr_value in attrs:
+                if name == attr:
+                    value = attr_value
+            if value is None:
+                continue
+            if '\n' in value or '\r' in value:
+                value = value.replace('\n', '').replace('\r', '')
+            self.links[i].append(value)
+
+def stream_extract_links(text, link_tags, encoding=None):
+    '''
+    Returns the values of the (tag, attribute) pairs in link_tags, grouped by
+    their position in link_tags and in document order within a group. text
+    may be bytes, decoded with encoding.
+
+    >>> stream_extract_links('<a href="/x">x</a><IMG SRC="y.jpg"/><a href="/z"><a>', (("a", "href"), ("img", "src")))
+    ['/x', '/z', 'y.jpg']
+    >>> stream_extract_links('<a href="/x?a=1&amp;b=2\\n">', (("a", "href"),))
+    ['/x?a=1&b=2']
+    >>> stream_extract_links('<script>"<a href=no>"</script><video src=v.mp4>', (("a", "href"), ("video", "src")))
+    ['v.mp4']
+    '''
+    extractor = StreamLinkExtractor(link_tags)
+    extractor.feed(_decode(text, encoding))
+    extractor.close()
+
+    return [link for links in extractor.links for link in links]
+
+def soup_extract_links(text, link_tags, encoding=None):
+    '''
+    Same as stream_extract_links, through a full BeautifulSoup tree.
+
+    >>> soup_extract_links('<a href="/x">x</a><IMG SRC="y.jpg"/><a href="/z"><a>', (("a", "href"), ("img", "src")))
+    ['/x', '/z', 'y.jpg']
+    '''
+    if BeautifulSoup is None:
+        raise ImportError("The bs4 link extractor requires BeautifulSoup")
+
+    text = _decode(text, encoding)
+    soup = BeautifulSoup(text.replace('\n', '').replace('\r', ''), "html.parser")
+
+    links = []
+    for tag, attr in link_tags:
+        for div in soup.find_all(tag):
+            value = div.get(attr)
+            if value is not None:
+                links.append(value)
+
+    return links
+
+@functools.lru_cache(maxsize=16)
+def _bytes_tag_regex(tags):
+    # Comments, CDATA sections and the raw text of scripts and styles are skipped like html.parser does,
+    # up to the end of the page if unterminated. The alternatives of the tag body never overlap, so an
+    # unterminated tag fails without backtracking.
+    names = b"|".join(re.escape(tag) for tag in tags)
+    return re.compile(rb"<!--.*?(?:-->|\Z)|<!\[CDATA\[.*?(?:\]\]>|\Z)|<(script|style)(?=[\s/>]).*?(?:</\1\s*>|\Z)|<(" + names +
+                      rb""")(?=[\s/>])((?:[^>=]|=\s*"[^"]*"|=\s*'[^']*'|=(?!\s*["']))*)>""", re.I | re.S)
+
+def bytes_extract_links(content, link_tags, encoding=None):
+    '''
+    Same as stream_extract_links, scanning the raw bytes of the page, or any
+    bytes-like object, with a regular expression. Only the link values are
+    decoded, which needs an encoding compatible with ASCII, others fall
+    back to stream_extract_links.
+
+    >>> bytes_extract_links(b'<a href="/x">x</a><IMG SRC="y.jpg"/><a href="/z"><a>', (("a", "href"), ("img", "src")))
+    ['/x', '/z', 'y.jpg']
+    >>> bytes_extract_links(b'<a title="a>b" href="/x?a=1&amp;b=2\\n">', (("a", "href"),))
+    ['/x?a=1&b=2']
+    >>> bytes_extract_links(b'<script>"<a href=no>"</script><!-- <a href=no> --><video src=v.mp4>', (("a", "href"), ("video", "src")))
+    ['v.mp4']
+    >>> bytes_extract_links("<a href='/caf\xe9'>".encode("cp1252"), (("a", "href"),), "cp1252")
+    ['/caf\xe9']
+    >>> bytes_extract_links(b"<a title=don't href=/x>x</a><a href=/y>", (("a", "href"),))
+    ['/x', '/y']
+    >>> bytes_extract_links(b"<![CDATA[<a href=/cd>]]><a href=/y>", (("a", "href"),))
+    ['/y']
+    '''
+    encoding = encoding or "utf-8"
+    if isinstance(content, str) or not _ascii_compatible(encoding):
+        return stream_extract_links(content, link_tags, encoding)
+
+    tag_attrs = {}
+    for i, (tag, attr) in enumerate(link_tags):
+        tag_attrs.setdefault(tag.lower().encode("ascii"), []).append((attr.lower().encode("ascii"), i))
+    links = [[] for _ in link_tags]
+
+    for match in _bytes_tag_regex(tuple(tag_attrs)).finditer(content):
+        tag = match.group(2)
+        if tag is None:
+            continue
+        attrs = {}
+        # The last duplicate attribute wins, as with BeautifulSoup
+        for attr_match in _bytes_attr.finditer(match.group(3)):
+            name, double, single, bare = attr_match.groups()
+            value = double if double is not None else single if single is not None else bare
+            if value is not None:
+                attrs[name.lower()] = value
+        for attr, i in tag_attrs[tag.lower()]:
+            value = attrs.get(attr)
+            if value is None:
+                continue
+            value = value.decode(encoding, errors="replace")
+            if '&' in value:
+                value = html.unescape(value)
+            if '\n' in value or '\r' in value:
+                value = value.replace('\n', '').replace('\r', '')
+            links[i].append(value)
+
+    return [link for group in links for link in group]
+
+_link_extractors = { "stream" : stream_extract_links,
+                     "bs4"    : soup_extract_links,
+                     "bytes"  : bytes_extract_links   }
+
+def get_link_extractor(name):
+    '''
+    Look up a link extractor backend by name, "stream", "bs4" or "bytes".
+    '''
+    if name not in _link_extractors:
+        raise ValueError("Unknown link extractor " + str(name))
+    return _link_extractors[name]
+#----------Link-Extractor-Backends-END----------------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
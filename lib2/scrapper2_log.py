@@ -0,0 +1,165 @@
+#----------Import-Modules-START-----------------------------
+import json
+import queue
+import sys
+import threading
+import time
+
+from lib2.scrapper2_utils import format_msg
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_valid_levels = ("info", "success", "failure", "warning", "error")
+_valid_formats = ("text", "jsonl")
+_valid_overflows = ("block", "drop")
+# Message type: (colour, console stream)
+_msg_styles = {"info": ("cyan", "stdout"), "success": ("green", "stdout"), "failure": ("red", "stdout"),
+               "warning": ("yellow", "stderr"), "error": ("red", "stderr")}
+_batch_size = 512
+_stop = None
+#----------Global-Variables-END-----------------------------
+
+
+#----------ScrapperLogger-Class-Definition-START------------
+class ScrapperLogger:
+    '''
+    Logging off the crawl's critical path. Callers enqueue records, and one
+    writer thread formats them and writes them in batches, flushing console
+    and log file once per batch.
+
+    Records below level are discarded by the caller. When queue_size
+    records are pending, overflow="block" makes callers wait for the
+    writer and overflow="drop" discards the new record; drops are counted
+    and reported on close. The log file holds plain text lines, or one
+    JSON object per line with format="jsonl".
+
+    >>> import io
+    >>> log_file = io.StringIO()
+    >>> logger = ScrapperLogger(console=False, log_file=log_file, level="warning", format="jsonl")
+    >>> logger.log("info", "hidden"); logger.log("error", "shown")
+    >>> logger.close()
+    >>> [(record["type"], record["msg"]) for record in map(json.loads, log_file.getvalue().splitlines())]
+    [('error', 'shown')]
+    '''
+
+    def __init__(self, console=True, colour=True, log_file=None, level="info", format="text",
+                 queue_size=10000, overflow="block"):
+        if level not in _valid_levels:
+            raise ValueError("level must be one of " + str(_valid_levels))
+        if format not in _valid_formats:
+            raise ValueError("format must be one of " + str(_valid_formats))
+        if overflow not in _valid_overflows:
+            raise ValueError("overflow must be one of " + str(_valid_overflows))
+
+        self.__console = console
+        self.__colour = colour
+        self.__log_file = log_file
+        self.__level = _valid_levels.index(level)
+        self.__format = format
+        self.__block = overflow == "block"
+        self.__dropped = 0
+        self.__lock = threading.Lock()
+        self.__closed = False
+
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__writer = threading.Thread(target=self.__write_loop, name="scrapper2-log", daemon=True)
+        self.__writer.start()
+
+    def log(self, type, msg, force_console=False):
+        '''
+        Queue a message of type "info", "success", "failure", "warning" or
+        "error". force_console shows it even if the console is disabled or
+        the message is below level.
+        '''
+        if _valid_levels.index(type) < self.__level and not force_console:
+            return
+
+        record = (time.time(), type, msg, force_console)
+        if self.__closed:
+            # Late messages, eg: from a checkpoint after the crawl, are written directly
+            with self.__lock:
+                self.__write_batch([record])
+            return
+        if self.__block:
+            self.__queue.put(record)
+            return
+        try:
+            self.__queue.put_nowait(record)
+        except queue.Full:
+            with self.__lock:
+                self.__dropped += 1
+
+    def __write_loop(self):
+        while True:
+            batch = [self.__queue.get()]
+            while len(batch) < _batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _stop in batch
+            self.__write_batch([record for record in batch if record is not _stop])
+            for _ in batch:
+                self.__queue.task_done()
+            if stop:
+                return
+
+    def __write_batch(self, batch):
+        out_lines, err_lines, file_lines = [], [], []
+        for stamp, type, msg, force_console in batch:
+            colour, stream = _msg_styles[type]
+            if self.__console or force_console:
+                (out_lines if stream == "stdout" else err_lines).append(format_msg(msg, type, colour, self.__colour))
+            if self.__log_file is not None:
+                if self.__format == "jsonl":
+                    file_lines.append(json.dumps({"time": stamp, "type": type, "msg": msg}))
+                else:
+                    file_lines.append(format_msg(msg, type, colour, False))
+
+        try:
+            for lines, hfile in ((out_lines, sys.stdout), (err_lines, sys.stderr), (file_lines, self.__log_file)):
+                if len(lines) > 0:
+                    hfile.write("\n".join(lines) + "\n")
+                    hfile.flush()
+        except Exception:
+            # A broken console or a full disk must not stop the crawl
+            pass
+
+    def flush(self):
+        '''
+        Wait until every queued record is written.
+        '''
+        self.__queue.join()
+
+    def dropped(self):
+        with self.__lock:
+            return self.__dropped
+
+    def close(self):
+        '''
+        Write the pending records and stop the writer, later records are
+        written synchronously. The log file is left open.
+        '''
+        if self.__closed:
+            return
+
+        if self.dropped() > 0:
+            self.__queue.put((time.time(), "warning", str(self.dropped()) + " log records dropped", False))
+        self.__queue.put(_stop)
+        self.__writer.join()
+        self.__closed = True
+#----------ScrapperLogger-Class-Definition-END--------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
@@ -0,0 +1,355 @@
+#----------Import-Modules-START-----------------------------
+import asyncio
+import mmap
+import tempfile
+import threading
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_read_chunk_size = 64 * 1024
+_reserve_poll_interval = 0.05
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def _content_length(value):
+    return int(value) if value is not None and value.isdigit() else None
+#----------Utility-functions-END----------------------------
+
+
+#----------BodyTooLarge-Class-Definition-START--------------
+class BodyTooLarge(Exception):
+    '''
+    Raised when a response body exceeds the maximum size of its task. The
+    job is skipped, retrying it would only fetch the same body again.
+    '''
+    pass
+#----------BodyTooLarge-Class-Definition-END----------------
+
+
+#----------MemoryBudget-Class-Definition-START--------------
+class MemoryBudget:
+    '''
+    Semaphore counting the bytes of response bodies held in memory by all
+    workers. A reservation larger than the whole budget is granted once
+    nothing else is reserved. Thread-safe.
+
+    >>> budget = MemoryBudget(100)
+    >>> budget.reserve(60), budget.try_reserve(50), budget.try_reserve(40)
+    (60, False, True)
+    >>> budget.release(100); budget.reserve(500), budget.in_use(), budget.peak()
+    (100, 100, 100)
+    '''
+
+    def __init__(self, max_bytes):
+        if not isinstance(max_bytes, int) or max_bytes < 1:
+            raise ValueError("max_bytes must be a positive integer")
+        self.max_bytes = max_bytes
+        self.__in_use = 0
+        self.__peak = 0
+        self.__cv = threading.Condition()
+
+    def __take_locked(self, nbytes):
+        self.__in_use += nbytes
+        self.__peak = max(self.__peak, self.__in_use)
+
+    def reserve(self, nbytes, timeout=None):
+        '''
+        Wait until nbytes fit in the budget and reserve them, returns the
+        number of bytes reserved, 0 on timeout.
+        '''
+        nbytes = min(nbytes, self.max_bytes)
+        with self.__cv:
+            if not self.__cv.wait_for(lambda: self.__in_use + nbytes <= self.max_bytes, timeout):
+                return 0
+            self.__take_locked(nbytes)
+            return nbytes
+
+    def try_reserve(self, nbytes):
+        with self.__cv:
+            if self.__in_use + nbytes > self.max_bytes:
+                return False
+            self.__take_locked(nbytes)
+            return True
+
+    def release(self, nbytes):
+        with self.__cv:
+            self.__in_use -= nbytes
+            self.__cv.notify_all()
+
+    def in_use(self):
+        with self.__cv:
+            return self.__in_use
+
+    def peak(self):
+        with self.__cv:
+            return self.__peak
+#----------MemoryBudget-Class-Definition-END----------------
+
+
+#----------Body-Class-Definition-START----------------------
+class Body:
+    '''
+    Buffered response body, bytes or a read-only memory map of a temporary
+    file. release() gives its reservation back and unmaps it.
+    '''
+
+    def __init__(self, content, budget=None, reserved=0, hfile=None):
+        self.content = content
+        self.spilled = hfile is not None
+        self.__budget = budget
+        self.__reserved = reserved
+        self.__hfile = hfile
+
+    def release(self):
+        if self.__budget is not None and self.__reserved > 0:
+            self.__budget.release(self.__reserved)
+        self.__reserved = 0
+        if self.__hfile is not None:
+            self.content.close()
+            self.__hfile.close()
+            self.__hfile = None
+
+class _BodyReader:
+    '''
+    Accumulates the chunks of one body: in memory while they fit in the
+    bytes reserved, growing the reservation if the budget allows, and in a
+    temporary file past spill_size or once the budget is exhausted.
+    '''
+
+    def __init__(self, budget, max_size, spill_size, reserved):
+        self.__budget = budget
+        self.__max_size = max_size
+        self.__spill_size = spill_size
+        self.__reserved = reserved
+        self.__chunks = []
+        self.__size = 0
+        self.__hfile = None
+
+    def __spill(self):
+        self.__hfile = tempfile.TemporaryFile(prefix="scrapper2_body_")
+        for chunk in self.__chunks:
+            self.__hfile.write(chunk)
+        self.__chunks = []
+        if self.__budget is not None and self.__reserved > 0:
+            self.__budget.release(self.__reserved)
+        self.__reserved = 0
+
+    def add(self, chunk):
+        self.__size += len(chunk)
+        if self.__max_size is not None and self.__size > self.__max_size:
+            self.abort()
+            raise BodyTooLarge("Body exceeds " + str(self.__max_size) + " bytes")
+
+        if self.__hfile is None and self.__size > self.__reserved:
+            extra = self.__size - self.__reserved
+            if self.__size > self.__spill_size or (self.__budget is not None and not self.__budget.try_reserve(extra)):
+                self.__spill()
+            else:
+                self.__reserved += extra
+        if self.__hfile is not None:
+            self.__hfile.write(chunk)
+        else:
+            self.__chunks.append(chunk)
+
+    def finish(self):
+        if self.__hfile is None:
+            # Unused bytes of the reservation, eg: a body shorter than announced
+            if self.__budget is not None and self.__reserved > self.__size:
+                self.__budget.release(self.__reserved - self.__size)
+                self.__reserved = self.__size
+            return Body(b''.join(self.__chunks), self.__budget, self.__reserved)
+
+        self.__hfile.flush()
+        return Body(mmap.mmap(self.__hfile.fileno(), 0, access=mmap.ACCESS_READ), hfile=self.__hfile)
+
+    def abort(self):
+        self.__chunks = []
+        if self.__budget is not None and self.__reserved > 0:
+            self.__budget.release(self.__reserved)
+        self.__reserved = 0
+        if self.__hfile is not None:
+            self.__hfile.close()
+            self.__hfile = None
+#----------Body-Class-Definition-END------------------------
+
+
+#----------LimitedResponse-Class-Definition-START-----------
+class LimitedResponse:
+    '''
+    Streamed response whose body is aborted with BodyTooLarge past
+    max_size bytes. Other attributes are those of the wrapped response.
+    '''
+
+    def __init__(self, response, max_size):
+        self.__response = response
+        self.__max_size = max_size
+
+    def iter_content(self, chunk_size=1, *args, **kwargs):
+        size = 0
+        for chunk in self.__response.iter_content(chunk_size, *args, **kwargs):
+            size += len(chunk)
+            if size > self.__max_size:
+                self.__response.close()
+                raise BodyTooLarge("Body exceeds " + str(self.__max_size) + " bytes")
+            yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self.__response, name)
+#----------LimitedResponse-Class-Definition-END-------------
+
+
+#----------MemoryGovernor-Class-Definition-START------------
+class MemoryGovernor:
+    '''
+    Crawler-wide limits on response bodies:
+
+    - bodies buffered in memory reserve their size against a MemoryBudget
+      of max_bytes, from Content-Length before reading or chunk by chunk;
+    - pages over max_page_size and downloads over max_download_size bytes
+      are aborted with BodyTooLarge, from Content-Length if it is known;
+    - bodies over spill_size, or that the budget cannot hold, are written
+      to a temporary file and memory mapped instead.
+
+    Any of them may be None. Streamed downloads only hold a chunk at a time
+    and are only limited in size.
+
+    >>> import io, requests
+    >>> governor = MemoryGovernor(max_bytes=1000, max_page_size=5000, spill_size=100)
+    >>> def response(body):
+    ...     r = requests.models.Response()
+    ...     r.status_code, r.raw, r.headers["Content-Length"] = 200, io.BytesIO(body), str(len(body))
+    ...     return r
+    >>> small, large = response(b"<p>" * 10), response(b"<p>" * 1000)
+    >>> governor.buffer(small); governor.buffer(large)
+    >>> small.content[:6], isinstance(large.content, bytes), governor.in_use()
+    (b'<p><p>', False, 30)
+    >>> governor.release(small); governor.release(large); governor.in_use(), small.content
+    (0, None)
+    >>> try:
+    ...     governor.buffer(response(b"<p>" * 2000))
+    ... except BodyTooLarge as e:
+    ...     print(e)
+    Body of 6000 bytes exceeds 5000 bytes
+    '''
+
+    def __init__(self, max_bytes=None, max_page_size=None, max_download_size=None, spill_size=8 * 1024 * 1024):
+        for name, value in (("max_page_size", max_page_size), ("max_download_size", max_download_size),
+                            ("spill_size", spill_size)):
+            if value is not None and (not isinstance(value, int) or value < 1):
+                raise ValueError(name + " must be a positive integer")
+
+        self.__budget = MemoryBudget(max_bytes) if max_bytes is not None else None
+        self.__max_page_size = max_page_size
+        self.__max_download_size = max_download_size
+        self.__spill_size = spill_size if spill_size is not None else float("inf")
+        if self.__budget is not None:
+            # A body the whole budget cannot hold is never kept in memory
+            self.__spill_size = min(self.__spill_size, max_bytes)
+
+    def in_use(self):
+        return self.__budget.in_use() if self.__budget is not None else 0
+
+    def peak(self):
+        return self.__budget.peak() if self.__budget is not None else 0
+
+    def __check_length(self, content_length, max_size):
+        '''
+        Number of bytes to reserve before reading a body of content_length.
+        '''
+        if content_length is None:
+            return 0
+        if max_size is not None and content_length > max_size:
+            raise BodyTooLarge("Body of " + str(content_length) + " bytes exceeds " + str(max_size) + " bytes")
+        return content_length if content_length <= self.__spill_size else 0
+
+    def __reader(self, reserved, max_size):
+        return _BodyReader(self.__budget, max_size, self.__spill_size, reserved)
+
+    def buffer(self, response):
+        '''
+        Read the body of the streamed requests response of a page within
+        the limits, as if it had not been streamed. The Body is kept on the
+        response until release(response).
+        '''
+        try:
+            reserved = self.__check_length(_content_length(response.headers.get("Content-Length")), self.__max_page_size)
+        except BodyTooLarge:
+            response.close()
+            raise
+        if reserved > 0 and self.__budget is not None:
+            reserved = self.__budget.reserve(reserved)
+
+        reader = self.__reader(reserved, self.__max_page_size)
+        try:
+            for chunk in response.iter_content(chunk_size=_read_chunk_size):
+                reader.add(chunk)
+        except BaseException:
+            reader.abort()
+            response.close()
+            raise
+
+        body = reader.finish()
+        response._content = body.content
+        response._content_consumed = True
+        response._scrapper_body = body
+
+    async def read_async(self, response):
+        '''
+        Body of the aiohttp response of a page within the limits. The caller
+        releases it.
+        '''
+        max_size = self.__max_page_size
+        reserved = self.__check_length(response.content_length, max_size)
+        if reserved > 0 and self.__budget is not None:
+            reserved = min(reserved, self.__budget.max_bytes)
+            # Waiting on the budget must not block the event loop
+            while not self.__budget.try_reserve(reserved):
+                await asyncio.sleep(_reserve_poll_interval)
+
+        reader = self.__reader(reserved, max_size)
+        try:
+            async for chunk in response.content.iter_chunked(_read_chunk_size):
+                reader.add(chunk)
+        except BaseException:
+            reader.abort()
+            raise
+        return reader.finish()
+
+    def limit_download(self, response):
+        '''
+        response, aborted past the maximum download size while it is streamed.
+        '''
+        if self.__max_download_size is None:
+            return response
+        try:
+            self.__check_length(_content_length(response.headers.get("Content-Length")), self.__max_download_size)
+        except BodyTooLarge:
+            response.close()
+            raise
+        return LimitedResponse(response, self.__max_download_size)
+
+    def release(self, response):
+        '''
+        Release the Body of response, if any, and drop it from response
+        which may outlive its job.
+        '''
+        body = getattr(response, "_scrapper_body", None)
+        if body is not None:
+            body.release()
+            response._scrapper_body = None
+            response._content = None
+#----------MemoryGovernor-Class-Definition-END--------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
@@ -0,0 +1,315 @@
+#----------Import-Modules-START-----------------------------
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_phases = ("queue_wait", "connect", "ttfb", "transfer", "parse", "write", "iptc")
+_bucket_bounds = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+_valid_formats = ("jsonl", "prometheus")
+_top_hosts = 20
+__current = threading.local()
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def set_current_timer(timer):
+    '''
+    Attach timer to the calling thread, phase() then records into it.
+    '''
+    __current.timer = timer
+
+def get_current_timer():
+    return getattr(__current, "timer", None)
+
+@contextlib.contextmanager
+def phase(name):
+    '''
+    Time the enclosed block as phase name of the calling thread's job, if any.
+
+    >>> timer = JobTimer()
+    >>> set_current_timer(timer)
+    >>> with phase("write"):
+    ...     with phase("iptc"):
+    ...         pass
+    >>> sorted(timer.times())
+    ['iptc', 'write']
+    >>> set_current_timer(None)
+    '''
+    timer = get_current_timer()
+    if timer is None:
+        yield
+        return
+
+    timer.enter(name)
+    try:
+        yield
+    finally:
+        timer.exit()
+
+def run_timed(timer, func, *args):
+    '''
+    Call func with timer attached to the calling thread, eg: in an executor.
+    '''
+    set_current_timer(timer)
+    try:
+        return func(*args)
+    finally:
+        set_current_timer(None)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+#----------Utility-functions-END----------------------------
+
+
+#----------JobTimer-Class-Definition-START------------------
+class JobTimer:
+    '''
+    Seconds spent by one job in each phase. Phases nest and only count their
+    own time: entering a phase pauses the enclosing one.
+
+    >>> timer = JobTimer()
+    >>> timer.add("ttfb", 0.5); timer.move("ttfb", "transfer", 0.2)
+    >>> timer.times()
+    {'ttfb': 0.3, 'transfer': 0.2}
+    '''
+
+    def __init__(self):
+        self.__times = collections.defaultdict(float)
+        self.__stack = []
+        self.__stamp = 0
+        self.nbytes = 0
+
+    def enter(self, name):
+        now = time.perf_counter()
+        if len(self.__stack) > 0:
+            self.__times[self.__stack[-1]] += now - self.__stamp
+        self.__stack.append(name)
+        self.__stamp = now
+
+    def exit(self):
+        now = time.perf_counter()
+        self.__times[self.__stack.pop()] += now - self.__stamp
+        self.__stamp = now
+
+    def add(self, name, seconds):
+        self.__times[name] += max(0, seconds)
+
+    def move(self, src, dst, seconds):
+        '''
+        Reassign up to seconds of phase src to phase dst.
+        '''
+        seconds = min(max(0, seconds), self.__times[src])
+        self.__times[src] = round(self.__times[src] - seconds, 9)
+        self.__times[dst] += seconds
+
+    def get(self, name):
+        return self.__times.get(name, 0)
+
+    def times(self):
+        return dict(self.__times)
+#----------JobTimer-Class-Definition-END--------------------
+
+
+#----------TimedResponse-Class-Definition-START-------------
+class TimedResponse:
+    '''
+    Response wrapper charging the time spent waiting for body chunks to the
+    transfer phase of timer, whoever consumes them. Other attributes are
+    those of the wrapped response.
+    '''
+
+    def __init__(self, response, timer):
+        self.__response = response
+        self.__timer = timer
+
+    def iter_content(self, chunk_size=1, *args, **kwargs):
+        chunks = iter(self.__response.iter_content(chunk_size, *args, **kwargs))
+        while True:
+            self.__timer.enter("transfer")
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                self.__timer.exit()
+            self.__timer.nbytes += len(chunk)
+            yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self.__response, name)
+#----------TimedResponse-Class-Definition-END---------------
+
+
+#----------ScrapperMetrics-Class-Definition-START-----------
+class ScrapperMetrics:
+    '''
+    Thread-safe aggregate of finished jobs: a latency histogram per phase,
+    jobs by outcome, responses by status code and by host, and bytes
+    received. gauges is called on every snapshot and returns extra values,
+    eg: the size of the frontier.
+
+    >>> metrics = ScrapperMetrics(gauges=lambda: {"frontier": 3})
+    >>> timer = metrics.start_job()
+    >>> timer.add("ttfb", 0.02); timer.nbytes = 1000
+    >>> metrics.finish_job(timer, "rand.com", 200, True)
+    >>> snapshot = metrics.snapshot()
+    >>> snapshot["jobs"], snapshot["status"], snapshot["hosts"], snapshot["bytes"], snapshot["frontier"]
+    ({'done': 1}, {'200': 1}, {'rand.com': 1}, 1000, 3)
+    >>> snapshot["phases"]["ttfb"]["count"], snapshot["phases"]["ttfb"]["buckets"][2:4]
+    (1, [0, 1])
+    >>> "scrapper2_phase_seconds_bucket{phase=\\"ttfb\\",le=\\"0.05\\"} 1" in metrics.prometheus()
+    True
+    '''
+
+    def __init__(self, gauges=None):
+        self.__gauges = gauges
+        self.__lock = threading.Lock()
+        self.__start = time.perf_counter()
+
+        # Per phase: [count, total seconds, max seconds, bucket counts]
+        self.__phases = {name: [0, 0.0, 0.0, [0] * (len(_bucket_bounds) + 1)] for name in _phases}
+        self.__jobs = collections.Counter()
+        self.__status = collections.Counter()
+        self.__hosts = collections.Counter()
+        self.__bytes = 0
+
+    def start_job(self):
+        return JobTimer()
+
+    def __bucket(self, seconds):
+        for i, bound in enumerate(_bucket_bounds):
+            if seconds <= bound:
+                return i
+        return len(_bucket_bounds)
+
+    def finish_job(self, timer, host, status, success):
+        '''
+        Account for a job that got a response with status, or None if it raised.
+        '''
+        with self.__lock:
+            for name, seconds in timer.times().items():
+                entry = self.__phases.get(name)
+                if entry is None:
+                    entry = self.__phases[name] = [0, 0.0, 0.0, [0] * (len(_bucket_bounds) + 1)]
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+                entry[3][self.__bucket(seconds)] += 1
+
+            self.__jobs["done" if success else ("error" if status is None else "failed")] += 1
+            self.__status["error" if status is None else str(status)] += 1
+            self.__hosts[host] += 1
+            self.__bytes += timer.nbytes
+
+    def skip_job(self):
+        with self.__lock:
+            self.__jobs["skipped"] += 1
+
+    def snapshot(self, top_hosts=None):
+        '''
+        Current values as a dict that json.dumps accepts. Only the top_hosts
+        busiest hosts are listed if it is given.
+        '''
+        gauges = self.__gauges() if self.__gauges is not None else {}
+        with self.__lock:
+            elapsed = time.perf_counter() - self.__start
+            phases = {}
+            for name, (count, total, longest, buckets) in self.__phases.items():
+                phases[name] = {"count": count, "total": total, "mean": total / count if count > 0 else 0,
+                                "max": longest, "buckets": list(buckets)}
+            snapshot = {
+                "time": time.time(),
+                "elapsed": elapsed,
+                "jobs": dict(self.__jobs),
+                "jobs_per_second": sum(self.__jobs.values()) / elapsed if elapsed > 0 else 0,
+                "bytes": self.__bytes,
+                "bytes_per_second": self.__bytes / elapsed if elapsed > 0 else 0,
+                "phases": phases,
+                "bucket_bounds": list(_bucket_bounds),
+                "status": dict(self.__status),
+                "hosts": dict(self.__hosts.most_common(top_hosts)),
+            }
+        snapshot.update(gauges)
+        return snapshot
+
+    def progress_line(self):
+        snapshot = self.snapshot(top_hosts=0)
+        jobs = snapshot["jobs"]
+        phases = snapshot["phases"]
+        line = str(jobs.get("done", 0)) + " done, " + str(jobs.get("failed", 0) + jobs.get("error", 0)) + " failed, " + \
+               str(jobs.get("skipped", 0)) + " skipped (" + format(snapshot["jobs_per_second"], ".1f") + " jobs/s, " + \
+               format(snapshot["bytes_per_second"] / 1e6, ".2f") + " MB/s)"
+        for name in ("frontier", "in_flight", "visited", "workers", "body_bytes", "delayed", "open_hosts"):
+            if name in snapshot:
+                line += " | " + name.replace('_', ' ') + " " + str(snapshot[name])
+        line += " | mean ms:"
+        for name in _phases:
+            line += " " + name + " " + format(phases[name]["mean"] * 1000, ".1f")
+        return line
+
+    def prometheus(self):
+        '''
+        Snapshot in the Prometheus text exposition format.
+        '''
+        snapshot = self.snapshot(top_hosts=_top_hosts)
+        lines = ["# TYPE scrapper2_phase_seconds histogram"]
+        for name, entry in snapshot["phases"].items():
+            cumulative = 0
+            for bound, count in zip(snapshot["bucket_bounds"] + ["+Inf"], entry["buckets"]):
+                cumulative += count
+                lines.append('scrapper2_phase_seconds_bucket{phase="' + name + '",le="' + str(bound) + '"} ' + str(cumulative))
+            lines.append('scrapper2_phase_seconds_sum{phase="' + name + '"} ' + repr(entry["total"]))
+            lines.append('scrapper2_phase_seconds_count{phase="' + name + '"} ' + str(entry["count"]))
+
+        lines.append("# TYPE scrapper2_jobs_total counter")
+        for outcome, count in sorted(snapshot["jobs"].items()):
+            lines.append('scrapper2_jobs_total{outcome="' + outcome + '"} ' + str(count))
+        lines.append("# TYPE scrapper2_responses_total counter")
+        for status, count in sorted(snapshot["status"].items()):
+            lines.append('scrapper2_responses_total{status="' + status + '"} ' + str(count))
+        lines.append("# TYPE scrapper2_host_responses_total counter")
+        for host, count in snapshot["hosts"].items():
+            lines.append('scrapper2_host_responses_total{host="' + _escape_label(host) + '"} ' + str(count))
+        lines.append("# TYPE scrapper2_received_bytes_total counter")
+        lines.append("scrapper2_received_bytes_total " + str(snapshot["bytes"]))
+        for name in ("frontier", "in_flight", "visited", "workers", "body_bytes", "delayed", "open_hosts"):
+            if name in snapshot:
+                lines.append("# TYPE scrapper2_" + name + " gauge")
+                lines.append("scrapper2_" + name + " " + str(snapshot[name]))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filename, format="jsonl"):
+        '''
+        Append a snapshot line to a JSON lines file, or rewrite a Prometheus
+        textfile atomically so that collectors never read half of it.
+        '''
+        if format not in _valid_formats:
+            raise ValueError("format must be one of " + str(_valid_formats))
+
+        if format == "jsonl":
+            with open(filename, "a") as hfile:
+                hfile.write(json.dumps(self.snapshot(top_hosts=_top_hosts)) + "\n")
+        else:
+            tmp_filename = filename + ".tmp"
+            with open(tmp_filename, "w") as hfile:
+                hfile.write(self.prometheus())
+            os.replace(tmp_filename, filename)
+#----------ScrapperMetrics-Class-Definition-END-------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
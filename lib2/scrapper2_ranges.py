@@ -0,0 +1,235 @@
+#----------Import-Modules-START-----------------------------
+import json
+import os
+import threading
+
+import requests
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_http_OK = 200
+_http_partial_content = 206
+_part_suffix = ".part"
+_state_suffix = ".json"
+# Progress is saved every so many bytes of a segment, a restart refetches at most that much
+_save_interval = 4 * 1024 * 1024
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def parse_content_range(value):
+    '''
+    (start, end, length) of a Content-Range header, end excluded.
+
+    >>> parse_content_range("bytes 100-199/1000")
+    (100, 200, 1000)
+    >>> parse_content_range("bytes */1000") is None, parse_content_range("bytes 0-9/*") is None
+    (True, True)
+    '''
+    unit, _, spec = value.strip().partition(' ')
+    byte_range, _, length = spec.partition('/')
+    first, _, last = byte_range.partition('-')
+    if unit != "bytes" or not first.isdigit() or not last.isdigit() or not length.isdigit():
+        return None
+    return (int(first), int(last) + 1, int(length))
+
+def split_range(length, num_segments):
+    '''
+    [start, end, next] segments of about the same size covering length
+    bytes, next being the first byte not written yet.
+
+    >>> split_range(10, 3)
+    [[0, 3, 0], [3, 6, 3], [6, 10, 6]]
+    >>> split_range(2, 3)
+    [[0, 1, 0], [1, 2, 1]]
+    '''
+    num_segments = max(1, min(num_segments, length))
+    bounds = [length * i // num_segments for i in range(num_segments + 1)]
+    return [[start, end, start] for start, end in zip(bounds, bounds[1:])]
+
+def supports_ranges(response):
+    '''
+    Whether the body of response can be fetched again by byte ranges: a
+    successful requests response of known length, sent as is by a server
+    accepting ranges.
+    '''
+    if getattr(response, "connection", None) is None or getattr(response, "request", None) is None:
+        return False
+    headers = response.headers
+    return response.status_code == _http_OK and headers.get("Accept-Ranges", "").lower() == "bytes" and \
+           headers.get("Content-Length", "").isdigit() and int(headers["Content-Length"]) > 0 and \
+           headers.get("Content-Encoding", "identity").lower() == "identity"
+
+def part_filename(filename):
+    return filename + _part_suffix
+#----------Utility-functions-END----------------------------
+
+
+#----------RangedDownload-Class-Definition-START------------
+class RangedDownload:
+    '''
+    Download of the body of response, see supports_ranges, to filename
+    through filename.part. The part file and the progress of its segments,
+    kept in filename.part.json, survive failures: a later download of the
+    same unchanged content, by ETag or Last-Modified, only fetches the
+    missing bytes with Range requests.
+
+    Bodies of at least min_segment_size bytes are split into num_segments
+    segments fetched in parallel, each on its own connection, and written
+    in place into the part file. The first segment is read from response
+    itself. Requests reuse the connection pool, headers and cookies of
+    response, with timeout.
+    '''
+
+    def __init__(self, response, filename, chunk_size, num_segments=1, min_segment_size=16 * 1024 * 1024, timeout=7):
+        self.__response = response
+        self.__filename = filename
+        self.__part = part_filename(filename)
+        self.__state_filename = self.__part + _state_suffix
+        self.__chunk_size = chunk_size
+        self.__timeout = timeout
+
+        headers = response.headers
+        self.__length = int(headers["Content-Length"])
+        etag = headers.get("ETag")
+        # Weak entity tags cannot validate byte ranges
+        self.__validator = etag if etag is not None and not etag.startswith("W/") else headers.get("Last-Modified")
+
+        self.__lock = threading.Lock()
+        self.__stale = False
+        # Bytes fetched by Range requests, those of response are counted by its reader
+        self.nbytes = 0
+
+        self.__segments = self.__load_state()
+        self.resumed = self.__segments is not None
+        if self.__segments is None:
+            self.__segments = split_range(self.__length, num_segments if self.__length >= min_segment_size else 1)
+            with open(self.__part, "wb") as hfile:
+                hfile.truncate(self.__length)
+            self.__save_state()
+
+    def __load_state(self):
+        if self.__validator is None or not os.path.isfile(self.__part):
+            return None
+        try:
+            with open(self.__state_filename, "r") as hfile:
+                state = json.load(hfile)
+        except (OSError, ValueError):
+            return None
+        if state.get("validator") != self.__validator or state.get("length") != self.__length or \
+           os.path.getsize(self.__part) != self.__length:
+            return None
+        return state["segments"]
+
+    def __save_state(self):
+        with self.__lock:
+            state = {"validator": self.__validator, "length": self.__length, "segments": self.__segments}
+            tmp_filename = self.__state_filename + ".tmp"
+            with open(tmp_filename, "w") as hfile:
+                json.dump(state, hfile)
+            os.replace(tmp_filename, self.__state_filename)
+
+    def __advance(self, segment, pos):
+        '''
+        Record that the bytes of segment before pos are on disk.
+        '''
+        with self.__lock:
+            segment[2] = pos
+        self.__save_state()
+
+    def __fetch(self, segment):
+        request = self.__response.request.copy()
+        request.headers["Range"] = "bytes=" + str(segment[2]) + "-" + str(segment[1] - 1)
+        if self.__validator is not None:
+            request.headers["If-Range"] = self.__validator
+        response = self.__response.connection.send(request, stream=True, timeout=self.__timeout)
+
+        content_range = parse_content_range(response.headers.get("Content-Range", ""))
+        if response.status_code != _http_partial_content or content_range is None or \
+           content_range[0] != segment[2] or content_range[2] != self.__length:
+            response.close()
+            # The content changed or ranges are not served after all, start over next time
+            self.__stale = True
+            raise requests.exceptions.ConnectionError("Range " + request.headers["Range"] + " of " + self.__response.url +
+                                                      " refused (" + str(response.status_code) + ")")
+        return response
+
+    def __run_segment(self, segment, response, errors):
+        pos = segment[2]
+        fetched = response is None
+        try:
+            if fetched:
+                response = self.__fetch(segment)
+            with open(self.__part, "r+b") as hfile:
+                hfile.seek(pos)
+                for chunk in response.iter_content(chunk_size=self.__chunk_size):
+                    chunk = chunk[:segment[1] - pos]
+                    hfile.write(chunk)
+                    pos += len(chunk)
+                    if fetched:
+                        with self.__lock:
+                            self.nbytes += len(chunk)
+                    if pos >= segment[1]:
+                        break
+                    if pos - segment[2] >= _save_interval:
+                        hfile.flush()
+                        self.__advance(segment, pos)
+            if pos < segment[1]:
+                # Reported like a failed request, so that the job is retried and the host's breaker counts it
+                raise requests.exceptions.ChunkedEncodingError("Connection closed at byte " + str(pos) + " of " + self.__response.url)
+        except Exception as e:
+            with self.__lock:
+                errors.append(e)
+        finally:
+            if response is not None:
+                response.close()
+            self.__advance(segment, pos)
+
+    def run(self):
+        '''
+        Fetch the missing bytes and rename the part file to filename. On
+        failure the progress is saved and the first error raised.
+        '''
+        pending = [segment for segment in self.__segments if segment[2] < segment[1]]
+        # response streams the body from its first byte
+        first = pending[0] if len(pending) > 0 and pending[0][2] == 0 else None
+        errors = []
+
+        threads = [threading.Thread(target=self.__run_segment, args=(segment, None, errors), daemon=True)
+                   for segment in pending if segment is not first]
+        for thread in threads:
+            thread.start()
+        if first is not None:
+            self.__run_segment(first, self.__response, errors)
+        else:
+            self.__response.close()
+        for thread in threads:
+            thread.join()
+
+        if self.__stale:
+            self.discard()
+        if len(errors) > 0:
+            raise errors[0]
+
+        os.replace(self.__part, self.__filename)
+        os.remove(self.__state_filename)
+        return True
+
+    def discard(self):
+        for filename in (self.__part, self.__state_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+#----------RangedDownload-Class-Definition-END--------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
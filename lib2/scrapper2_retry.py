@@ -0,0 +1,274 @@
+#----------Import-Modules-START-----------------------------
+import email.utils
+import heapq
+import random
+import time
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_http_too_many_requests = 429
+_http_service_unavailable = 503
+_http_server_error = 500
+_closed = "closed"
+_open = "open"
+_half_open = "half-open"
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def retry_after(value, now=None):
+    '''
+    Seconds to wait from a Retry-After header, a number of seconds or an
+    HTTP date, None if it is missing or malformed.
+
+    >>> retry_after("120"), retry_after(None), retry_after("soon")
+    (120.0, None, None)
+    >>> retry_after("Thu, 01 Jan 1970 00:01:00 GMT", now=30)
+    30.0
+    '''
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date is None:
+        return None
+    return max(0.0, date.timestamp() - (time.time() if now is None else now))
+
+def backoff_delay(attempt, base, max_delay, rand=random.random):
+    '''
+    Delay before retry number attempt, counted from 1: base doubled on each
+    attempt up to max_delay, of which a random half is waited, so that jobs
+    failing together are not retried together.
+
+    >>> backoff_delay(1, 1, 60, rand=lambda: 0), backoff_delay(3, 1, 60, rand=lambda: 1)
+    (0.5, 4.0)
+    >>> backoff_delay(10, 1, 60, rand=lambda: 1)
+    60.0
+    '''
+    delay = min(max_delay, base * 2.0 ** (attempt - 1))
+    return delay / 2 + rand() * delay / 2
+
+def is_host_failure(status):
+    '''
+    Whether status, None for a request that raised, says that the host is
+    failing or overloaded rather than that the job is wrong.
+
+    >>> is_host_failure(None), is_host_failure(429), is_host_failure(503), is_host_failure(404)
+    (True, True, True, False)
+    '''
+    return status is None or status == _http_too_many_requests or status >= _http_server_error
+#----------Utility-functions-END----------------------------
+
+
+#----------CircuitBreaker-Class-Definition-START------------
+class CircuitBreaker:
+    '''
+    Health of one host. After threshold failures in a row, or at once on a
+    429 or a Retry-After, the breaker opens and the host is paused for
+    cooldown seconds, doubled every time it opens again up to max_cooldown.
+    Retry-After is honoured up to max_cooldown. Then a single probe job is
+    let through: its success closes the breaker, its failure opens it
+    again. A probe that reports nothing for probe_timeout seconds is
+    replaced. Not synchronized, ScrapperJobs serializes access.
+
+    >>> breaker = CircuitBreaker(threshold=2, cooldown=10, max_cooldown=60)
+    >>> breaker.record(503, None, now=0), breaker.check(0)
+    (False, 0)
+    >>> breaker.record(None, None, now=1), breaker.state, breaker.check(5)
+    (False, 'open', 6)
+    >>> breaker.check(11), breaker.state, breaker.check(12)
+    (0, 'half-open', 29)
+    >>> breaker.record(500, None, now=13), breaker.check(13)
+    (True, 20)
+    >>> breaker.check(33), breaker.record(200, None, now=34), breaker.state
+    (0, True, 'closed')
+    >>> breaker.record(429, "5", now=40), breaker.check(40)
+    (False, 5.0)
+    '''
+
+    def __init__(self, threshold=5, cooldown=10, max_cooldown=300, probe_timeout=30):
+        self.__threshold = threshold
+        self.__cooldown = cooldown
+        self.__max_cooldown = max_cooldown
+        self.__probe_timeout = probe_timeout
+        self.state = _closed
+        self.__failures = 0
+        self.__trips = 0
+        self.__until = 0
+
+    def __open(self, seconds, now):
+        if self.state != _open:
+            # A half-open breaker's deadline is the probe's
+            self.__until = now
+        self.state = _open
+        self.__until = max(self.__until, now + min(seconds, self.__max_cooldown))
+
+    def check(self, now):
+        '''
+        Seconds until the host may be tried, 0 if it may be now. The first
+        caller after the pause gets 0 and its job is the probe.
+        '''
+        if self.state == _closed:
+            return 0
+        if now < self.__until:
+            return self.__until - now
+        # Open and due, or a lost probe
+        self.state = _half_open
+        self.__until = now + self.__probe_timeout
+        return 0
+
+    def record(self, status, retry_after_value, now):
+        '''
+        Account for a response with status, None for a request that raised.
+        Returns True if the host was paused, the jobs waiting for it are to
+        be checked again: the probe closed or reopened the breaker.
+        '''
+        paused = self.state != _closed
+        if not is_host_failure(status):
+            self.state = _closed
+            self.__failures = 0
+            self.__trips = 0
+            self.__until = 0
+            return paused
+
+        self.__failures += 1
+        wait = retry_after(retry_after_value, time.time()) \
+               if status in (_http_too_many_requests, _http_service_unavailable) else None
+        if wait is not None:
+            self.__open(wait, now)
+        elif self.state == _half_open or status == _http_too_many_requests or \
+             (self.state == _closed and self.__failures >= self.__threshold):
+            self.__open(self.__cooldown * 2 ** self.__trips, now)
+            self.__trips += 1
+        return paused
+#----------CircuitBreaker-Class-Definition-END--------------
+
+
+#----------HostBreakers-Class-Definition-START--------------
+class HostBreakers:
+    '''
+    A CircuitBreaker per host, hosts that never failed cost nothing. Not
+    synchronized, ScrapperJobs serializes access.
+
+    >>> breakers = HostBreakers(threshold=2, cooldown=10)
+    >>> breakers.record("a.com", None, None, now=0), breakers.check("a.com", 0)
+    (False, 0)
+    >>> breakers.record("a.com", 502, None, now=0), breakers.check("a.com", 0), breakers.check("b.com", 0)
+    (False, 10, 0)
+    >>> breakers.open_hosts(), breakers.record("a.com", 200, None, now=1), len(breakers)
+    (1, True, 0)
+    '''
+
+    def __init__(self, threshold=5, cooldown=10, max_cooldown=300, probe_timeout=30):
+        self.__args = (threshold, cooldown, max_cooldown, probe_timeout)
+        self.__breakers = {}
+
+    def check(self, host, now):
+        breaker = self.__breakers.get(host)
+        return breaker.check(now) if breaker is not None else 0
+
+    def record(self, host, status, retry_after_value, now):
+        breaker = self.__breakers.get(host)
+        if breaker is None:
+            if not is_host_failure(status):
+                return False
+            breaker = self.__breakers[host] = CircuitBreaker(*self.__args)
+
+        closed = breaker.record(status, retry_after_value, now)
+        if not is_host_failure(status):
+            del self.__breakers[host]
+        return closed
+
+    def open_hosts(self):
+        return sum(1 for breaker in self.__breakers.values() if breaker.state != _closed)
+
+    def __len__(self):
+        return len(self.__breakers)
+#----------HostBreakers-Class-Definition-END----------------
+
+
+#----------DelayedJobs-Class-Definition-START---------------
+class DelayedJobs:
+    '''
+    Jobs waiting for a time before going back to the frontier: retries
+    waiting out their backoff, and jobs parked while their host is paused,
+    which release_host() frees early. Not synchronized, ScrapperJobs
+    serializes access.
+
+    >>> delayed = DelayedJobs()
+    >>> delayed.push(("http://a.com/1", "visit", 0, 0), 5, now=0)
+    >>> delayed.push(("http://b.com/1", "visit", 0, 0), 9, host="b.com", now=0)
+    >>> delayed.pop_ready(4), delayed.ready_in(4)
+    ([], 1)
+    >>> delayed.release_host("b.com", now=4); delayed.pop_ready(4), len(delayed)
+    ([('http://b.com/1', 'visit', 0, 0)], 1)
+    '''
+
+    def __init__(self):
+        self.__heap = []
+        self.__seq = 0
+
+    def push(self, entry, delay, host=None, now=None):
+        '''
+        Delay entry by delay seconds, parked on host if it is given.
+        '''
+        now = time.monotonic() if now is None else now
+        heapq.heappush(self.__heap, (now + delay, self.__seq, host, entry))
+        self.__seq += 1
+
+    def pop_ready(self, now=None):
+        '''
+        Entries that are due, in the order they became due.
+        '''
+        now = time.monotonic() if now is None else now
+        ready = []
+        while len(self.__heap) > 0 and self.__heap[0][0] <= now:
+            ready.append(heapq.heappop(self.__heap)[3])
+        return ready
+
+    def ready_in(self, now=None):
+        '''
+        Seconds until the next entry is due, None if there are none.
+        '''
+        if len(self.__heap) == 0:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0, self.__heap[0][0] - now)
+
+    def release_host(self, host, now=None):
+        '''
+        Make the entries parked on host due now.
+        '''
+        now = time.monotonic() if now is None else now
+        released = False
+        for i, (due, seq, parked_host, entry) in enumerate(self.__heap):
+            if parked_host == host and due > now:
+                self.__heap[i] = (now, seq, None, entry)
+                released = True
+        if released:
+            heapq.heapify(self.__heap)
+
+    def entries(self):
+        return [entry for _, _, _, entry in sorted(self.__heap)]
+
+    def __len__(self):
+        return len(self.__heap)
+#----------DelayedJobs-Class-Definition-END-----------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
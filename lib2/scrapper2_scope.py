@@ -0,0 +1,272 @@
+#----------Import-Modules-START-----------------------------
+import functools
+import re
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_actions = ("allow", "deny")
+_kinds = ("domain", "prefix", "regex")
+# "auto" leaves the task to the extension lists of the visit template
+_tasks = ("auto", "visit", "download", "both")
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def split_url(url):
+    '''
+    Host and path of an absolute URL, without user info, port, query or
+    fragment. Cheaper than urlsplit for the canonical URLs scopes see.
+
+    >>> split_url("http://me@Rand.com:8080/a/b.html?x=1#top")
+    ('rand.com', '/a/b.html')
+    >>> split_url("https://rand.com?x=1")
+    ('rand.com', '/')
+    '''
+    _, _, rest = url.partition("://")
+    end = len(rest)
+    for sep in "/?#":
+        i = rest.find(sep, 0, end)
+        if i != -1:
+            end = i
+    netloc = rest[:end]
+    path = rest[end:]
+    for sep in "?#":
+        i = path.find(sep)
+        if i != -1:
+            path = path[:i]
+
+    host = netloc.rpartition('@')[2]
+    if host.startswith('['):
+        host = host[:host.find(']') + 1]
+    else:
+        host = host.partition(':')[0]
+    return host.lower(), path if path != '' else '/'
+
+def _segments(host, path):
+    return [host] + [segment for segment in path.split('/') if segment != '']
+
+def _wildcard(name):
+    return re.escape(name).replace(r"\*", ".*")
+
+def load_scope_rules(filename, cache_size=4096):
+    '''
+    Compile the ScopeRules written in filename, see ScopeRules.parse.
+    '''
+    with open(filename, "r") as hfile:
+        return ScopeRules.parse(hfile, cache_size=cache_size)
+#----------Utility-functions-END----------------------------
+
+
+#----------ScopeRules-Class-Definition-START----------------
+class ScopeRules:
+    '''
+    Compiled crawl scope, deciding which found links become jobs and with
+    which task. Rules are (action, kind, pattern, task) with action "allow"
+    or "deny" and kind:
+
+    - "domain": the host or any of its subdomains, eg: "rand.com";
+    - "prefix": host and leading path segments, eg: "rand.com/gallery";
+    - "regex": a regular expression searched in the whole URL.
+
+    A link matched by any deny rule is out of scope. Otherwise, if there are
+    allow rules, the most specific matching one gives its task: the longest
+    prefix, then the longest domain, then the first regex. A link matched
+    by none is out of scope. task is "visit", "download", "both", or "auto"
+    to pick it from the extension of the link. Query parameters named in
+    strip_params, "*" being a wildcard, are removed first.
+
+    Domains and prefixes are looked up in hash tables and a segment trie,
+    regexes of a task are joined into one, and decisions are kept in an
+    LRU cache of cache_size entries. Thread-safe.
+
+    >>> scope = ScopeRules([("allow", "domain", "rand.com", "auto"),
+    ...                     ("allow", "prefix", "rand.com/media", "download"),
+    ...                     ("deny", "domain", "ads.rand.com", None),
+    ...                     ("deny", "regex", r"/private/", None),
+    ...                     ("allow", "regex", r"\\.cdn\\.net/.*\\.jpg$", "download")],
+    ...                    strip_params=["utm_*", "sid"])
+    >>> scope.match("http://www.rand.com/a.html?utm_source=x&page=2&sid=9")
+    ('http://www.rand.com/a.html?page=2', 'auto')
+    >>> scope.match("http://rand.com/media/clip")
+    ('http://rand.com/media/clip', 'download')
+    >>> scope.match("http://ads.rand.com/a.html"), scope.match("http://rand.com/private/a.html")
+    (None, None)
+    >>> scope.match("http://other.com/a.html"), scope.match("http://img.cdn.net/a.jpg")
+    (None, ('http://img.cdn.net/a.jpg', 'download'))
+    >>> import pickle; pickle.loads(pickle.dumps(scope)).match("http://ads.rand.com/a.html")
+    '''
+
+    def __init__(self, rules, strip_params=(), cache_size=4096):
+        self.__domains = {"allow": {}, "deny": {}}
+        self.__tries = {"allow": {}, "deny": {}}
+        allow_regexes = {}
+        deny_regexes = []
+
+        for action, kind, pattern, task in rules:
+            if action not in _actions:
+                raise ValueError("Unknown scope action " + repr(action))
+            if kind not in _kinds:
+                raise ValueError("Unknown scope rule kind " + repr(kind))
+            if action == "allow" and task not in _tasks:
+                raise ValueError("Unknown scope task " + repr(task))
+
+            if kind == "domain":
+                # The first rule of a domain wins
+                self.__domains[action].setdefault(pattern.lower().strip('.'), task)
+            elif kind == "prefix":
+                host, _, path = pattern.partition('/')
+                node = self.__tries[action]
+                for segment in _segments(host.lower(), '/' + path):
+                    node = node.setdefault(segment, {})
+                node.setdefault(None, task)
+            else:
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise ValueError("Bad scope regex " + repr(pattern) + ": " + str(e))
+                if action == "allow":
+                    allow_regexes.setdefault(task, []).append(pattern)
+                else:
+                    deny_regexes.append(pattern)
+
+        self.__has_allow = len(self.__domains["allow"]) > 0 or len(self.__tries["allow"]) > 0 or len(allow_regexes) > 0
+        self.__deny_regex = re.compile('|'.join("(?:" + p + ")" for p in deny_regexes)) if len(deny_regexes) > 0 else None
+        self.__allow_regexes = [(re.compile('|'.join("(?:" + p + ")" for p in patterns)), task)
+                                for task, patterns in allow_regexes.items()]
+
+        strip_params = list(strip_params)
+        self.__strip = re.compile('|'.join(_wildcard(name) for name in strip_params)) if len(strip_params) > 0 else None
+        self.__cache_size = cache_size
+        self.__cached_match = functools.lru_cache(maxsize=cache_size)(self.__match)
+
+    def __getstate__(self):
+        # Pickled for the parse worker processes, which start with an empty cache
+        state = self.__dict__.copy()
+        del state["_ScopeRules__cached_match"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__cached_match = functools.lru_cache(maxsize=self.__cache_size)(self.__match)
+
+    @classmethod
+    def parse(cls, lines, cache_size=4096):
+        '''
+        Compile rules written one per line, lines starting with "#" being
+        comments:
+
+            allow <domain|prefix|regex> <pattern> [visit|download|both|auto]
+            deny <domain|prefix|regex> <pattern>
+            strip <param> [<param>...]
+
+        >>> scope = ScopeRules.parse(["# Stay home", "allow domain rand.com", "strip utm_*"])
+        >>> scope.match("http://rand.com/a.html?utm_medium=x")
+        ('http://rand.com/a.html', 'auto')
+        >>> ScopeRules.parse(["allow host rand.com"])
+        Traceback (most recent call last):
+        ...
+        ValueError: Line 1: Unknown scope rule kind 'host'
+        '''
+        rules = []
+        strip_params = []
+        for number, line in enumerate(lines, 1):
+            words = line.split()
+            if len(words) == 0 or words[0].startswith('#'):
+                continue
+            try:
+                if words[0] == "strip":
+                    if len(words) < 2:
+                        raise ValueError("strip needs parameter names")
+                    strip_params.extend(words[1:])
+                    continue
+                if len(words) < 3 or len(words) > 4 or (words[0] == "deny" and len(words) > 3):
+                    raise ValueError("Expected <action> <kind> <pattern> [task]")
+                task = (words[3] if len(words) == 4 else "auto") if words[0] == "allow" else None
+                rule = (words[0], words[1], words[2], task)
+                # Validated one by one for the line number
+                cls([rule])
+                rules.append(rule)
+            except ValueError as e:
+                raise ValueError("Line " + str(number) + ": " + str(e))
+
+        return cls(rules, strip_params, cache_size)
+
+    def __lookup_domain(self, action, host):
+        domains = self.__domains[action]
+        if len(domains) == 0:
+            return (-1, None)
+        while True:
+            task = domains.get(host)
+            if task is not None or host in domains:
+                return (host.count('.') + 1, task)
+            dot = host.find('.')
+            if dot == -1:
+                return (-1, None)
+            host = host[dot + 1:]
+
+    def __lookup_prefix(self, action, host, path):
+        node = self.__tries[action]
+        if len(node) == 0:
+            return (-1, None)
+        depth, task = -1, None
+        for i, segment in enumerate(_segments(host, path)):
+            node = node.get(segment)
+            if node is None:
+                break
+            if None in node:
+                depth, task = i, node[None]
+        return (depth, task)
+
+    def __strip_query(self, url):
+        base, _, query = url.partition('?')
+        query, hash, fragment = query.partition('#')
+        params = [param for param in query.split('&')
+                  if param != '' and self.__strip.fullmatch(param.partition('=')[0]) is None]
+        url = base + ('?' + '&'.join(params) if len(params) > 0 else '')
+        return url + hash + fragment
+
+    def __match(self, url):
+        if self.__strip is not None and '?' in url:
+            url = self.__strip_query(url)
+
+        host, path = split_url(url)
+        if self.__lookup_domain("deny", host)[0] >= 0 or self.__lookup_prefix("deny", host, path)[0] >= 0 or \
+           (self.__deny_regex is not None and self.__deny_regex.search(url) is not None):
+            return None
+        if not self.__has_allow:
+            return (url, "auto")
+
+        depth, task = self.__lookup_prefix("allow", host, path)
+        if depth >= 0:
+            return (url, task)
+        depth, task = self.__lookup_domain("allow", host)
+        if depth >= 0:
+            return (url, task)
+        for regex, task in self.__allow_regexes:
+            if regex.search(url) is not None:
+                return (url, task)
+        return None
+
+    def match(self, url):
+        '''
+        (url, task) of an in scope url, with its query parameters stripped,
+        None if it is out of scope.
+        '''
+        return self.__cached_match(url)
+
+    def cache_info(self):
+        return self.__cached_match.cache_info()
+#----------ScopeRules-Class-Definition-END------------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
@@ -0,0 +1,203 @@
+#----------Import-Modules-START-----------------------------
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+
+from lib2.scrapper2_visited import url_fingerprint
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_valid_link_modes = ("hard", "symlink")
+_fingerprint_offset = 1 << 63
+#----------Global-Variables-END-----------------------------
+
+
+#----------ContentStore-Class-Definition-START--------------
+class ContentStore:
+    '''
+    Content-addressed store for downloads. Each distinct content is kept once
+    as <root>/.blobs/<xx>/<sha256>, and download paths are hard links (or
+    symlinks) to their blob. An index maps URL fingerprints and
+    (ETag, Content-Length) pairs to digests, so that known content is linked
+    without being transferred again. Thread-safe.
+
+    >>> import tempfile
+    >>> root = tempfile.mkdtemp()
+    >>> store = ContentStore(root)
+    >>> class Response:
+    ...     headers = {"ETag": '"x"', "Content-Length": "5"}
+    ...     def iter_content(self, chunk_size):
+    ...         yield b"hello"
+    >>> store.store(os.path.join(root, "a", "1.jpg"), "http://a.com/1.jpg", Response(), 1024)
+    True
+    >>> store.store(os.path.join(root, "b", "1.jpg"), "http://b.com/1.jpg?x=1", Response(), 1024)
+    False
+    >>> store.link_known(os.path.join(root, "a", "2.jpg"), "http://a.com/1.jpg")
+    True
+    >>> os.stat(os.path.join(root, "b", "1.jpg")).st_ino == os.stat(os.path.join(root, "a", "2.jpg")).st_ino
+    True
+    >>> os.path.samefile(store.blob_filename("http://b.com/1.jpg?x=1"), os.path.join(root, "a", "1.jpg"))
+    True
+    >>> store.num_blobs()
+    1
+    '''
+
+    def __init__(self, root, link="hard"):
+        if link not in _valid_link_modes:
+            raise ValueError("link must be one of " + str(_valid_link_modes))
+
+        self.__root = root
+        self.__blobs = os.path.join(root, ".blobs")
+        self.__link = link
+        os.makedirs(self.__blobs, exist_ok=True)
+
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(os.path.join(self.__blobs, "index.db"), check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS urls (fingerprint INTEGER PRIMARY KEY, digest BLOB) WITHOUT ROWID")
+        self.__db.execute("CREATE TABLE IF NOT EXISTS validators (etag TEXT, length INTEGER, digest BLOB, "
+                          "PRIMARY KEY (etag, length)) WITHOUT ROWID")
+        self.__db.commit()
+
+    def __blob_filename(self, digest):
+        hex_digest = digest.hex()
+        return os.path.join(self.__blobs, hex_digest[:2], hex_digest)
+
+    def __url_key(self, url):
+        # SQLite integers are signed
+        return url_fingerprint(url) - _fingerprint_offset
+
+    def __known_digest(self, url, response=None):
+        with self.__lock:
+            row = self.__db.execute("SELECT digest FROM urls WHERE fingerprint = ?", (self.__url_key(url),)).fetchone()
+            if row is None and response is not None:
+                etag, length = self.__validators(response)
+                if etag is not None:
+                    row = self.__db.execute("SELECT digest FROM validators WHERE etag = ? AND length = ?",
+                                            (etag, length)).fetchone()
+
+        if row is None or not os.path.isfile(self.__blob_filename(row[0])):
+            return None
+        return row[0]
+
+    def __validators(self, response):
+        '''
+        (ETag, Content-Length) of response, (None, None) unless both are there
+        and the ETag is strong. Weak ETags do not identify the bytes.
+        '''
+        etag, length = response.headers.get("ETag"), response.headers.get("Content-Length")
+        if etag is None or length is None or etag.startswith("W/") or not length.isdigit():
+            return None, None
+        return etag, int(length)
+
+    def __remember(self, url, response, digest):
+        etag, length = self.__validators(response)
+        with self.__lock:
+            self.__db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (self.__url_key(url), digest))
+            if etag is not None:
+                self.__db.execute("INSERT OR REPLACE INTO validators VALUES (?, ?, ?)", (etag, length, digest))
+            self.__db.commit()
+
+    def __link_blob(self, filename, digest):
+        if os.path.lexists(filename):
+            return
+
+        dirname = os.path.dirname(filename)
+        if dirname != "":
+            os.makedirs(dirname, exist_ok=True)
+
+        blob_filename = self.__blob_filename(digest)
+        if self.__link == "hard":
+            try:
+                os.link(blob_filename, filename)
+                return
+            except OSError:
+                # eg: the download directory spans several file systems
+                pass
+        os.symlink(os.path.relpath(blob_filename, dirname if dirname != "" else "."), filename)
+
+    def link_known(self, filename, url):
+        '''
+        Link filename to the content already stored for url, returns False if there is none.
+        '''
+        digest = self.__known_digest(url)
+        if digest is None:
+            return False
+
+        self.__link_blob(filename, digest)
+        return True
+
+    def blob_filename(self, url):
+        '''
+        File of the content stored for url, None if there is none.
+        '''
+        digest = self.__known_digest(url)
+        return self.__blob_filename(digest) if digest is not None else None
+
+    def store(self, filename, url, response, chunk_size, prepare=None):
+        '''
+        Link filename to the content of response, streaming and hashing the
+        body only if neither url nor its validators are known. prepare is
+        called on the file of new content before it becomes a blob.
+
+        Returns True if the content was new.
+        '''
+        digest = self.__known_digest(url, response)
+        if digest is not None:
+            self.__remember(url, response, digest)
+            self.__link_blob(filename, digest)
+            return False
+
+        hasher = hashlib.sha256()
+        fd, tmp_filename = tempfile.mkstemp(suffix=".tmp", dir=self.__blobs)
+        try:
+            with os.fdopen(fd, 'wb') as hfile:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        hasher.update(chunk)
+                        hfile.write(chunk)
+
+            digest = hasher.digest()
+            blob_filename = self.__blob_filename(digest)
+            os.makedirs(os.path.dirname(blob_filename), exist_ok=True)
+
+            new = not os.path.isfile(blob_filename)
+            if new:
+                if prepare is not None:
+                    prepare(tmp_filename)
+                os.replace(tmp_filename, blob_filename)
+            else:
+                os.remove(tmp_filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+        self.__remember(url, response, digest)
+        self.__link_blob(filename, digest)
+        return new
+
+    def num_blobs(self):
+        with self.__lock:
+            return self.__db.execute("SELECT COUNT(DISTINCT digest) FROM urls").fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+#----------ContentStore-Class-Definition-END----------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
@@ -1,20 +1,41 @@
 #----------Import-Modules-START-----------------------------
+import codecs
 import os
 import posixpath
 import pyexiv2
+import shutil
 import urllib.parse
 import threading
-
-from bs4 import BeautifulSoup
+import tempfile
+import contextlib
+
+import lib2.scrapper2_links as links
+import lib2.scrapper2_visited as visited
+import lib2.scrapper2_metrics as metrics
+from lib2.scrapper2_canon import UrlCanonicalizer
+from lib2.scrapper2_ranges import RangedDownload, supports_ranges
+from lib2.scrapper2_iptc import IptcWriter, supports_iptc
 #----------Import-Modules-END-------------------------------
 
 
 #----------Global-Variables-START---------------------------
 __std_links_to_visit = [".html"]
 __std_links_to_download = [".jpg", ".png", ".jpeg", ".mp4", ".wmv", ".avi"]
-__std_chunk_size = 1024
-__visited_links = set()
+__std_link_tags = (("a", "href"), ("img", "src"), ("source", "src"), ("video", "src"))
+__std_link_extractor = links.bytes_extract_links
+__std_default_encoding = "utf-8"
+__std_canonicalizer = UrlCanonicalizer()
+__std_scope = None
+__std_chunk_size = 256 * 1024
+__std_segments = 1
+__std_segment_threshold = 16 * 1024 * 1024
+__std_range_timeout = 7
+__visited_links = visited.VisitedStore()
+__std_content_store = None
+__std_iptc_workers = 1
+__std_iptc_writer = None
 __file_lock = threading.Lock()
+__path_locks = {}
 #----------Global-Variables-END-----------------------------
 
 
@@ -99,6 +120,189 @@ def format_url_with_resolution(url, base_url):
         new_url = format_previous_directory(new_url)
 
     return new_url
+
+@contextlib.contextmanager
+def path_lock(path):
+    '''
+    Lock that is only shared by writers of the same path.
+    '''
+    with __file_lock:
+        entry = __path_locks.get(path)
+        if entry is None:
+            entry = __path_locks[path] = [threading.Lock(), 0]
+        entry[1] += 1
+
+    entry[0].acquire()
+    try:
+        yield
+    finally:
+        entry[0].release()
+        with __file_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del __path_locks[path]
+
+def write_chunks_atomic(filename, chunks):
+    '''
+    Write chunks to a temporary file next to filename, then rename it into place.
+    filename never holds a partially written file.
+    '''
+    dirname = os.path.dirname(filename)
+    fd, tmp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', suffix=".tmp",
+                                        dir=dirname if dirname != "" else None)
+    try:
+        with os.fdopen(fd, 'wb') as hfile:
+            for chunk in chunks:
+                if chunk:
+                    hfile.write(chunk)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+def set_std_link_extractor(name):
+    '''
+    Select the link extractor backend of std_parse_template, "stream", "bs4" or "bytes".
+    '''
+    global __std_link_extractor
+    __std_link_extractor = links.get_link_extractor(name)
+
+def set_std_default_encoding(encoding):
+    '''
+    Set the encoding of pages whose headers and <meta> tags declare none.
+    '''
+    global __std_default_encoding
+    codecs.lookup(encoding)
+    __std_default_encoding = encoding
+
+def std_encoding(request):
+    '''
+    Encoding of the page in request, see links.html_encoding.
+    '''
+    return links.html_encoding(request.content, request.headers.get("Content-Type"), __std_default_encoding)
+
+def set_std_canonicalizer(canonicalizer):
+    '''
+    Replace the UrlCanonicalizer resolving the links found by std_parse_template,
+    eg: with one that keeps fragments or query order.
+    '''
+    global __std_canonicalizer
+    __std_canonicalizer = canonicalizer
+
+def get_std_canonicalizer():
+    return __std_canonicalizer
+
+def set_std_scope(scope):
+    '''
+    Only turn the links of std_parse_template that a ScopeRules matches
+    into jobs, None keeps every link with a known extension.
+    '''
+    global __std_scope
+    __std_scope = scope
+
+def get_std_scope():
+    return __std_scope
+
+def get_std_parse_settings():
+    '''
+    The settings std_parse depends on, to be passed to set_std_parse_settings
+    in a parse worker process: without fork, it does not inherit them.
+    '''
+    return (__std_links_to_visit, __std_links_to_download, __std_link_tags, __std_link_extractor,
+            __std_canonicalizer, __std_scope)
+
+def set_std_parse_settings(settings):
+    '''
+    Apply the settings of get_std_parse_settings, the initializer of the
+    parse worker processes.
+
+    >>> from lib2.scrapper2_scope import ScopeRules
+    >>> settings = get_std_parse_settings()
+    >>> set_std_scope(ScopeRules([("allow", "domain", "rand.com", "auto")]))
+    >>> len(std_parse(b'<a href="http://other.com/a.html">', "utf-8", "http://rand.com/", 0))
+    0
+    >>> set_std_parse_settings(settings)
+    >>> len(std_parse(b'<a href="http://other.com/a.html">', "utf-8", "http://rand.com/", 0))
+    1
+    '''
+    global __std_links_to_visit, __std_links_to_download, __std_link_tags, __std_link_extractor
+    global __std_canonicalizer, __std_scope
+    (__std_links_to_visit, __std_links_to_download, __std_link_tags, __std_link_extractor,
+     __std_canonicalizer, __std_scope) = settings
+
+def set_visited_store(store):
+    '''
+    Replace the store of visited links, eg: with a BloomVisitedStore or a
+    store loaded from disk. Must be called before the Scrapper is created.
+    '''
+    global __visited_links
+    __visited_links = store
+
+def get_visited_store():
+    return __visited_links
+
+def set_std_chunk_size(chunk_size):
+    '''
+    Set the number of bytes std_download reads from the network at a time.
+    '''
+    global __std_chunk_size
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    __std_chunk_size = chunk_size
+
+def set_std_segments(num_segments, threshold=16 * 1024 * 1024, timeout=7):
+    '''
+    Split the downloads of std_download of at least threshold bytes into
+    num_segments Range requests made in parallel, with timeout. Only the
+    responses of the thread engine support ranges, the async engine streams
+    each download whole and cannot resume it.
+    '''
+    global __std_segments, __std_segment_threshold, __std_range_timeout
+    if not isinstance(num_segments, int) or num_segments < 1:
+        raise ValueError("num_segments must be a positive integer")
+    if not isinstance(threshold, int) or threshold < 1:
+        raise ValueError("threshold must be a positive integer")
+    __std_segments = num_segments
+    __std_segment_threshold = threshold
+    __std_range_timeout = timeout
+
+def set_std_content_store(store):
+    '''
+    Deduplicate the files of std_download through a ContentStore, None
+    writes every download as a plain file.
+    '''
+    global __std_content_store
+    __std_content_store = store
+
+def get_std_content_store():
+    return __std_content_store
+
+def set_std_iptc_workers(num_workers):
+    '''
+    Set the number of threads std_download hands IPTC tagging to. Must be
+    called before the first download.
+    '''
+    global __std_iptc_workers
+    if not isinstance(num_workers, int) or num_workers < 1:
+        raise ValueError("num_workers must be a positive integer")
+    __std_iptc_workers = num_workers
+
+def std_iptc_writer():
+    global __std_iptc_writer
+    with __file_lock:
+        if __std_iptc_writer is None:
+            __std_iptc_writer = IptcWriter(std_write_iptc, __std_iptc_workers)
+        return __std_iptc_writer
+
+def flush_std_iptc():
+    '''
+    Wait for the IPTC tagging queued by std_download, returns the
+    (filename, error) of the files that could not be tagged.
+    '''
+    with __file_lock:
+        writer = __std_iptc_writer
+    return writer.flush() if writer is not None else []
 #----------Utility-functions-END----------------------------
 
 
@@ -106,31 +310,57 @@ def format_url_with_resolution(url, base_url):
 def std_preprocess(root_jobs):
     for url, _, _ in root_jobs:
         __visited_links.add(url)
+        # Links are compared in canonical form
+        canonical_url = __std_canonicalizer.canonicalize(url)
+        if canonical_url is not None:
+            __visited_links.add(canonical_url)
 
 def std_visit(request, base_url, id, jobs):
     return std_visit_template(request, request.url, id, jobs, __std_links_to_visit, __std_links_to_download)
 
 def std_visit_template(request, base_url, id, jobs, links_to_visit, links_to_download):
-    new_urls = []
-
-    #--------std_process-Utilities-START-------------
-    def find_and_add_url(tag, attr, soup):
-        for div in soup.find_all(tag):
-            new_url = format_url_with_resolution(div.get(attr), base_url)
-            if new_url is not None and new_url not in __visited_links:
-                __visited_links.add(new_url)
-                new_urls.append(new_url)
-    #--------std_process-Utilities-START-------------
+    jobs.clear()
+    # The raw bytes are parsed, request.text could run charset detection over the whole page
+    jobs.extend(std_unvisited(std_parse_template(request.content, std_encoding(request), base_url, id,
+                                                 links_to_visit, links_to_download)))
+    return True
 
-    soup = BeautifulSoup(request.text.replace('\n', '').replace('\r', ''), "html.parser")
+def std_parse(content, encoding, base_url, id):
+    return std_parse_template(content, encoding, base_url, id, __std_links_to_visit, __std_links_to_download)
 
-    find_and_add_url("a", "href", soup)
-    find_and_add_url("img", "src", soup)
-    find_and_add_url("source", "src", soup)
-    find_and_add_url("video", "src", soup)
+def std_parse_template(content, encoding, base_url, id, links_to_visit, links_to_download):
+    '''
+    Extract the jobs linked from a page without consulting the visited links.
 
-    jobs.clear()
-    for new_url in new_urls:
+    Only depends on its arguments, so that it can run in a worker process.
+    content may be the raw bytes of the page, decoded with encoding by the
+    link extractor.
+    '''
+    new_urls = []
+    seen_urls = set()
+
+    resolve = __std_canonicalizer.resolver(base_url)
+    scope = __std_scope
+    for link in __std_link_extractor(content, __std_link_tags, encoding):
+        new_url = resolve(link)
+        if new_url is None:
+            continue
+        task = "auto"
+        if scope is not None:
+            # Out of scope links are dropped before they take any memory
+            in_scope = scope.match(new_url)
+            if in_scope is None:
+                continue
+            new_url, task = in_scope
+        if new_url not in seen_urls:
+            seen_urls.add(new_url)
+            new_urls.append((new_url, task))
+
+    jobs = []
+    for new_url, task in new_urls:
+        if task != "auto":
+            jobs.append((new_url, task, 0))
+            continue
         _, ext = os.path.splitext(new_url)
         # "both" is not used here
         if ext in links_to_visit:
@@ -139,9 +369,20 @@ def std_visit_template(request, base_url, id, jobs, links_to_visit, links_to_dow
         elif ext in links_to_download:
             jobs.append((new_url, "download", 0))
 
-    return True
+    return jobs
 
-def std_download(request, url, id, iptc_tags):
+def std_unvisited(jobs):
+    '''
+    Keep the jobs whose URL has not been visited yet and mark them as visited.
+    '''
+    new_jobs = []
+    for job in jobs:
+        if __visited_links.add(job[0]):
+            new_jobs.append(job)
+
+    return new_jobs
+
+def std_download_filename(url):
     url_info = urllib.parse.urlsplit(url)
 
     path = url_info.path
@@ -149,25 +390,72 @@ def std_download(request, url, id, iptc_tags):
         path = path[1:]
 
     filename = os.path.join(url_info.netloc, path)
-    filename = os.path.join("scrapper2_download", filename)
+    return os.path.join("scrapper2_download", filename)
 
-    dirname = os.path.dirname(filename)
+def std_skip(url, task, id):
+    '''
+    Downloads whose file already exists, or whose content is already in the
+    content store, are skipped before any request is made.
+    '''
+    if task != "download":
+        return False
+
+    filename = std_download_filename(url)
+    if os.path.isfile(filename):
+        return True
+    if __std_content_store is not None:
+        with path_lock(filename):
+            return __std_content_store.link_known(filename, url)
+    return False
 
-    # synchronize file operations
-    __file_lock.acquire()
-    if dirname != "" and not os.path.exists(dirname):
-        os.makedirs(dirname)
+def std_no_skip(url, task, id):
+    '''
+    Skip callback of custom download callbacks, whose files std_skip does not know.
+    '''
+    return False
 
-    if not os.path.isfile(filename):
-        hfile = open(filename, 'wb')
-        for chunk in request.iter_content(chunk_size=__std_chunk_size):
-            if chunk:
-                hfile.write(chunk)
-        hfile.close()
+def std_download(request, url, id, iptc_tags):
+    filename = std_download_filename(url)
 
-    __file_lock.release()
+    dirname = os.path.dirname(filename)
+    if dirname != "":
+        os.makedirs(dirname, exist_ok=True)
+
+    tag = len(iptc_tags) > 0 and supports_iptc(filename)
+    if __std_content_store is not None:
+        with path_lock(filename):
+            new = __std_content_store.store(filename, url, request, __std_chunk_size)
+        # Metadata is written once per blob, by the IPTC writer threads, and reaches every link to it. The blob
+        # keeps the name given by the digest of the downloaded bytes, which identifies the source rather than
+        # the tagged content
+        if new and tag:
+            std_iptc_writer().submit(__std_content_store.blob_filename(url), iptc_tags, filename)
+        return True
+
+    # Only writers of this very file are serialized, the body is streamed to disk
+    with path_lock(filename):
+        if os.path.isfile(filename):
+            return True
+        if supports_ranges(request):
+            # Bytes are kept in a part file across failures, a retry only fetches the rest
+            download = RangedDownload(request, filename, __std_chunk_size, __std_segments, __std_segment_threshold,
+                                      __std_range_timeout)
+            try:
+                download.run()
+            finally:
+                timer = metrics.get_current_timer()
+                if timer is not None:
+                    timer.nbytes += download.nbytes
+        else:
+            write_chunks_atomic(filename, request.iter_content(chunk_size=__std_chunk_size))
+
+    # Tagging rewrites the file, which is left to the IPTC writer threads
+    if tag:
+        std_iptc_writer().submit(filename, iptc_tags)
 
-    # Write metadata
+    return True
+
+def _write_iptc_tags(filename, iptc_tags):
     meta = pyexiv2.ImageMetadata(filename)
     meta.read()
 
@@ -176,7 +464,34 @@ def std_download(request, url, id, iptc_tags):
 
     meta.write()
 
-    return True
+def std_write_iptc(filename, iptc_tags):
+    '''
+    Write iptc_tags to filename. A file with several hard links, eg: a content
+    store blob, is tagged through a copy written back in place, as exiv2 may
+    replace the file it writes and so unlink it from its other paths.
+    '''
+    with metrics.phase("iptc"):
+        if os.stat(filename).st_nlink <= 1:
+            _write_iptc_tags(filename, iptc_tags)
+            return
+
+        fd, tmp_filename = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(filename) or None)
+        os.close(fd)
+        try:
+            shutil.copyfile(filename, tmp_filename)
+            _write_iptc_tags(tmp_filename, iptc_tags)
+            with open(tmp_filename, "rb") as src, open(filename, "r+b") as dst:
+                shutil.copyfileobj(src, dst)
+                dst.truncate()
+        finally:
+            os.remove(tmp_filename)
+
+def std_priority(url, task, id, depth):
+    '''
+    Sort key of a job in PRIORITY traversal, the smallest key runs first.
+    Higher ids come first, then downloads before visits, then shallower jobs.
+    '''
+    return (-id, task == "visit", depth)
 
 def std_modify_header(header, url, task, id):
     pass
@@ -52,6 +52,15 @@ def post_msg(msg, type="info", end='\n', file=sys.stdout, colour="white", en_col
     valid colours: "black", "red", "green", "yellow", "blue", "purple"
                    "cyan", "white"
     '''
+    print(format_msg(msg, type, colour, en_colour), end=end, file=file, flush=True)
+
+def format_msg(msg, type="info", colour="white", en_colour=True):
+    '''
+    The line post_msg prints, without its end.
+
+    >>> format_msg("hello", type="warning", en_colour=False)
+    'scrapper2 warning     : hello'
+    '''
     type = "generic" if type not in __standard_msg_types else type
     if en_colour:
         colour = "white" if colour not in __standard_msg_colour else colour
@@ -64,7 +73,7 @@ def post_msg(msg, type="info", end='\n', file=sys.stdout, colour="white", en_col
 
     begin_format = colour_format + "scrapper2 " + type.ljust(12) + ": "
 
-    print(begin_format + msg + reset_format, end=end, file=file, flush=True)
+    return begin_format + msg + reset_format
 
 def post_info(info_msg, file=sys.stdout, en_colour=True):
     '''
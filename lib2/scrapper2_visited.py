@@ -0,0 +1,270 @@
+#----------Import-Modules-START-----------------------------
+import array
+import hashlib
+import math
+import os
+import struct
+import threading
+#----------Import-Modules-END-------------------------------
+
+
+#----------Global-Variables-START---------------------------
+_store_magic = b"SCV1"
+_table_kind = b'T'
+_bloom_kind = b'B'
+_min_table_size = 1024
+#----------Global-Variables-END-----------------------------
+
+
+#----------Utility-functions-START--------------------------
+def url_fingerprint(url):
+    '''
+    Non-zero 64 bit fingerprint of url, zero marks an empty table slot.
+
+    >>> url_fingerprint("http://rand.com/a") == url_fingerprint("http://rand.com/a")
+    True
+    >>> url_fingerprint("http://rand.com/a") == url_fingerprint("http://rand.com/b")
+    False
+    >>> url_fingerprint("http://rand.com/a") > 0
+    True
+    '''
+    fp = int.from_bytes(hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+    return fp if fp != 0 else 1
+
+def load_visited_store(filename):
+    '''
+    Load a store written by VisitedStore.save or BloomVisitedStore.save.
+
+    >>> import tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), "visited.bin")
+    >>> for store in (VisitedStore(), BloomVisitedStore(capacity=100)):
+    ...     _ = store.add("http://rand.com/a")
+    ...     store.save(filename)
+    ...     loaded = load_visited_store(filename)
+    ...     print(type(loaded).__name__, len(loaded), "http://rand.com/a" in loaded, "http://rand.com/b" in loaded)
+    VisitedStore 1 True False
+    BloomVisitedStore 1 True False
+    '''
+    with open(filename, "rb") as hfile:
+        magic, kind = hfile.read(4), hfile.read(1)
+        if magic != _store_magic:
+            raise ValueError(filename + " is not a visited store")
+        if kind == _table_kind:
+            return VisitedStore._from_file(hfile)
+        if kind == _bloom_kind:
+            return BloomVisitedStore._from_file(hfile)
+        raise ValueError(filename + " has an unknown visited store kind")
+
+def _write_atomic(filename, header, data):
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as hfile:
+        hfile.write(header)
+        hfile.write(data)
+    os.replace(tmp_filename, filename)
+#----------Utility-functions-END----------------------------
+
+
+#----------VisitedStore-Class-Definition-START--------------
+class VisitedStore:
+    '''
+    Thread-safe set of visited URLs, stored as 64 bit fingerprints in an
+    open addressing table backed by an array. Two URLs sharing a fingerprint
+    are treated as the same URL.
+
+    >>> store = VisitedStore()
+    >>> store.add("http://rand.com/a")
+    True
+    >>> store.add("http://rand.com/a")
+    False
+    >>> "http://rand.com/a" in store, "http://rand.com/b" in store
+    (True, False)
+    >>> for i in range(5000):
+    ...     _ = store.add("http://rand.com/" + str(i))
+    >>> len(store), "http://rand.com/4999" in store
+    (5001, True)
+    '''
+
+    def __init__(self, capacity=_min_table_size):
+        size = _min_table_size
+        while size < 2 * capacity:
+            size *= 2
+
+        self.__table = array.array('Q', bytes(8 * size))
+        self.__mask = size - 1
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+    def __find_slot(self, fp):
+        table, mask = self.__table, self.__mask
+        i = fp & mask
+        while table[i] != 0 and table[i] != fp:
+            i = (i + 1) & mask
+        return i
+
+    def __grow(self):
+        old_table = self.__table
+        self.__table = array.array('Q', bytes(16 * len(old_table)))
+        self.__mask = len(self.__table) - 1
+        for fp in old_table:
+            if fp != 0:
+                self.__table[self.__find_slot(fp)] = fp
+
+    def add(self, url):
+        '''
+        Mark url as visited, returns False if it already was.
+        '''
+        fp = url_fingerprint(url)
+        with self.__lock:
+            i = self.__find_slot(fp)
+            if self.__table[i] == fp:
+                return False
+
+            self.__table[i] = fp
+            self.__count += 1
+            # Keep the load factor at or below one half
+            if 2 * self.__count > len(self.__table):
+                self.__grow()
+            return True
+
+    def __contains__(self, url):
+        fp = url_fingerprint(url)
+        with self.__lock:
+            return self.__table[self.__find_slot(fp)] == fp
+
+    def __len__(self):
+        with self.__lock:
+            return self.__count
+
+    def nbytes(self):
+        with self.__lock:
+            return len(self.__table) * self.__table.itemsize
+
+    def save(self, filename):
+        with self.__lock:
+            header = _store_magic + _table_kind + struct.pack("<QQ", self.__count, len(self.__table))
+            _write_atomic(filename, header, self.__table.tobytes())
+
+    @classmethod
+    def _from_file(cls, hfile):
+        count, size = struct.unpack("<QQ", hfile.read(16))
+        store = cls()
+        store.__table = array.array('Q')
+        store.__table.frombytes(hfile.read(8 * size))
+        if len(store.__table) != size:
+            raise ValueError("Truncated visited store")
+        store.__mask = size - 1
+        store.__count = count
+        return store
+#----------VisitedStore-Class-Definition-END----------------
+
+
+#----------BloomVisitedStore-Class-Definition-START---------
+class BloomVisitedStore:
+    '''
+    Thread-safe Bloom filter of visited URLs. An unvisited URL is reported as
+    visited with probability about error_rate once capacity URLs are added,
+    and is then never crawled. max_bytes caps the size of the filter, which
+    raises the actual error rate if it is too small for capacity.
+
+    >>> store = BloomVisitedStore(capacity=1000, error_rate=0.01)
+    >>> store.add("http://rand.com/a"), store.add("http://rand.com/a")
+    (True, False)
+    >>> "http://rand.com/a" in store
+    True
+    >>> store.nbytes(), store.num_hashes()
+    (1199, 7)
+    >>> BloomVisitedStore(capacity=1000, error_rate=0.01, max_bytes=600).nbytes()
+    600
+    '''
+
+    def __init__(self, capacity=1000000, error_rate=0.001, max_bytes=None):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate within (0, 1)")
+
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        if max_bytes is not None:
+            num_bits = max(8, min(num_bits, 8 * max_bytes))
+        num_bytes = (num_bits + 7) // 8
+
+        self.__bits = bytearray(num_bytes)
+        self.__num_bits = 8 * num_bytes
+        self.__num_hashes = max(1, int(round(self.__num_bits / capacity * math.log(2))))
+        self.__capacity = capacity
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+    def __positions(self, url):
+        digest = hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.__num_bits for i in range(self.__num_hashes)]
+
+    def add(self, url):
+        '''
+        Mark url as visited, returns False if it (probably) already was.
+        '''
+        positions = self.__positions(url)
+        with self.__lock:
+            bits = self.__bits
+            new = False
+            for pos in positions:
+                mask = 1 << (pos & 7)
+                if not bits[pos >> 3] & mask:
+                    bits[pos >> 3] |= mask
+                    new = True
+            if new:
+                self.__count += 1
+            return new
+
+    def __contains__(self, url):
+        positions = self.__positions(url)
+        with self.__lock:
+            return all(self.__bits[pos >> 3] & (1 << (pos & 7)) for pos in positions)
+
+    def __len__(self):
+        with self.__lock:
+            return self.__count
+
+    def nbytes(self):
+        return len(self.__bits)
+
+    def num_hashes(self):
+        return self.__num_hashes
+
+    def error_rate(self):
+        '''
+        Expected false positive rate at the current number of URLs.
+        '''
+        with self.__lock:
+            return (1 - math.exp(-self.__num_hashes * self.__count / self.__num_bits)) ** self.__num_hashes
+
+    def save(self, filename):
+        with self.__lock:
+            header = _store_magic + _bloom_kind + struct.pack("<QQQ", self.__num_bits, self.__num_hashes, self.__count)
+            header += struct.pack("<Q", self.__capacity)
+            _write_atomic(filename, header, bytes(self.__bits))
+
+    @classmethod
+    def _from_file(cls, hfile):
+        num_bits, num_hashes, count, capacity = struct.unpack("<QQQQ", hfile.read(32))
+        store = cls(capacity=capacity, max_bytes=1)
+        store.__bits = bytearray(hfile.read(num_bits // 8))
+        if 8 * len(store.__bits) != num_bits:
+            raise ValueError("Truncated visited store")
+        store.__num_bits = num_bits
+        store.__num_hashes = num_hashes
+        store.__count = count
+        return store
+#----------BloomVisitedStore-Class-Definition-END-----------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    import colorama.initialise; colorama.initialise.init()
+    from lib2.scrapper2_utils import *
+
+    post_info("Running doctests...")
+    import doctest
+    if doctest.testmod()[0] == 0:
+        post_success("All tests passed")
+#----------Main-END-----------------------------------------
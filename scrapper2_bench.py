@@ -0,0 +1,435 @@
+#----------Import-Modules-START-----------------------------
+import scrapper2
+
+import argparse
+import http.server
+import json
+import os
+import random
+import requests
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+#----------Import-Modules-END-------------------------------
+
+
+#----------Synthetic-Site-START-----------------------------
+class SyntheticServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Large backlog so that high concurrency levels do not hit SYN retries
+    request_queue_size = 1024
+
+class SyntheticSite:
+    '''
+    Generated website shaped as a complete tree of html pages.
+
+    Page n links to pages n*fanout+1 .. n*fanout+fanout, to images_per_page
+    images and to videos_per_page videos, and is padded to at least
+    page_size bytes. Every response is delayed by latency seconds and is a
+    503 with probability error_rate.
+    '''
+
+    def __init__(self, fanout=4, depth=3, images_per_page=2, image_size=4096, latency=0.0, page_size=0,
+                 videos_per_page=0, video_size=1024 * 1024, error_rate=0.0, seed=0):
+        self.fanout = fanout
+        self.depth = depth
+        self.images_per_page = images_per_page
+        self.image_size = image_size
+        self.latency = latency
+        self.page_size = page_size
+        self.videos_per_page = videos_per_page
+        self.video_size = video_size
+        self.error_rate = error_rate
+        self.num_pages = sum(fanout ** d for d in range(depth + 1))
+
+        self.stats_lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.pages_sent = 0
+        self.errors_sent = 0
+        self.bytes_sent = 0
+
+    def params(self):
+        return {"fanout": self.fanout, "depth": self.depth, "images_per_page": self.images_per_page,
+                "image_size": self.image_size, "latency": self.latency, "page_size": self.page_size,
+                "videos_per_page": self.videos_per_page, "video_size": self.video_size,
+                "error_rate": self.error_rate}
+
+    def page(self, n):
+        links = []
+        for child in range(n * self.fanout + 1, n * self.fanout + self.fanout + 1):
+            if child < self.num_pages:
+                links.append('<a href="/page/' + str(child) + '.html">page ' + str(child) + '</a>')
+        for k in range(self.images_per_page):
+            links.append('<img src="/img/' + str(n) + '_' + str(k) + '.jpg">')
+        for k in range(self.videos_per_page):
+            links.append('<video src="/video/' + str(n) + '_' + str(k) + '.mp4"></video>')
+        body = "<html><head><title>page " + str(n) + "</title></head><body>\n" + "\n".join(links) + "\n"
+        filler = "<p>filler text of a synthetic page</p>\n"
+        if len(body) < self.page_size:
+            body += filler * ((self.page_size - len(body)) // len(filler) + 1)
+        return (body + "</body></html>\n").encode("utf-8")
+
+    def large_page(self, num_links):
+        '''
+        Link heavy page with a mix of visited and downloaded links and filler markup.
+        '''
+        parts = ["<html><head><title>large page</title></head><body>\n"]
+        for i in range(num_links):
+            parts.append('<div class="item"><p>item ' + str(i) + ' with some filler text</p>\n')
+            if i % 3 == 0:
+                parts.append('<img src="../img/' + str(i) + '.jpg" alt="image ' + str(i) + '">\n')
+            elif i % 3 == 1:
+                parts.append('<video src="/video/' + str(i) + '.mp4"><source src="/video/' + str(i) + '.avi"></video>\n')
+            else:
+                parts.append('<a href="./page/' + str(i) + '.html?ref=' + str(i % 7) + '">page ' + str(i) + '</a>\n')
+            parts.append('</div>\n')
+        parts.append("</body></html>\n")
+        return "".join(parts)
+
+    def image(self):
+        return b'\xff' * self.image_size
+
+    def video(self):
+        return b'\x00' * self.video_size
+
+    def make_handler(self):
+        site = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes, Nagle would hold the body for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if site.latency > 0:
+                    time.sleep(site.latency)
+
+                with site.stats_lock:
+                    site.requests += 1
+                    failed = site.error_rate > 0 and site.random.random() < site.error_rate
+                    if failed:
+                        site.errors_sent += 1
+                if failed:
+                    self.send_error(503)
+                    return
+
+                body = None
+                if self.path.startswith("/page/") and self.path.endswith(".html"):
+                    try:
+                        n = int(self.path[len("/page/"):-len(".html")])
+                    except ValueError:
+                        n = -1
+                    if 0 <= n < site.num_pages:
+                        body, ctype = site.page(n), "text/html; charset=utf-8"
+                elif self.path.startswith("/img/"):
+                    body, ctype = site.image(), "image/jpeg"
+                elif self.path.startswith("/video/"):
+                    body, ctype = site.video(), "video/mp4"
+
+                if body is None:
+                    self.send_error(404)
+                    return
+
+                # The site never changes, so the path is a valid entity tag
+                etag = '"' + self.path + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+                with site.stats_lock:
+                    site.bytes_sent += len(body)
+                    if ctype.startswith("text/html"):
+                        site.pages_sent += 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def serve(self):
+        '''
+        Start serving on an ephemeral localhost port, returns the server.
+        '''
+        server = SyntheticServer(("127.0.0.1", 0), self.make_handler())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+#----------Synthetic-Site-END-------------------------------
+
+
+#----------Benchmarks-START---------------------------------
+def count_download(request, url, id, iptc_tags):
+    for chunk in request.iter_content(chunk_size=65536):
+        pass
+    return True
+
+def run_crawl(site, num_threads, traversal="DFS", engine="thread"):
+    '''
+    Crawl a freshly served copy of site, returns (elapsed seconds, number of requests).
+
+    Every run gets its own port, so the URLs never collide with the visited
+    links of a previous run in the same process.
+    '''
+    server = site.serve()
+    root = "http://127.0.0.1:" + str(server.server_address[1]) + "/page/0.html"
+    try:
+        scrapper = scrapper2.Scrapper([(root, "visit", 0)], traversal=traversal, num_threads=num_threads,
+                                      silent=True, log=False, engine=engine)
+        scrapper.set_download_func(count_download)
+
+        start_time = time.perf_counter()
+        scrapper.start()
+        scrapper.wait()
+        elapsed_time = time.perf_counter() - start_time
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return elapsed_time, site.num_pages * (1 + site.images_per_page)
+
+def bench_parse(site, num_links, repeat):
+    page = site.large_page(num_links)
+    base_url = "http://127.0.0.1/dir/large.html"
+    scrapper2.post_info("Page: " + str(len(page)) + " characters, " + str(num_links) + " items")
+
+    results = {}
+    for backend in ("bs4", "stream", "bytes"):
+        scrapper2.templates.set_std_link_extractor(backend)
+        content = page.encode("utf-8") if backend == "bytes" else page
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            jobs = scrapper2.templates.std_parse_template(content, "utf-8", base_url, 0, [".html"], [".jpg", ".mp4", ".avi"])
+        elapsed_time = (time.perf_counter() - start_time) / repeat
+        results[backend] = jobs
+        scrapper2.post_success(backend.ljust(6) + ("%10.2f ms/page %8.2f MB/s" % (elapsed_time * 1000, len(page) / elapsed_time / 1e6)))
+
+    scrapper2.templates.set_std_link_extractor("bytes")
+    if results["bs4"] != results["stream"] or results["bytes"] != results["stream"]:
+        scrapper2.post_failure("Backends disagree on the extracted jobs")
+
+def bench_decode(site, num_links, repeat):
+    '''
+    Visit a large page served without a declared charset, through
+    request.text as the visit function used to, then from the raw bytes.
+    '''
+    # Some non ASCII text, which charset detection has to look at
+    page = site.large_page(num_links).replace("filler text", "texte de remplissage d\u00e9j\u00e0 vu").encode("utf-8")
+    base_url = "http://127.0.0.1/dir/large.html"
+    response = requests.models.Response()
+    response.status_code, response.url, response._content = 200, base_url, page
+    scrapper2.post_info("Page: " + str(len(page)) + " bytes without charset, " + str(num_links) + " items")
+
+    def visit(name):
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            # What std_visit_template parsed before and after, without the visited links
+            if name == "text":
+                jobs = scrapper2.templates.std_parse_template(response.text, response.encoding, base_url, 0, [".html"], [".jpg", ".mp4", ".avi"])
+            else:
+                jobs = scrapper2.templates.std_parse_template(response.content, scrapper2.templates.std_encoding(response), base_url, 0,
+                                                              [".html"], [".jpg", ".mp4", ".avi"])
+        elapsed_time = (time.perf_counter() - start_time) / repeat
+        scrapper2.post_success(name.ljust(14) + ("%10.2f ms/page %8.2f MB/s" % (elapsed_time * 1000, len(page) / elapsed_time / 1e6)))
+        return jobs
+
+    scrapper2.templates.set_std_link_extractor("stream")
+    results = {"text": visit("text")}
+    for backend in ("stream", "bytes"):
+        scrapper2.templates.set_std_link_extractor(backend)
+        results[backend] = visit("bytes+" + backend)
+
+    scrapper2.templates.set_std_link_extractor("bytes")
+    if any(jobs != results["text"] for jobs in results.values()):
+        scrapper2.post_failure("Visits disagree on the extracted jobs")
+
+def bench_canon(site, num_links, repeat):
+    '''
+    Resolve the links of a large page with format_url_with_resolution and
+    with a UrlCanonicalizer, cold and with the cache filled by a sibling page.
+    '''
+    page = site.large_page(num_links)
+    hrefs = list(scrapper2.templates.links.stream_extract_links(page, (("a", "href"), ("img", "src"), ("source", "src"))))
+    base_url = "http://127.0.0.1/dir/large.html"
+    scrapper2.post_info("Page: " + str(len(hrefs)) + " links")
+
+    def report(name, elapsed_time):
+        scrapper2.post_success(name.ljust(10) + ("%10.2f ms/page %10.2f us/link" % (elapsed_time * 1000, elapsed_time / len(hrefs) * 1e6)))
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        legacy = [scrapper2.templates.format_url_with_resolution(href, base_url) for href in hrefs]
+    report("legacy", (time.perf_counter() - start_time) / repeat)
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        resolve = scrapper2.UrlCanonicalizer(cache_size=len(hrefs)).resolver(base_url)
+        canonical = [resolve(href) for href in hrefs]
+    report("cold", (time.perf_counter() - start_time) / repeat)
+
+    canonicalizer = scrapper2.UrlCanonicalizer(cache_size=len(hrefs))
+    resolve = canonicalizer.resolver("http://127.0.0.1/dir/sibling.html")
+    for href in hrefs:
+        resolve(href)
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        resolve = canonicalizer.resolver(base_url)
+        canonical = [resolve(href) for href in hrefs]
+    report("warm", (time.perf_counter() - start_time) / repeat)
+
+    # Both sort the same links, the canonical ones only differ by their sorted queries
+    different = sum(1 for old, new in zip(legacy, canonical) if old != new and old.split('?')[0] != new.split('?')[0])
+    if different > 0:
+        scrapper2.post_failure(str(different) + " links resolve to different paths")
+
+def _crawl_main(argv):
+    '''
+    Body of a matrix cell, run in a fresh process so that its peak RSS is its own.
+    Prints the results as JSON.
+    '''
+    root, num_threads, traversal, engine, write = argv[0], int(argv[1]), argv[2], argv[3], argv[4] == "write"
+    # Downloads land in a scratch directory
+    with tempfile.TemporaryDirectory(prefix="scrapper2_bench_") as dirname:
+        os.chdir(dirname)
+        scrapper = scrapper2.Scrapper([(root, "visit", 0)], traversal=traversal, num_threads=num_threads,
+                                      silent=True, log=False, engine=engine)
+        if not write:
+            scrapper.set_download_func(count_download)
+
+        start_time = time.perf_counter()
+        scrapper.start()
+        scrapper.wait()
+        elapsed_time = time.perf_counter() - start_time
+        os.chdir(os.path.dirname(dirname))
+
+    snapshot = scrapper.metrics()
+    print(json.dumps({"elapsed": elapsed_time, "jobs": snapshot["jobs"],
+                      "phases": {name: entry["mean"] for name, entry in snapshot["phases"].items()},
+                      # kilobytes on Linux
+                      "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+
+def run_cell(site, root, num_threads, traversal, engine, write):
+    pages_sent, bytes_sent = site.pages_sent, site.bytes_sent
+    output = subprocess.run([sys.executable, "-c", "import scrapper2_bench, sys; scrapper2_bench._crawl_main(sys.argv[1:])",
+                             root, str(num_threads), traversal, engine, "write" if write else "count"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["pages_per_second"] = (site.pages_sent - pages_sent) / result["elapsed"]
+    result["mb_per_second"] = (site.bytes_sent - bytes_sent) / result["elapsed"] / 1e6
+    return result
+
+def bench_matrix(site, concurrency, traversals, engine, write, save_baseline=None, baseline=None, tolerance=0.1):
+    '''
+    Crawl site once per (traversal, thread count) and report throughput,
+    peak RSS and mean phase timings, optionally saving or comparing them
+    with a baseline file.
+    '''
+    scrapper2.post_info("Site: " + json.dumps(site.params()))
+    expected = None
+    if baseline is not None:
+        with open(baseline) as hfile:
+            expected = json.load(hfile)
+        if expected["site"] != site.params():
+            scrapper2.post_warning("The baseline was measured on a different site: " + json.dumps(expected["site"]))
+
+    server = site.serve()
+    root = "http://127.0.0.1:" + str(server.server_address[1]) + "/page/0.html"
+    results = {}
+    regressions = 0
+    try:
+        for traversal in traversals:
+            for n in concurrency:
+                key = traversal + " n=" + str(n)
+                result = results[key] = run_cell(site, root, n, traversal, engine, write)
+                phases = result["phases"]
+                scrapper2.post_success(key.ljust(14) + ("%8.1f pages/s %8.2f MB/s %8.1f MB peak RSS" %
+                                                       (result["pages_per_second"], result["mb_per_second"], result["peak_rss"] / 1e6)) +
+                                       " | mean ms: " + " ".join(name + " " + format(phases[name] * 1000, ".1f")
+                                                                 for name in ("ttfb", "transfer", "parse", "write")))
+
+                previous = expected["results"].get(key) if expected is not None else None
+                if previous is not None:
+                    slower = result["pages_per_second"] < previous["pages_per_second"] * (1 - tolerance)
+                    larger = result["peak_rss"] > previous["peak_rss"] * (1 + tolerance)
+                    change = ("%+.1f%% pages/s, %+.1f%% peak RSS" %
+                              (100 * (result["pages_per_second"] / previous["pages_per_second"] - 1),
+                               100 * (result["peak_rss"] / previous["peak_rss"] - 1)))
+                    if slower or larger:
+                        regressions += 1
+                        scrapper2.post_failure("    regression against baseline: " + change)
+                    else:
+                        scrapper2.post_info("    against baseline: " + change)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if save_baseline is not None:
+        with open(save_baseline, "w") as hfile:
+            json.dump({"site": site.params(), "engine": engine, "results": results}, hfile, indent=1)
+        scrapper2.post_info("Baseline saved to " + save_baseline)
+
+    return regressions
+
+def bench_engines(site, concurrency):
+    scrapper2.post_info("Site: " + str(site.num_pages) + " pages, " + str(site.images_per_page) +
+                        " images per page, " + str(site.latency) + "s latency")
+    for n in concurrency:
+        for engine in ("thread", "async"):
+            elapsed_time, num_requests = run_crawl(site, n, engine=engine)
+            scrapper2.post_success(engine.ljust(6) + " n=" + str(n).ljust(5) +
+                                   ("%8.2f s %10.1f req/s" % (elapsed_time, num_requests / elapsed_time)))
+#----------Benchmarks-END-----------------------------------
+
+
+#----------Main-START---------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for scrapper2.")
+
+    parser.add_argument("benchmark", choices=["engines", "parse", "decode", "canon", "matrix"], help="Benchmark to run")
+    parser.add_argument("-n", "--num_threads", action="store", metavar="<num>", nargs='+', default=[8, 64], type=int, required=False, help="Concurrency levels to compare")
+    parser.add_argument("--fanout", action="store", metavar="<num>", default=4, type=int, required=False, help="Links to child pages per page")
+    parser.add_argument("--depth", action="store", metavar="<num>", default=4, type=int, required=False, help="Depth of the page tree")
+    parser.add_argument("--images", action="store", metavar="<num>", default=2, type=int, required=False, help="Images per page")
+    parser.add_argument("--image_size", action="store", metavar="<bytes>", default=4096, type=int, required=False, help="Size of each image")
+    parser.add_argument("--links", action="store", metavar="<num>", default=20000, type=int, required=False, help="Items on the page of the parse and canon benchmarks")
+    parser.add_argument("--repeat", action="store", metavar="<num>", default=5, type=int, required=False, help="Repetitions of the parse and canon benchmarks")
+    parser.add_argument("--latency", action="store", metavar="<seconds>", default=0.05, type=float, required=False, help="Injected latency per response")
+    parser.add_argument("--page_size", action="store", metavar="<bytes>", default=0, type=int, required=False, help="Minimum size of each page")
+    parser.add_argument("--videos", action="store", metavar="<num>", default=0, type=int, required=False, help="Videos per page")
+    parser.add_argument("--video_size", action="store", metavar="<bytes>", default=1024 * 1024, type=int, required=False, help="Size of each video")
+    parser.add_argument("--error_rate", action="store", metavar="<ratio>", default=0.0, type=float, required=False, help="Fraction of responses that are 503 errors")
+    parser.add_argument("-t", "--traversal", action="store", metavar="<mode>", nargs='+', default=["DFS", "BFS"], type=str, required=False, choices=["DFS", "BFS", "PRIORITY"], help="Traversal modes of the matrix benchmark")
+    parser.add_argument("-e", "--engine", action="store", default="thread", type=str, required=False, choices=["thread", "async"], help="Engine of the matrix benchmark")
+    parser.add_argument("--no_write", action="store_true", required=False, help="Count downloaded bytes instead of writing files with std_download")
+    parser.add_argument("--save_baseline", action="store", metavar="<file>", default=None, type=str, required=False, help="Save the matrix results to <file>")
+    parser.add_argument("--baseline", action="store", metavar="<file>", default=None, type=str, required=False, help="Compare the matrix results with <file>")
+    parser.add_argument("--tolerance", action="store", metavar="<ratio>", default=0.1, type=float, required=False, help="Relative slowdown or memory growth reported as a regression")
+
+    args = parser.parse_args()
+    site = SyntheticSite(args.fanout, args.depth, args.images, args.image_size, args.latency, args.page_size,
+                         args.videos, args.video_size, args.error_rate)
+
+    if args.benchmark == "engines":
+        bench_engines(site, args.num_threads)
+    elif args.benchmark == "parse":
+        bench_parse(site, args.links, args.repeat)
+    elif args.benchmark == "decode":
+        bench_decode(site, args.links, args.repeat)
+    elif args.benchmark == "canon":
+        bench_canon(site, args.links, args.repeat)
+    elif args.benchmark == "matrix":
+        regressions = bench_matrix(site, args.num_threads, args.traversal, args.engine, not args.no_write,
+                                   args.save_baseline, args.baseline, args.tolerance)
+        sys.exit(1 if regressions > 0 else 0)
+#----------Main-END-----------------------------------------
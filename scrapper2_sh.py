@@ -2,9 +2,11 @@
 import scrapper2
 
 import argparse
+import itertools
 import time
 import urllib.parse
 import os
+import sys
 #----------Import-Modules-END-------------------------------
 
 
@@ -55,21 +57,24 @@ def jobs(s):
         raise argparse.ArgumentTypeError("Jobs must be tuples of (URL, task)")
 
 def get_jobs_from_ini(filename):
+    '''
+    Lazily read the (URL, task, 0) jobs of filename, one "URL,task" per
+    line, "-" being stdin. The Scrapper validates them as they are read.
+    '''
     try:
-        hfile = open(filename, "r")
+        hfile = sys.stdin if filename == "-" else open(filename, "r")
     except Exception as e:
         scrapper2.error_out(str(e) + " while opening " + filename)
 
-    jobs = []
-    for line in hfile:
-        line = line.strip()
-        if line != '':
-            val = line.split(',')
-            if len(val) != 2:
-                scrapper2.error_out("ini file is ill formed .Jobs must be tuples of (URL, task)")
-            jobs.append(val)
+    def read_jobs():
+        with hfile:
+            for line in hfile:
+                line = line.strip()
+                if line != '':
+                    url, _, task = line.partition(',')
+                    yield (url.strip(), task.strip(), 0)
 
-    return jobs
+    return read_jobs()
 #----------Utilities-END------------------------------------
 
 
@@ -83,9 +88,53 @@ if __name__ == "__main__":
     parser.add_argument("-l", "--no_log", action="store_true", required=False, help="Disable logging")
     parser.add_argument("-c", "--no_colour", action="store_true", required=False, help="Disable colour console printing")
     parser.add_argument("-a", "--tenacious", action="store_true", required=False, help="Enable tenacious/aggressive behaviour")
-    parser.add_argument("-n", "--num_threads", action="store", metavar="<num>", nargs=1, default=1, type=int, required=False, help="Number of threads to spawn")
-    parser.add_argument("-t", "--traversal", action="store", metavar="<method>", nargs=1, default="DFS", choices=["DFS", "BFS"], type=str, required=False, help="Traversal method")
+    parser.add_argument("-n", "--num_threads", action="store", metavar="<num>", nargs=1, default=1, type=int, required=False, help="Number of threads to spawn, or concurrent workers with the async engine")
+    parser.add_argument("--min_threads", action="store", metavar="<num>", nargs=1, default=None, type=int, required=False, help="Adapt the number of active workers between <num> and --num_threads to the measured throughput, latency and error rate")
+    parser.add_argument("--adapt_interval", action="store", metavar="<seconds>", nargs=1, default=2, type=float, required=False, help="Seconds between adjustments of the number of active workers")
+    parser.add_argument("-t", "--traversal", action="store", metavar="<method>", nargs=1, default="DFS", choices=["DFS", "BFS", "PRIORITY"], type=str, required=False, help="Traversal method")
+    parser.add_argument("-e", "--engine", action="store", metavar="<engine>", nargs=1, default="thread", choices=["thread", "async"], type=str, required=False, help="Fetch engine, one OS thread per worker or one asyncio event loop")
 
+    parser.add_argument("-p", "--parse_processes", action="store", metavar="<num>", nargs=1, default=0, type=int, required=False, help="Number of processes to parse pages in, 0 parses on the fetching threads")
+    parser.add_argument("--link_extractor", action="store", metavar="<backend>", nargs=1, default="bytes", choices=["stream", "bs4", "bytes"], type=str, required=False, help="Link extractor backend of the standard visit function")
+    parser.add_argument("--encoding", action="store", metavar="<name>", nargs=1, default="utf-8", type=str, required=False, help="Encoding of the pages whose headers and <meta> tags declare none")
+    parser.add_argument("--scope", action="store", metavar="<file>", nargs=1, default=None, type=str, required=False, help="Only follow the links allowed by the scope rules in <file>, one allow/deny/strip rule per line")
+    parser.add_argument("--bloom", action="store", metavar="<rate>", nargs=1, default=None, type=float, required=False, help="Track visited links in a Bloom filter with the given false positive rate")
+    parser.add_argument("--bloom_capacity", action="store", metavar="<num>", nargs=1, default=10000000, type=int, required=False, help="Number of links the Bloom filter is sized for")
+    parser.add_argument("--bloom_memory", action="store", metavar="<MB>", nargs=1, default=None, type=int, required=False, help="Upper bound on the size of the Bloom filter")
+    parser.add_argument("-f", "--frontier", action="store", metavar="<dir>", nargs=1, default=None, type=str, required=False, help="Keep the pending jobs and visited links on disk in <dir> so that the crawl can be resumed")
+    parser.add_argument("--resume", action="store", metavar="<dir>", nargs=1, default=None, type=str, required=False, help="Resume the crawl saved in <dir>")
+    parser.add_argument("--host_concurrency", action="store", metavar="<num>", nargs=1, default=None, type=int, required=False, help="Maximum number of concurrent requests per host")
+    parser.add_argument("--host_rate", action="store", metavar="<req/s>", nargs=1, default=None, type=float, required=False, help="Maximum number of requests per second per host")
+    parser.add_argument("--max_depth", action="store", metavar="<num>", nargs=1, default=None, type=int, required=False, help="Do not follow links deeper than <num> from the root jobs")
+    parser.add_argument("--max_pages_per_host", action="store", metavar="<num>", nargs=1, default=None, type=int, required=False, help="Maximum number of jobs per host")
+    parser.add_argument("--http_cache", action="store", metavar="<dir>", nargs=1, default=None, type=str, required=False, help="Keep HTTP validators and pages in <dir> and only refetch pages that changed")
+    parser.add_argument("--dedup", action="store", nargs=1, default=None, type=str, required=False, choices=["hard", "symlink"], help="Keep one copy of identical downloads and hard link or symlink their paths to it")
+    parser.add_argument("--metrics", action="store", metavar="<file>", nargs=1, default=None, type=str, required=False, help="Periodically write crawl metrics to <file>")
+    parser.add_argument("--metrics_format", action="store", nargs=1, default="jsonl", type=str, required=False, choices=["jsonl", "prometheus"], help="Append JSON lines or rewrite a Prometheus textfile")
+    parser.add_argument("--metrics_interval", action="store", metavar="<seconds>", nargs=1, default=10, type=float, required=False, help="Seconds between metrics reports")
+    parser.add_argument("--progress", action="store_true", required=False, help="Print a one line progress summary with every metrics report")
+    parser.add_argument("--log_level", action="store", nargs=1, default="info", type=str, required=False, choices=["info", "success", "failure", "warning", "error"], help="Discard messages less severe than this level")
+    parser.add_argument("--log_format", action="store", nargs=1, default="text", type=str, required=False, choices=["text", "jsonl"], help="Write the log file as text or as JSON lines")
+    parser.add_argument("--log_queue", action="store", metavar="<num>", nargs=1, default=10000, type=int, required=False, help="Maximum number of messages waiting to be written")
+    parser.add_argument("--log_overflow", action="store", nargs=1, default="block", type=str, required=False, choices=["block", "drop"], help="Wait for the writer or drop messages when the log queue is full")
+    parser.add_argument("--coordinator", action="store", metavar="<host:port>", nargs=1, default=None, type=str, required=False, help="Coordinate a distributed crawl of the root jobs from <host:port>")
+    parser.add_argument("--shards", action="store", metavar="<num>", nargs=1, default=1, type=int, required=False, help="Number of workers the coordinator splits the hosts between")
+    parser.add_argument("--worker", action="store", metavar="<host:port>", nargs=1, default=None, type=str, required=False, help="Crawl the hosts of one shard for the coordinator at <host:port>")
+    parser.add_argument("--jobs_file", action="store", metavar="<file>", nargs=1, default=None, type=str, required=False, help='Stream more jobs from <file>, one "URL,task" per line, "-" reads stdin')
+    parser.add_argument("--seed_buffer", action="store", metavar="<num>", nargs=1, default=10000, type=int, required=False, help="Read more streamed jobs only while fewer than <num> jobs are pending")
+    parser.add_argument("--chunk_size", action="store", metavar="<bytes>", nargs=1, default=256 * 1024, type=int, required=False, help="Size of the chunks streamed to disk by downloads")
+
+    parser.add_argument("--memory_budget", action="store", metavar="<MB>", nargs=1, default=None, type=int, required=False, help="Upper bound on the response bodies held in memory by all workers")
+    parser.add_argument("--max_page_size", action="store", metavar="<MB>", nargs=1, default=None, type=int, required=False, help="Skip pages larger than <MB>")
+    parser.add_argument("--max_download_size", action="store", metavar="<MB>", nargs=1, default=None, type=int, required=False, help="Skip downloads larger than <MB>")
+    parser.add_argument("--spill_size", action="store", metavar="<MB>", nargs=1, default=8, type=int, required=False, help="Keep pages larger than <MB> in temporary files instead of memory")
+    parser.add_argument("--segments", action="store", metavar="<num>", nargs=1, default=1, type=int, required=False, help="Fetch large downloads as <num> parallel byte ranges, thread engine only")
+    parser.add_argument("--segment_threshold", action="store", metavar="<MB>", nargs=1, default=16, type=int, required=False, help="Size from which downloads are split into ranges")
+    parser.add_argument("--retry_backoff", action="store", metavar="<seconds>", nargs=1, default=1, type=float, required=False, help="Delay before the first retry of a failed job, doubled on every retry")
+    parser.add_argument("--retry_max_delay", action="store", metavar="<seconds>", nargs=1, default=60, type=float, required=False, help="Longest delay before a retry, and longest pause of a failing host")
+    parser.add_argument("--max_retries", action="store", metavar="<num>", nargs=1, default=None, type=int, required=False, help="Skip a job after <num> retries")
+    parser.add_argument("--breaker_threshold", action="store", metavar="<num>", nargs=1, default=5, type=int, required=False, help="Pause a host after <num> failures in a row, 0 never pauses hosts")
+    parser.add_argument("--breaker_cooldown", action="store", metavar="<seconds>", nargs=1, default=10, type=float, required=False, help="First pause of a failing host, doubled every time it fails again")
     parser.add_argument("--test", action="store_true", required=False, help="Run doctests")
 
     args = parser.parse_args()
@@ -97,26 +146,101 @@ if __name__ == "__main__":
             scrapper2.post_success("All tests passed")
     else:
         has_ini_file = os.path.isfile("scrapper2_jobs.ini")
+        a_jobs_file = args.jobs_file[0] if isinstance(args.jobs_file, list) else args.jobs_file
 
-        if len(args.root_jobs) < 1 and not has_ini_file:
+        if len(args.root_jobs) < 1 and not has_ini_file and a_jobs_file is None and args.resume is None and args.worker is None:
             scrapper2.error_out("No jobs specified. Please specify at least one job")
 
-        ini_jobs = get_jobs_from_ini("scrapper2_jobs.ini")
+        job_files = (["scrapper2_jobs.ini"] if has_ini_file else []) + ([a_jobs_file] if a_jobs_file is not None else [])
 
         scrapper2.post_info("Root jobs:")
         for url, task in args.root_jobs:
             scrapper2.post_info("    " + url + " - " + task)
 
-        for url, task in ini_jobs:
-            scrapper2.post_info("    " + url + " - " + task)
+        for filename in job_files:
+            scrapper2.post_info("    streamed from " + ("stdin" if filename == "-" else filename))
 
         a_threads = args.num_threads[0] if isinstance(args.num_threads, list) else args.num_threads
+        a_min_threads = args.min_threads[0] if isinstance(args.min_threads, list) else args.min_threads
+        a_adapt_interval = args.adapt_interval[0] if isinstance(args.adapt_interval, list) else args.adapt_interval
         a_traversal = args.traversal[0] if isinstance(args.traversal, list) else args.traversal
+        a_engine = args.engine[0] if isinstance(args.engine, list) else args.engine
+        a_seed_buffer = args.seed_buffer[0] if isinstance(args.seed_buffer, list) else args.seed_buffer
+        a_chunk_size = args.chunk_size[0] if isinstance(args.chunk_size, list) else args.chunk_size
+        a_memory_budget = args.memory_budget[0] if isinstance(args.memory_budget, list) else args.memory_budget
+        a_max_page_size = args.max_page_size[0] if isinstance(args.max_page_size, list) else args.max_page_size
+        a_max_download_size = args.max_download_size[0] if isinstance(args.max_download_size, list) else args.max_download_size
+        a_spill_size = args.spill_size[0] if isinstance(args.spill_size, list) else args.spill_size
+        a_segments = args.segments[0] if isinstance(args.segments, list) else args.segments
+        a_segment_threshold = args.segment_threshold[0] if isinstance(args.segment_threshold, list) else args.segment_threshold
+        a_retry_backoff = args.retry_backoff[0] if isinstance(args.retry_backoff, list) else args.retry_backoff
+        a_retry_max_delay = args.retry_max_delay[0] if isinstance(args.retry_max_delay, list) else args.retry_max_delay
+        a_max_retries = args.max_retries[0] if isinstance(args.max_retries, list) else args.max_retries
+        a_breaker_threshold = args.breaker_threshold[0] if isinstance(args.breaker_threshold, list) else args.breaker_threshold
+        a_breaker_cooldown = args.breaker_cooldown[0] if isinstance(args.breaker_cooldown, list) else args.breaker_cooldown
+        a_parse_processes = args.parse_processes[0] if isinstance(args.parse_processes, list) else args.parse_processes
+        a_link_extractor = args.link_extractor[0] if isinstance(args.link_extractor, list) else args.link_extractor
+        a_encoding = args.encoding[0] if isinstance(args.encoding, list) else args.encoding
+        a_scope = args.scope[0] if isinstance(args.scope, list) else args.scope
+        a_bloom = args.bloom[0] if isinstance(args.bloom, list) else args.bloom
+        a_bloom_capacity = args.bloom_capacity[0] if isinstance(args.bloom_capacity, list) else args.bloom_capacity
+        a_bloom_memory = args.bloom_memory[0] if isinstance(args.bloom_memory, list) else args.bloom_memory
+        a_frontier = args.frontier[0] if isinstance(args.frontier, list) else args.frontier
+        a_resume = args.resume[0] if isinstance(args.resume, list) else args.resume
+        if a_resume is not None:
+            a_frontier = a_resume
+        a_host_concurrency = args.host_concurrency[0] if isinstance(args.host_concurrency, list) else args.host_concurrency
+        a_host_rate = args.host_rate[0] if isinstance(args.host_rate, list) else args.host_rate
+        a_max_depth = args.max_depth[0] if isinstance(args.max_depth, list) else args.max_depth
+        a_max_pages_per_host = args.max_pages_per_host[0] if isinstance(args.max_pages_per_host, list) else args.max_pages_per_host
+        a_http_cache = args.http_cache[0] if isinstance(args.http_cache, list) else args.http_cache
+        a_dedup = args.dedup[0] if isinstance(args.dedup, list) else args.dedup
+        a_metrics = args.metrics[0] if isinstance(args.metrics, list) else args.metrics
+        a_metrics_format = args.metrics_format[0] if isinstance(args.metrics_format, list) else args.metrics_format
+        a_metrics_interval = args.metrics_interval[0] if isinstance(args.metrics_interval, list) else args.metrics_interval
+        a_log_level = args.log_level[0] if isinstance(args.log_level, list) else args.log_level
+        a_log_format = args.log_format[0] if isinstance(args.log_format, list) else args.log_format
+        a_log_queue = args.log_queue[0] if isinstance(args.log_queue, list) else args.log_queue
+        a_log_overflow = args.log_overflow[0] if isinstance(args.log_overflow, list) else args.log_overflow
+        a_coordinator = args.coordinator[0] if isinstance(args.coordinator, list) else args.coordinator
+        a_shards = args.shards[0] if isinstance(args.shards, list) else args.shards
+        a_worker = args.worker[0] if isinstance(args.worker, list) else args.worker
 
-        scrapper2.post_info("Number of worker threads: " + str(a_threads))
+        scrapper2.post_info("Number of worker threads: " + str(a_threads) +
+                            ("" if a_min_threads is None else " (adaptive from " + str(a_min_threads) + ", every " + str(a_adapt_interval) + " seconds)"))
         scrapper2.post_info("Traversal method: " + a_traversal)
+        scrapper2.post_info("Engine: " + a_engine)
+        scrapper2.post_info("Parse processes: " + str(a_parse_processes))
+        scrapper2.post_info("Link extractor: " + a_link_extractor)
+        scrapper2.post_info("Default page encoding: " + a_encoding)
+        scrapper2.post_info("Download chunk size: " + str(a_chunk_size))
+        scrapper2.post_info("Memory budget: " + ("unlimited" if a_memory_budget is None else str(a_memory_budget) + " MB") +
+                            ", maximum page size: " + ("unlimited" if a_max_page_size is None else str(a_max_page_size) + " MB") +
+                            ", maximum download size: " + ("unlimited" if a_max_download_size is None else str(a_max_download_size) + " MB") +
+                            ", spilling pages from " + str(a_spill_size) + " MB")
+        if a_engine == "async":
+            scrapper2.post_info("Download segments: none with the async engine, which cannot resume partial files")
+        else:
+            scrapper2.post_info("Download segments: " + str(a_segments) + " from " + str(a_segment_threshold) + " MB, resuming partial files")
+        scrapper2.post_info("Retries: after " + str(a_retry_backoff) + " to " + str(a_retry_max_delay) + " seconds, " +
+                            ("unlimited" if a_max_retries is None else "at most " + str(a_max_retries)) +
+                            ", pausing hosts " + ("never" if a_breaker_threshold == 0 else "after " + str(a_breaker_threshold) + " failures for " + str(a_breaker_cooldown) + " seconds"))
+        scrapper2.post_info("Streamed jobs buffer: " + str(a_seed_buffer))
+        scrapper2.post_info("Scope rules: " + ("none" if a_scope is None else a_scope))
+        scrapper2.post_info("Frontier: " + ("memory" if a_frontier is None else a_frontier) + (" (resuming)" if a_resume is not None else ""))
+        scrapper2.post_info("Requests per host: " + ("unlimited" if a_host_concurrency is None else str(a_host_concurrency)) + " concurrent, " +
+                            ("unlimited" if a_host_rate is None else str(a_host_rate)) + " per second")
+        scrapper2.post_info("Maximum depth: " + ("unlimited" if a_max_depth is None else str(a_max_depth)))
+        scrapper2.post_info("Maximum jobs per host: " + ("unlimited" if a_max_pages_per_host is None else str(a_max_pages_per_host)))
+        scrapper2.post_info("HTTP cache: " + ("none" if a_http_cache is None else a_http_cache))
+        scrapper2.post_info("Deduplicated downloads: " + ("no" if a_dedup is None else a_dedup + " links"))
+        scrapper2.post_info("Metrics: " + ("none" if a_metrics is None else a_metrics + " (" + a_metrics_format + ")") +
+                            ", every " + str(a_metrics_interval) + " seconds" + (" with progress" if args.progress else ""))
+        scrapper2.post_info("Distributed: " + ("coordinator at " + a_coordinator + " for " + str(a_shards) + " workers" if a_coordinator is not None else
+                                                ("worker of " + a_worker if a_worker is not None else "no")))
         scrapper2.post_info("Silent: " + str(args.silent))
-        scrapper2.post_info("logging: " + str(not args.no_log))
+        scrapper2.post_info("logging: " + str(not args.no_log) + " (" + a_log_format + ", level " + a_log_level + ", " +
+                            str(a_log_queue) + " queued messages, " + a_log_overflow + " when full)")
         scrapper2.post_info("colour: " + str(not args.no_colour))
         scrapper2.post_info("Tenacious: " + str(args.tenacious) + "\n")
 
@@ -124,18 +248,75 @@ if __name__ == "__main__":
         for url, task in args.root_jobs:
             root_jobs.append((url, task, 0))
 
-        for url, task in ini_jobs:
-            root_jobs.append((url, task, 0))
+        if len(job_files) > 0:
+            # Read while crawling, see Scrapper.add_job_source
+            root_jobs = itertools.chain(root_jobs, *(get_jobs_from_ini(filename) for filename in job_files))
+
+        if a_coordinator is not None:
+            try:
+                coordinator = scrapper2.Coordinator(list(root_jobs), a_shards, scrapper2.parse_address(a_coordinator))
+            except (ValueError, OSError) as e:
+                scrapper2.error_out(str(e))
+            start_time = time.perf_counter()
+            complete = coordinator.serve()
+            scrapper2.post_info("Time elapsed : " + str(time.perf_counter() - start_time) + " seconds")
+            sys.exit(0 if complete else 1)
+
+        scrapper2.templates.set_std_chunk_size(a_chunk_size)
+        try:
+            scrapper2.templates.set_std_segments(a_segments, a_segment_threshold * 1024 * 1024)
+        except ValueError as e:
+            scrapper2.error_out(str(e))
+        scrapper2.templates.set_std_link_extractor(a_link_extractor)
+        try:
+            scrapper2.templates.set_std_default_encoding(a_encoding)
+        except LookupError as e:
+            scrapper2.error_out(str(e))
+        if a_scope is not None:
+            try:
+                scrapper2.templates.set_std_scope(scrapper2.load_scope_rules(a_scope))
+            except (ValueError, OSError) as e:
+                scrapper2.error_out(str(e) + " in scope rules " + a_scope)
+        if a_bloom is not None:
+            try:
+                store = scrapper2.BloomVisitedStore(capacity=a_bloom_capacity, error_rate=a_bloom,
+                                                    max_bytes=None if a_bloom_memory is None else a_bloom_memory * 1024 * 1024)
+            except ValueError as e:
+                scrapper2.error_out(str(e))
+            scrapper2.templates.set_visited_store(store)
+            scrapper2.post_info("Visited links Bloom filter: " + str(store.nbytes()) + " bytes, " + str(store.num_hashes()) + " hashes")
+
+        content_store = None
+        if a_dedup is not None:
+            content_store = scrapper2.ContentStore("scrapper2_download", link=a_dedup)
+            scrapper2.templates.set_std_content_store(content_store)
+
+        router = None
+        if a_worker is not None:
+            try:
+                router = scrapper2.ShardRouter(scrapper2.parse_address(a_worker))
+            except (ValueError, OSError) as e:
+                scrapper2.error_out(str(e) + " while joining coordinator " + a_worker)
+            scrapper2.post_info("Crawling shard " + str(router.shard) + " of " + str(router.num_shards))
+            root_jobs = []
 
         scrapper2.post_info("Creating Scrapper...")
-        scrapper = scrapper2.Scrapper(root_jobs, traversal=a_traversal, num_threads=a_threads, silent=args.silent, log=(not args.no_log), colour=(not args.no_colour), tenacious=args.tenacious)
+        try:
+            scrapper = scrapper2.Scrapper(root_jobs, traversal=a_traversal, num_threads=a_threads, silent=args.silent, log=(not args.no_log), colour=(not args.no_colour), tenacious=args.tenacious, engine=a_engine, parse_processes=a_parse_processes, frontier_dir=a_frontier, resume=(a_resume is not None), host_concurrency=a_host_concurrency, host_rate=a_host_rate, max_depth=a_max_depth, max_pages_per_host=a_max_pages_per_host, http_cache_dir=a_http_cache, metrics_file=a_metrics, metrics_format=a_metrics_format, metrics_interval=a_metrics_interval, progress=args.progress, log_level=a_log_level, log_format=a_log_format, log_queue_size=a_log_queue, log_overflow=a_log_overflow, router=router, min_threads=a_min_threads, adapt_interval=a_adapt_interval, seed_buffer=a_seed_buffer, memory_budget=None if a_memory_budget is None else a_memory_budget * 1024 * 1024, max_page_size=None if a_max_page_size is None else a_max_page_size * 1024 * 1024, max_download_size=None if a_max_download_size is None else a_max_download_size * 1024 * 1024, spill_size=a_spill_size * 1024 * 1024, retry_backoff=a_retry_backoff, retry_max_delay=a_retry_max_delay, max_retries=a_max_retries, breaker_threshold=a_breaker_threshold if a_breaker_threshold > 0 else None, breaker_cooldown=a_breaker_cooldown)
+        except scrapper2.ScrapperException as e:
+            scrapper2.error_out(str(e))
 
         scrapper2.post_info("Starting Scrapper...")
-        start_time = time.clock()
+        start_time = time.perf_counter()
 
         scrapper.start()
+        scrapper.wait()
+        if content_store is not None:
+            content_store.close()
+        if router is not None:
+            router.close()
 
         scrapper2.post_info("Scrapper exiting...")
-        elapsed_time = time.clock() - start_time
+        elapsed_time = time.perf_counter() - start_time
         scrapper2.post_info("Time elapsed : " + str(elapsed_time) + " seconds")
 #----------Main-END-----------------------------------------
\ No newline at end of file